@@ -0,0 +1,83 @@
+import json
+import logging
+from typing import Optional, Tuple
+from ..services import llm_cache, llm_gateway, metrics
+from .retrieval_agent import _build_filter_prompt, FILTER_MODEL
+from .sql_agent import _build_sql_prompt, _clean_sql
+
+logger = logging.getLogger(__name__)
+
+COMBINED_MODEL = FILTER_MODEL
+
+def _build_combined_prompt(user_query: str) -> str:
+    """
+    (Internal Helper) One prompt asking for both the ChromaDB filter and the
+    SQL query. The SQL part gets no vector-search context, since the search
+    has not run yet.
+    """
+    return f"""
+    You will complete two tasks for the same user query and return both results in one JSON object.
+
+    ===== TASK 1: ChromaDB filter =====
+    {_build_filter_prompt(user_query)}
+
+    ===== TASK 2: PostgreSQL query =====
+    {_build_sql_prompt(user_query, [])}
+
+    ===== OUTPUT FORMAT =====
+    Ignore the output instructions of the individual tasks. Return ONLY a JSON object of the form
+    {{"filter": <the ChromaDB 'where' filter from task 1>, "sql": "<the SQL query from task 2>"}}
+    with no other text, explanations or markdown.
+    """
+
+COMBINED_PROMPT_VERSION = llm_cache.prompt_version(COMBINED_MODEL, _build_combined_prompt("{user_query}"))
+llm_cache.register_prompt("filter_and_sql", COMBINED_PROMPT_VERSION)
+
+def _parse_combined_response(response_text: str) -> Tuple[dict, str]:
+    """
+    (Internal Helper) Turns the raw LLM response into (filter, sql).
+    """
+    text = response_text.strip().replace("```json", "").replace("```", "").strip()
+    parsed = json.loads(text)
+    where_filter = parsed.get("filter") or {}
+    sql_query = _clean_sql(str(parsed.get("sql") or ""))
+    if not isinstance(where_filter, dict) or not sql_query:
+        raise ValueError(f"Incomplete combined response: {text[:200]}")
+    return where_filter, sql_query
+
+async def agenerate_filter_and_sql(user_query: str) -> Optional[Tuple[dict, str]]:
+    """
+    Generates the ChromaDB 'where' filter and the SQL query in a single LLM
+    call, saving one round trip compared to the filter and SQL agents.
+
+    Args:
+        user_query (str): The user's natural language query.
+
+    Returns:
+        Optional[tuple]: (filter, sql), or None if the call failed, in which
+        case the caller should use the separate agents.
+    """
+    cached = await llm_cache.alookup("filter_and_sql", COMBINED_PROMPT_VERSION, user_query)
+    if cached is not None:
+        where_filter, sql_query = _parse_combined_response(cached)
+        logger.debug("Using cached filter and SQL: %s / %s", where_filter, sql_query)
+        return where_filter, sql_query
+    prompt = _build_combined_prompt(user_query)
+
+    logger.debug("Generating filter and SQL in one call...")
+    try:
+        with metrics.span("combined_llm") as span:
+            response_text = await llm_gateway.agenerate(COMBINED_MODEL, prompt)
+            span.set(prompt_chars=len(prompt), response_chars=len(response_text))
+        where_filter, sql_query = _parse_combined_response(response_text)
+    except Exception as e:
+        logger.warning("Failed to generate filter and SQL: %s", e)
+        return None
+
+    logger.debug("Successfully generated filter: %s", where_filter)
+    logger.debug("Successfully generated SQL: %s", sql_query)
+    await llm_cache.astore(
+        "filter_and_sql", COMBINED_PROMPT_VERSION, user_query,
+        json.dumps({"filter": where_filter, "sql": sql_query})
+    )
+    return where_filter, sql_query
@@ -0,0 +1,163 @@
+import os
+import re
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional
+from ..services.argo_service import compute_grid_id
+from ..services.result_digest import estimate_tokens
+
+load_dotenv()
+
+# Approximate token budget for the retrieved context in the SQL prompt.
+SQL_CONTEXT_TOKEN_BUDGET = int(os.getenv("SQL_CONTEXT_TOKEN_BUDGET", 600))
+MAX_LISTED_VALUES = 12  # longer value lists are cut to this many plus "(+N more)"
+
+# Dates as written in document text: ISO (2D data) or M/D/YYYY (3D data, whose
+# TIME column is not ISO and so never made it into year/month/day metadata).
+_DATE_PATTERN = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b|\b(\d{1,2})/(\d{1,2})/(\d{4})\b")
+
+# Ingested CSV -> the table holding the same data.
+SOURCE_TABLES = {
+    'gridded_2d_final.csv': 'average_ocean_profiles',
+    'gridded_3d_final.csv': 'argo_depth_ocean_profiles',
+}
+
+
+def _number(value) -> Optional[float]:
+    """(Internal Helper) The value as a float, or None when missing or NaN."""
+    if value is None:
+        return None
+    value = float(value)
+    return None if value != value else value
+
+
+def _fmt(value: Optional[float]) -> str:
+    value = _number(value)
+    return "" if value is None else f"{value:g}"
+
+
+def _parse_date(text: str) -> Optional[str]:
+    """(Internal Helper) The first ISO or M/D/YYYY date in `text`, as YYYY-MM-DD."""
+    match = _DATE_PATTERN.search(text)
+    if match is None:
+        return None
+    if match.group(1):
+        year, month, day = match.group(1, 2, 3)
+    else:
+        month, day, year = match.group(4, 5, 6)
+    return f"{int(year):04d}-{int(month):02d}-{int(day):02d}"
+
+
+def _date_of(meta: Dict[str, Any], document: str = "") -> Optional[str]:
+    """
+    (Internal Helper) A document's date from its year/month/day metadata,
+    else from a time field, else from the date in the document text.
+    """
+    if all(key in meta for key in ('year', 'month', 'day')):
+        return f"{int(meta['year']):04d}-{int(meta['month']):02d}-{int(meta['day']):02d}"
+    for key in ('time', 'TIME', 'time_period'):
+        if meta.get(key):
+            return _parse_date(str(meta[key]))
+    return _parse_date(document or "")
+
+
+def _depths_of(meta: Dict[str, Any]) -> List[int]:
+    """(Internal Helper) Depths covered by a per-depth document or a compacted profile document."""
+    if 'depth' in meta:
+        return [int(meta['depth'])]
+    return sorted(
+        int(key[len('temperature_'):-1]) for key in meta
+        if key.startswith('temperature_') and key.endswith('m') and key[len('temperature_'):-1].isdigit()
+    )
+
+
+def _listing(values: list) -> str:
+    shown = ", ".join(str(v) for v in values[:MAX_LISTED_VALUES])
+    if len(values) > MAX_LISTED_VALUES:
+        shown += f" (+{len(values) - MAX_LISTED_VALUES} more)"
+    return f"({len(values)}) {shown}"
+
+
+def _range(values: list, unit: str = "") -> str:
+    return f"{_fmt(min(values))} .. {_fmt(max(values))}{unit}" if values else "n/a"
+
+
+def encode_context(retrieved_docs: list, token_budget: int = None) -> str:
+    """
+    Compact, deduplicated summary of the retrieved documents for the SQL prompt.
+
+    Instead of the raw documents it lists the distinct grid_ids, the
+    latitude/longitude extent, date range, depth set, float ids and source
+    tables, followed by one table row per distinct record for as many
+    records as fit in `token_budget`.
+
+    Args:
+        retrieved_docs (list): Documents from the retrieval agent.
+        token_budget (int): Approximate token limit for the returned text.
+
+    Returns:
+        str: The encoded context.
+    """
+    token_budget = SQL_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    if not retrieved_docs:
+        return "No matching records."
+
+    grid_ids, dates, depths, float_ids, tables = [], [], set(), [], []
+    lats, lons, temps, sals = [], [], [], []
+    records = []
+    for doc in retrieved_docs:
+        meta = doc.get('metadata') or {}
+        lat, lon = meta.get('latitude'), meta.get('longitude')
+        grid_id = meta.get('grid_id') or (compute_grid_id(lat, lon) if lat is not None and lon is not None else "")
+        doc_date = _date_of(meta, doc.get('document') or "")
+        doc_depths = _depths_of(meta)
+        table = SOURCE_TABLES.get(meta.get('source_file'), meta.get('source_file'))
+
+        if grid_id and grid_id not in grid_ids:
+            grid_ids.append(grid_id)
+        if doc_date:
+            dates.append(doc_date)
+        depths.update(doc_depths)
+        for float_id in str(meta.get('float_ids') or "").split(","):
+            float_id = float_id.strip()
+            if float_id and float_id != "0" and float_id not in float_ids:
+                float_ids.append(float_id)
+        if table and table not in tables:
+            tables.append(table)
+        for values, value in ((lats, lat), (lons, lon), (temps, meta.get('temperature')), (sals, meta.get('salinity'))):
+            if _number(value) is not None:
+                values.append(_number(value))
+
+        depth_cell = (
+            str(doc_depths[0]) if len(doc_depths) == 1
+            else f"{doc_depths[0]}-{doc_depths[-1]}" if doc_depths else ""
+        )
+        record = "|".join([
+            doc_date or "", grid_id, depth_cell, _fmt(meta.get('temperature')), _fmt(meta.get('salinity')),
+        ])
+        if record not in records:
+            records.append(record)
+
+    unique_dates = sorted(set(dates))
+    lines = [
+        f"{len(retrieved_docs)} retrieved records ({len(records)} distinct).",
+        f"source tables: {', '.join(tables) or 'n/a'}",
+        f"grid_ids: {_listing(grid_ids)}",
+        f"latitude: {_range(lats)}; longitude: {_range(lons)}",
+        f"dates: {unique_dates[0]} .. {unique_dates[-1]} ({len(unique_dates)} distinct)" if unique_dates else "dates: n/a",
+        f"depths (m): {', '.join(str(d) for d in sorted(depths)) or 'n/a'}",
+        f"float_ids: {_listing(float_ids)}" if float_ids else "float_ids: n/a",
+        f"temperature (°C): {_range(temps)}; salinity (PSU): {_range(sals)}",
+        "records (date|grid_id|depth_m|temperature|salinity):",
+    ]
+    used = estimate_tokens("\n".join(lines))
+    shown = 0
+    for record in records:
+        cost = estimate_tokens(record)
+        if used + cost > token_budget:
+            break
+        lines.append(record)
+        used += cost
+        shown += 1
+    if shown < len(records):
+        lines.append(f"(+{len(records) - shown} more records omitted)")
+    return "\n".join(lines)
@@ -0,0 +1,261 @@
+import os
+import re
+import logging
+import threading
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional, Tuple
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Set FILTER_FAST_PATH=0 to send every query to the LLM filter generator.
+FILTER_FAST_PATH = os.getenv("FILTER_FAST_PATH", "1") != "0"
+
+# Same boxes as the "Geographical Knowledge Base" in the LLM filter prompt:
+# name -> (lat_min, lat_max, lon_min, lon_max); None leaves longitude open.
+REGIONS = {
+    'equator': (-10, 10, None, None),
+    'arabian sea': (8, 25, 50, 75),
+    'bay of bengal': (5, 22, 80, 95),
+    'indian ocean': (-20, 30, 30, 120),
+}
+
+MONTHS = {
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
+    'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12,
+}
+MONTH_ABBREVIATIONS = {name[:3]: number for name, number in MONTHS.items()}
+MONTH_ABBREVIATIONS['sept'] = 9
+
+FIELDS = {
+    'temperature': 'temperature', 'temperatures': 'temperature', 'temp': 'temperature',
+    'temps': 'temperature', 'sst': 'temperature',
+    'salinity': 'salinity', 'salinities': 'salinity',
+    'depth': 'depth', 'depths': 'depth',
+}
+COMPARATIVES = {
+    'warmer': ('temperature', '$gt'), 'hotter': ('temperature', '$gt'),
+    'colder': ('temperature', '$lt'), 'cooler': ('temperature', '$lt'),
+    'saltier': ('salinity', '$gt'), 'fresher': ('salinity', '$lt'),
+    'deeper': ('depth', '$gt'), 'shallower': ('depth', '$lt'),
+}
+OPERATORS = {
+    '>=': '$gte', 'at least': '$gte', 'no less than': '$gte', 'not less than': '$gte',
+    '<=': '$lte', 'at most': '$lte', 'no more than': '$lte', 'not more than': '$lte', 'up to': '$lte',
+    '>': '$gt', 'above': '$gt', 'over': '$gt', 'more than': '$gt', 'greater than': '$gt',
+    'higher than': '$gt', 'exceeding': '$gt',
+    '<': '$lt', 'below': '$lt', 'under': '$lt', 'less than': '$lt', 'lower than': '$lt',
+}
+
+_NUMBER = r'(-?\d+(?:\.\d+)?)'
+_UNIT = r'(?:\s*(?:°\s*c\b|°|degrees?(?:\s+(?:c|celsius)\b)?|celsius|psu\b|m\b|meters?\b|metres?\b))?'
+_FIELD = r'\b(' + '|'.join(sorted(FIELDS, key=len, reverse=True)) + r')\b'
+_FILLER = r'(?:\s+(?:is|are|was|were|values?|readings?|levels?|measured|recorded))*'
+_OPERATOR = '(' + '|'.join(re.escape(op) for op in sorted(OPERATORS, key=len, reverse=True)) + ')'
+_MONTH_NAME = r'\b(' + '|'.join(MONTHS) + r')\b'
+_MONTH_ANY = r'\b(' + '|'.join(list(MONTHS) + list(MONTH_ABBREVIATIONS)) + r')\b\.?'
+
+# Words that mean the query carries a filter this parser does not understand.
+UNPARSED_CUES = re.compile(
+    r'\d|\b(?:north|south|east|west|northern|southern|eastern|western|near|off|coast|coastal|'
+    r'island|region|latitude|longitude|lat|lon|'
+    r'between|from|since|before|after|until|till|during|than|last|past|recent|latest|'
+    r'season|summer|winter|spring|autumn|monsoon|week|weeks|month|months|year|years|'
+    r'today|yesterday|deep|shallow|not|except|excluding|without)\b'
+    # A named water body other than the known regions ("Pacific Ocean", "Red Sea").
+    r'|\b(?!(?:the|a|an|of|in|at|for|and|sea)\b)[a-z]+\s+(?:sea|ocean|gulf|bay|strait|basin)\b'
+)
+
+_lock = threading.Lock()
+_stats = {'queries': 0, 'fast_path': 0, 'llm_fallback': 0, 'disabled': 0}
+_fallback_reasons: Dict[str, int] = {}
+
+
+class _Unparseable(Exception):
+    """Raised when the query cannot be turned into a filter with confidence."""
+
+
+class _Conditions:
+    """(Internal Helper) Filter conditions collected while parsing one query."""
+
+    def __init__(self):
+        self.items: List[Dict[str, Any]] = []
+        self.equalities: Dict[str, Any] = {}
+
+    def add(self, field: str, operator: str, value):
+        if field == 'depth':
+            value = int(float(value))
+        elif field in ('temperature', 'salinity'):
+            value = float(value)
+        if operator == '$eq':
+            if field in self.equalities and self.equalities[field] != value:
+                raise _Unparseable('conflict')
+            self.equalities[field] = value
+        self.items.append({field: {operator: value}})
+
+
+def _regions(text: str, conditions: _Conditions) -> str:
+    found = [name for name in REGIONS if re.search(r'\b' + name + r'\b', text)]
+    if len(found) > 1:
+        raise _Unparseable('conflict')
+    for name in found:
+        lat_min, lat_max, lon_min, lon_max = REGIONS[name]
+        conditions.add('latitude', '$gte', float(lat_min))
+        conditions.add('latitude', '$lte', float(lat_max))
+        if lon_min is not None:
+            conditions.add('longitude', '$gte', float(lon_min))
+            conditions.add('longitude', '$lte', float(lon_max))
+        text = re.sub(r'\b(?:(?:near|around|along|across)\s+)?(?:the\s+)?' + name + r'\b', ' ', text)
+    return text
+
+
+def _dates(text: str, conditions: _Conditions) -> str:
+    def month_year(match):
+        name = match.group(1).lower()
+        conditions.add('year', '$eq', int(match.group(2)))
+        conditions.add('month', '$eq', MONTHS.get(name) or MONTH_ABBREVIATIONS[name])
+        return ' '
+
+    def iso_month(match):
+        month = int(match.group(2))
+        if not 1 <= month <= 12:
+            raise _Unparseable('unparsed_terms')
+        conditions.add('year', '$eq', int(match.group(1)))
+        conditions.add('month', '$eq', month)
+        return ' '
+
+    def month_only(match):
+        # "may" on its own is usually the verb, so it only counts next to a year.
+        if match.group(1).lower() == 'may':
+            return match.group(0)
+        conditions.add('month', '$eq', MONTHS[match.group(1).lower()])
+        return ' '
+
+    def year_only(match):
+        conditions.add('year', '$eq', int(match.group(1)))
+        return ' '
+
+    text = re.sub(_MONTH_ANY + r',?\s+(?:of\s+)?((?:19|20)\d{2})\b', month_year, text)
+    text = re.sub(r'\b((?:19|20)\d{2})-(\d{1,2})\b', iso_month, text)
+    text = re.sub(r'\b(?:in\s+)?' + _MONTH_NAME, month_only, text)
+    return re.sub(r'\b(?:in\s+)?((?:19|20)\d{2})\b', year_only, text)
+
+
+def _float_ids(text: str, conditions: _Conditions) -> str:
+    # `float_ids` metadata is a comma-joined string ("2901861, 2902215"), so
+    # $eq / $in on a single id miss every multi-float record; leave these
+    # questions to the LLM.
+    def ids(match):
+        raise _Unparseable('float_ids')
+
+    return re.sub(
+        r'\b(?:argo\s+)?floats?(?:\s+(?:ids?|numbers?|#))?\s*(?:#|:)?\s*'
+        r'(\d{5,8}(?:\s*(?:,|and|&|or)\s*\d{5,8})*)\b',
+        ids, text,
+    )
+
+
+def _measurements(text: str, conditions: _Conditions) -> str:
+    def between(match):
+        field = FIELDS[match.group(1)]
+        low, high = sorted((float(match.group(2)), float(match.group(3))))
+        conditions.add(field, '$gte', low)
+        conditions.add(field, '$lte', high)
+        return ' '
+
+    def compared(match):
+        conditions.add(FIELDS[match.group(1)], OPERATORS[match.group(2)], match.group(3))
+        return ' '
+
+    def comparative(match):
+        field, operator = COMPARATIVES[match.group(1)]
+        conditions.add(field, operator, match.group(2))
+        return ' '
+
+    def at_depth(match):
+        conditions.add('depth', '$eq', match.group(1))
+        return ' '
+
+    text = re.sub(
+        _FIELD + _FILLER + r'\s+(?:between|from)\s+' + _NUMBER + _UNIT + r'\s*(?:and|to|-)\s*' + _NUMBER + _UNIT,
+        between, text,
+    )
+    text = re.sub(_FIELD + _FILLER + r'\s*' + _OPERATOR + r'\s*' + _NUMBER + _UNIT, compared, text)
+    text = re.sub(
+        r'\b(' + '|'.join(COMPARATIVES) + r')\s+than\s+' + _NUMBER + _UNIT, comparative, text,
+    )
+    text = re.sub(
+        r'\b(?:at\s+)?(?:a\s+)?depths?\s+(?:of\s+|=\s*)?(\d+(?:\.\d+)?)\s*(?:m\b|meters?\b|metres?\b)?', at_depth, text,
+    )
+    text = re.sub(r'\bat\s+(\d+(?:\.\d+)?)\s*(?:m|meters?|metres?)\b', at_depth, text)
+    return re.sub(r'\b(\d+(?:\.\d+)?)\s*(?:m|meters?|metres?)\s+depth\b', at_depth, text)
+
+
+def _parse(user_query: str) -> Tuple[Optional[List[Dict[str, Any]]], str]:
+    """(Internal Helper) The conditions in `user_query` and the path taken, or None and why not."""
+    conditions = _Conditions()
+    text = user_query.lower()
+    try:
+        for step in (_regions, _float_ids, _measurements, _dates):
+            text = step(text, conditions)
+    except _Unparseable as e:
+        return None, str(e)
+    if not conditions.items:
+        return None, 'no_match'
+    if UNPARSED_CUES.search(text):
+        return None, 'unparsed_terms'
+    return conditions.items, 'fast_path'
+
+
+def parse_conditions(user_query: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    The single-field conditions (`{field: {operator: value}}`) that make up
+    the filter for `user_query`, or None when it cannot be parsed with
+    confidence. Does not count towards the parser statistics.
+    """
+    return _parse(user_query)[0]
+
+
+def parse_filter(user_query: str) -> Optional[dict]:
+    """
+    Rule-based replacement for the LLM filter generator on common queries.
+
+    Understands the named regions of the filter prompt, month/year
+    expressions and numeric conditions on temperature, salinity and depth.
+    Returns None whenever part of the query looks like a filter it cannot
+    read (including Argo float ids), so the caller can fall back to the LLM.
+
+    Args:
+        user_query (str): The user's natural language query.
+
+    Returns:
+        Optional[dict]: A ChromaDB 'where' filter, or None to use the LLM.
+    """
+    where_filter, path = None, 'disabled'
+    if FILTER_FAST_PATH:
+        items, path = _parse(user_query)
+        if items is not None:
+            where_filter = items[0] if len(items) == 1 else {'$and': items}
+    with _lock:
+        _stats['queries'] += 1
+        if where_filter is not None:
+            _stats['fast_path'] += 1
+        elif path == 'disabled':
+            _stats['disabled'] += 1
+            _stats['llm_fallback'] += 1
+        else:
+            _stats['llm_fallback'] += 1
+            _fallback_reasons[path] = _fallback_reasons.get(path, 0) + 1
+    if where_filter is not None:
+        logger.debug("Parsed filter without the LLM: %s", where_filter)
+    return where_filter
+
+
+def get_parser_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats['fallback_reasons'] = dict(_fallback_reasons)
+    stats['enabled'] = FILTER_FAST_PATH
+    stats['fast_path_rate'] = round(stats['fast_path'] / stats['queries'], 3) if stats['queries'] else 0.0
+    return stats
@@ -1,9 +1,14 @@
 import chromadb
 import os
 import json
+import asyncio
+import logging
 from dotenv import load_dotenv
-from google import genai
-import time
+from typing import Optional
+from ..services import llm_cache, llm_gateway, metrics
+from .filter_parser import parse_filter
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 CHROMA_HOST = os.getenv("CHROMA_HOST", 'localhost')
@@ -12,19 +17,18 @@ COLLECTION_NAME = os.getenv("COLLECTION_NAME", 'argo_profiles')
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # --- Initialize Clients ---
-# LLM Client
+# LLM calls go through the shared gateway in services/llm_gateway.py.
 if not GEMINI_API_KEY:
-    print("Error: GEMINI_API_KEY not found in .env file.")
+    logger.error("GEMINI_API_KEY not found in .env file.")
     exit()
-model = genai.Client(api_key=GEMINI_API_KEY)
 
 # ChromaDB Client
 try:
     client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
     collection = client.get_collection(name=COLLECTION_NAME)
-    print("Successfully connected to ChromaDB and collection.")
+    logger.info("Successfully connected to ChromaDB and collection.")
 except Exception as e:
-    print(f"Error connecting to ChromaDB: {e}")
+    logger.error("Error connecting to ChromaDB: %s", e)
     exit()
 
 # --- Context for the LLM ---
@@ -36,11 +40,13 @@ Metadata fields available for filtering in the vector database:
 - `argo_float_ids` (text): Comma-separated list of Argo float IDs.
 """
 
-def _generate_chroma_filter(user_query: str) -> dict:
+FILTER_MODEL = "gemini-2.5-flash"
+
+def _build_filter_prompt(user_query: str) -> str:
     """
-    (Internal Helper) Uses an LLM to generate a ChromaDB 'where' filter.
+    (Internal Helper) Builds the prompt that asks the LLM for a 'where' filter.
     """
-    prompt = f"""
+    return f"""
     You are an expert at creating database filters for ChromaDB. Your task is to analyze the user's query and generate a valid ChromaDB 'where' filter as a JSON object.
 
     **Metadata Schema:**
@@ -82,47 +88,185 @@ def _generate_chroma_filter(user_query: str) -> dict:
     Based on the query and all the rules, what is the appropriate ChromaDB 'where' filter?
     Return ONLY the JSON object, with no other text or explanations.
     """
-    
 
-    print("\n> Generating filter from query...")
-    retries = 3
-    wait_time = 5  # Start with a 5-second wait
-
-    for i in range(retries):
-        try:
-            generation_config = {
-                "temperature": 0.1,
-                "top_p": 1.0,
-            }
-            # The API call is now inside the loop
-            response = model.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
-            
-            filter_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-            filter_dict = json.loads(filter_text)
-            
-            print(f"> Successfully generated filter: {filter_dict}")
-            # If successful, return the result and exit the function
-            return filter_dict
-
-        except Exception as e:
-            # Check if the error is a temporary, retryable one
-            if "503" in str(e) or "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                print(f"Model is overloaded. Retrying in {wait_time}s... ({i+1}/{retries})")
-                time.sleep(wait_time)
-                wait_time *= 2  # Double the wait time for the next attempt
-                continue # Go to the next iteration of the loop
-            else:
-                # If it's a different, non-retryable error, fail immediately
-                print(f"An unexpected, non-retryable error occurred: {e}")
-                return {} # Fallback to an empty filter
-
-    # This part is reached only if all retries have failed
-    print("> Failed to generate filter after multiple retries.")
-    return {}
-    # --- END: EXPONENTIAL BACKOFF LOGIC ---
+# Cached filters are tied to this exact prompt template and model.
+FILTER_PROMPT_VERSION = llm_cache.prompt_version(FILTER_MODEL, _build_filter_prompt("{user_query}"))
+llm_cache.register_prompt("chroma_filter", FILTER_PROMPT_VERSION)
+
+def _cached_filter(user_query: str):
+    """
+    (Internal Helper) Returns a previously generated filter for this query, or None.
+    """
+    cached = llm_cache.lookup("chroma_filter", FILTER_PROMPT_VERSION, user_query)
+    if cached is None:
+        return None
+    filter_dict = json.loads(cached)
+    logger.debug("Using cached filter: %s", filter_dict)
+    return filter_dict
+
+def _parse_filter_response(response_text: str) -> dict:
+    """
+    (Internal Helper) Turns the raw LLM response into a filter dict.
+    """
+    filter_text = response_text.strip().replace("```json", "").replace("```", "").strip()
+    return json.loads(filter_text)
+
+def _generate_chroma_filter(user_query: str) -> dict:
+    """
+    (Internal Helper) Uses an LLM to generate a ChromaDB 'where' filter.
+    Queries the rule-based parser understands skip the LLM entirely.
+    """
+    parsed = parse_filter(user_query)
+    if parsed is not None:
+        return parsed
+    cached = _cached_filter(user_query)
+    if cached is not None:
+        return cached
+    prompt = _build_filter_prompt(user_query)
+
+    logger.debug("Generating filter from query...")
+    try:
+        # Rate limiting and retries of overload errors happen in the gateway.
+        with metrics.span("filter_llm") as span:
+            response_text = llm_gateway.generate(FILTER_MODEL, prompt)
+            span.set(prompt_chars=len(prompt), response_chars=len(response_text))
+        filter_dict = _parse_filter_response(response_text)
+    except Exception as e:
+        logger.warning("Failed to generate filter: %s", e)
+        return {} # Fallback to an empty filter
+
+    logger.debug("Successfully generated filter: %s", filter_dict)
+    llm_cache.store("chroma_filter", FILTER_PROMPT_VERSION, user_query, json.dumps(filter_dict))
+    return filter_dict
+
+async def _agenerate_chroma_filter(user_query: str) -> dict:
+    """
+    (Internal Helper) Async version of `_generate_chroma_filter`, served at
+    chat priority by the LLM gateway without blocking the event loop.
+    """
+    parsed = parse_filter(user_query)
+    if parsed is not None:
+        return parsed
+    cached = await asyncio.to_thread(_cached_filter, user_query)
+    if cached is not None:
+        return cached
+    prompt = _build_filter_prompt(user_query)
+
+    logger.debug("Generating filter from query...")
+    try:
+        with metrics.span("filter_llm") as span:
+            response_text = await llm_gateway.agenerate(FILTER_MODEL, prompt)
+            span.set(prompt_chars=len(prompt), response_chars=len(response_text))
+        filter_dict = _parse_filter_response(response_text)
+    except Exception as e:
+        logger.warning("Failed to generate filter: %s", e)
+        return {}
+
+    logger.debug("Successfully generated filter: %s", filter_dict)
+    await llm_cache.astore("chroma_filter", FILTER_PROMPT_VERSION, user_query, json.dumps(filter_dict))
+    return filter_dict
+
+PROFILE_MEASURES = ('temperature', 'salinity')
+
+def _and(conditions: list) -> dict:
+    """(Internal Helper) Chroma needs at least two operands in an $and."""
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def _level_flag(depth) -> dict:
+    """(Internal Helper) Matches compacted profiles that contain the level `depth`."""
+    return {f"has_level_{int(depth)}m": {"$eq": True}}
+
+def _profile_depth_condition(operator: str, value):
+    """
+    (Internal Helper) Translates one condition on `depth` into the equivalent
+    condition on a compacted profile document, which flags the levels it
+    contains with `has_level_<d>m` and its covered range with
+    `depth_min`/`depth_max`.
+    """
+    if operator == "$eq":
+        return _level_flag(value)
+    if operator == "$in":
+        conditions = [_level_flag(v) for v in value]
+        return conditions[0] if len(conditions) == 1 else {"$or": conditions}
+    if operator in ("$gte", "$gt"):
+        return {"depth_max": {operator: value}}
+    if operator in ("$lte", "$lt"):
+        return {"depth_min": {operator: value}}
+    if operator == "$ne":
+        # Some level other than `value`, i.e. not a profile made only of that level.
+        return {"$or": [{"depth_min": {"$ne": value}}, {"depth_max": {"$ne": value}}]}
+    # $nin: more levels than listed depths, or an end of the range outside them.
+    # A profile whose extra levels are all interior is missed.
+    return {"$or": [
+        {"n_levels": {"$gt": len(value)}}, {"depth_min": {"$nin": value}}, {"depth_max": {"$nin": value}},
+    ]}
+
+def _conjuncts(where_filter: dict) -> list:
+    """(Internal Helper) The ANDed single-key conditions of a 'where' filter."""
+    conjuncts = []
+    for key, value in where_filter.items():
+        if key == "$and" and isinstance(value, list):
+            for item in value:
+                conjuncts.extend(_conjuncts(item) if isinstance(item, dict) else [item])
+        else:
+            conjuncts.append({key: value})
+    return conjuncts
+
+def _pinned_depths(condition) -> Optional[list]:
+    """(Internal Helper) The depths of an $eq / $in condition on `depth`, else None."""
+    if not isinstance(condition, dict):
+        return [condition]
+    if len(condition) != 1:
+        return None
+    operator, value = next(iter(condition.items()))
+    if operator == "$eq":
+        return [value]
+    if operator == "$in" and isinstance(value, list) and value:
+        return list(value)
+    return None
+
+def _expand_depth_filter(where_filter: dict) -> dict:
+    """
+    (Internal Helper) Rewrites every `depth` condition in a 'where' filter so
+    it matches both per-depth documents and compacted profile documents.
+
+    A compacted profile's plain `temperature`/`salinity` are its shallowest
+    level, so when the depth is pinned ($eq / $in) the conditions on them
+    are moved to that level's `temperature_<d>m` / `salinity_<d>m` keys.
+    """
+    if not isinstance(where_filter, dict) or not where_filter:
+        return where_filter
+    conjuncts = []
+    for condition in _conjuncts(where_filter):
+        key, value = next(iter(condition.items()))
+        if key == "$or" and isinstance(value, list):
+            condition = {"$or": [_expand_depth_filter(item) for item in value]}
+        conjuncts.append(condition)
+
+    depths = [c for c in conjuncts if "depth" in c]
+    measures = [c for c in conjuncts if next(iter(c)) in PROFILE_MEASURES]
+    others = [c for c in conjuncts if "depth" not in c and next(iter(c)) not in PROFILE_MEASURES]
+    pinned = _pinned_depths(depths[0]["depth"]) if len(depths) == 1 else None
+
+    if pinned is not None and measures:
+        profiles = [
+            _and([_level_flag(depth)] + [
+                {f"{field}_{int(depth)}m": condition}
+                for measure in measures for field, condition in measure.items()
+            ] + others)
+            for depth in pinned
+        ]
+        return {"$or": [_and(depths + measures + others)] + profiles}
+
+    alternatives = []
+    for depth_condition in depths:
+        value = depth_condition["depth"]
+        conditions = value if isinstance(value, dict) else {"$eq": value}
+        alternatives.extend(
+            {"$or": [{"depth": {op: v}}, _profile_depth_condition(op, v)]}
+            for op, v in conditions.items()
+        )
+    return _and(alternatives + measures + others)
 
 def retrieve_vector_docs(user_query: str, k: int = 10) -> list:
     """
@@ -137,17 +281,51 @@ def retrieve_vector_docs(user_query: str, k: int = 10) -> list:
     """
     # Step 1: Use the LLM to intelligently generate the metadata filter.
     where_filter = _generate_chroma_filter(user_query)
+    # Depth conditions must also match 3D data ingested as compacted profiles.
+    where_filter = _expand_depth_filter(where_filter)
     
     # Step 2: Query ChromaDB using both semantic search and the generated filter.
-    print(f"\n> Querying ChromaDB with semantic text and filter...")
-    results = collection.query(
-        query_texts=[user_query],
-        n_results=k,
-        where=where_filter,
-        include=['documents', 'metadatas', 'distances']
-    )
-    
     # Step 3: Format the results for the next agent.
+    return _query_collection(user_query, where_filter, k)
+
+async def aretrieve_vector_docs(user_query: str, k: int = 10) -> list:
+    """
+    Async version of `retrieve_vector_docs`. The filter is generated with the
+    async LLM client and the blocking Chroma HTTP query runs in a worker
+    thread, so the event loop stays free for other requests.
+    """
+    where_filter = await _agenerate_chroma_filter(user_query)
+    return await aquery_vector_docs(user_query, where_filter, k)
+
+async def aquery_vector_docs(user_query: str, where_filter: dict, k: int = 10) -> list:
+    """
+    Queries ChromaDB with an already generated 'where' filter, for callers
+    that got the filter some other way (e.g. a combined filter+SQL LLM call).
+    """
+    where_filter = _expand_depth_filter(where_filter)
+    return await asyncio.to_thread(_query_collection, user_query, where_filter, k)
+
+def _query_collection(user_query: str, where_filter: dict, k: int) -> list:
+    """
+    (Internal Helper) Semantic search with a ready 'where' filter, returning
+    formatted documents. Blocking; async callers run it in a worker thread.
+    """
+    logger.debug("Querying ChromaDB with semantic text and filter...")
+    with metrics.span("chroma_query") as span:
+        results = collection.query(
+            query_texts=[user_query],
+            n_results=k,
+            where=where_filter,
+            include=['documents', 'metadatas', 'distances']
+        )
+        formatted_results = _format_results(results)
+        span.set(rows=len(formatted_results))
+    return formatted_results
+
+def _format_results(results) -> list:
+    """
+    (Internal Helper) Formats a Chroma query result for the next agent.
+    """
     formatted_results = []
     if results and results['documents'] and results['documents'][0]:
         for doc, meta, dist in zip(results['documents'][0], results['metadatas'][0], results['distances'][0]):
@@ -157,5 +335,5 @@ def retrieve_vector_docs(user_query: str, k: int = 10) -> list:
                 "distance": dist
             })
     
-    print(f"> Retrieved {len(formatted_results)} documents.")
+    logger.debug("Retrieved %d documents.", len(formatted_results))
     return formatted_results
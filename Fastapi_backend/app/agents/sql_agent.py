@@ -1,16 +1,17 @@
 
 import os
-import json
+import logging
 from dotenv import load_dotenv
-from google import genai
-import time
+from ..services import llm_cache, llm_gateway, metrics
+from .context_encoder import encode_context
 
 # --- Load Configuration and Initialize LLM ---
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("Error: GEMINI_API_KEY not found in .env file.")
-model = genai.Client(api_key=GEMINI_API_KEY)
 
 
 # --- Database Schema for the LLM's Context ---
@@ -19,7 +20,7 @@ You have access to a PostgreSQL database with two tables:
 
 1. `"average_ocean_profiles"`: This table has historical data of the Indian Ocean, Bay of Bengal, and Arabian Sea. It contains surface-level depth data.
    Columns:
-   - `time` (date): The date of the measurement.
+   - `"TIME"` (date): The date of the measurement.
    - `grid_id` (text): A unique identifier for the geographical grid cell.
    - `latitude` (float): The center latitude of the grid cell.
    - `longitude` (float): The center longitude of the grid cell.
@@ -27,7 +28,7 @@ You have access to a PostgreSQL database with two tables:
    - `avg_salinity` (float): The average salinity for the grid cell on that day.
    - `argo_float_ids` (text): IDs of the argo floats that contributed to the average.
 
-2. `Argo_Depth_Ocean_Profiles`: This table has historical data for the same regions but contains depth-wise profiles.
+2. `"argo_depth_ocean_profiles"`: This table has historical data for the same regions but contains depth-wise profiles.
    Columns:
    - `time_period` (date): The date of the measurement.
    - `grid_id` (text): A unique identifier for the geographical grid cell.
@@ -38,21 +39,15 @@ You have access to a PostgreSQL database with two tables:
    - `avg_salinity` (float): The average salinity at that depth.
 """
 
-def generate_sql_query(user_query: str, retrieved_docs: list) -> str:
-    """
-    Uses an LLM to generate a PostgreSQL query based on user input and retrieved context.
-
-    Args:
-        user_query (str): The original natural language query from the user.
-        retrieved_docs (list): A list of relevant documents from the retrieval agent.
+SQL_MODEL = "gemini-1.5-flash"
 
-    Returns:
-        str: A single, executable PostgreSQL query string.
+def _build_sql_prompt(user_query: str, retrieved_docs: list) -> str:
     """
-    
-    context_str = json.dumps(retrieved_docs, indent=2)
+    (Internal Helper) Builds the SQL generation prompt from the query and context.
+    """
+    context_str = encode_context(retrieved_docs)
 
-    prompt = f"""
+    return f"""
     You are an expert PostgreSQL query writer. Your task is to generate a precise SQL query to retrieve data from a database based on a user's question and some relevant context.
 
     **Database Schema:**
@@ -66,12 +61,12 @@ def generate_sql_query(user_query: str, retrieved_docs: list) -> str:
 
     **Instructions:**
     1. **Table Selection:**
-       - If the user's query mentions "depth," "profiles," or specific depth levels (e.g., "at 100m"), you MUST query the `Argo_Ocean_Depth_Profiles` table.
-       - Otherwise, for general or surface-level queries, you MUST query the `Average_Ocean_Profiles` table.
+       - If the user's query mentions "depth," "profiles," or specific depth levels (e.g., "at 100m"), you MUST query the `"argo_depth_ocean_profiles"` table.
+       - Otherwise, for general or surface-level queries, you MUST query the `"average_ocean_profiles"` table.
 
     2. **Filtering:**
        - Use the date and location from the User Query as the primary source for WHERE clause filters. Use the 'Relevant Context' as supplementary information, for example, to identify specific grid_ids or to understand the general area of interest.
-       - For the `Average_Ocean_Profiles` table, filter on the `TIME` column. For the `Argo_Ocean_Depth_Profiles` table, filter on the `time_period` column.
+       - For the `"average_ocean_profiles"` table, filter on the `"TIME"` column. For the `"argo_depth_ocean_profiles"` table, filter on the `time_period` column.
 
     3. **Column Selection:**
        - Select only the columns that are most relevant to answering the user's query.
@@ -83,56 +78,108 @@ def generate_sql_query(user_query: str, retrieved_docs: list) -> str:
     **Generated SQL Query:**
     """
 
-    print("> Generating SQL query from context...")
-    retries = 3
-    wait_time = 5  # seconds
-
-    # 2. Start a loop for the retries.
-    for i in range(retries):
-        try:
-            # 3. The API call is inside the try block as before.
-            response = model.models.generate_content(
-                model="gemini-1.5-flash", # Using a more recent model name
-                contents=prompt
-            )
-            sql_query = response.text
-            cleaned_sql = sql_query.strip().replace("```sql", "").replace("```", "").strip()
-            
-            print(f"> Successfully generated SQL: {cleaned_sql}")
-            # If the call succeeds, return the result and exit the loop.
-            return cleaned_sql
-
-        except Exception as e:
-            # 4. Check if the error is a temporary, retryable one.
-            if "503" in str(e) or "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                print(f"Model is overloaded (error: {e}). Retrying in {wait_time}s... ({i+1}/{retries})")
-                # Wait for the specified time.
-                time.sleep(wait_time)
-                # Increase the wait time for the next potential retry.
-                wait_time *= 2
-                # The 'continue' statement moves to the next iteration of the loop.
-                continue
-            else:
-                # 5. If it's a different error, don't retry.
-                print(f"An unexpected, non-retryable error occurred: {e}")
-                return "SELECT 'An error occurred during SQL generation';"
-
-    # 6. If the loop finishes after all retries have failed.
-    print("> Failed to generate SQL after multiple retries.")
-    return "SELECT 'Failed to generate SQL after multiple retries';"
-
-    # # --- END: EXPONENTIAL BACKOFF LOGIC ---
-    # try:
-    #     response = model.models.generate_content(
-    #         model="gemini-2.5-flash",
-    #         contents=prompt
-    #     )
-    #     sql_query = response.text
-    #     # Clean up the response to ensure it's just a raw SQL string
-    #     cleaned_sql = sql_query.strip().replace("```sql", "").replace("```", "").strip()
-    # except Exception as e:
-    #     print(f"An error occurred during SQL generation: {e}")
-    #     cleaned_sql = "SELECT 'An error occurred during SQL generation';"
-
-    # print(f"> Successfully generated SQL: {cleaned_sql}")
-    # return cleaned_sql  
\ No newline at end of file
+# Cached SQL is tied to this exact prompt template, schema and model.
+SQL_PROMPT_VERSION = llm_cache.prompt_version(SQL_MODEL, _build_sql_prompt("{user_query}", []))
+llm_cache.register_prompt("sql_generation", SQL_PROMPT_VERSION)
+
+def _cache_context(retrieved_docs: list) -> str:
+    """
+    (Internal Helper) The retrieved context is part of the SQL cache key, so the
+    same question over different documents is not answered from the cache.
+    The key uses the encoded context the prompt is built from, which leaves out
+    similarity distances (they jitter between index builds).
+    """
+    return encode_context(retrieved_docs)
+
+def _clean_sql(response_text: str) -> str:
+    """
+    (Internal Helper) Strips markdown fences from the LLM's SQL response.
+    """
+    return response_text.strip().replace("```sql", "").replace("```", "").strip()
+
+class SQLGenerationError(Exception):
+    """The LLM could not produce a SQL query (raised only when asked to, see `agenerate_sql_query`)."""
+
+
+# Placeholder queries returned when SQL generation failed.
+RETRIES_EXHAUSTED_SQL = "SELECT 'Failed to generate SQL after multiple retries';"
+GENERATION_ERROR_SQL = "SELECT 'An error occurred during SQL generation';"
+
+
+def is_failed_sql(sql_query: str) -> bool:
+    """True if `sql_query` is one of the placeholders for a failed generation."""
+    return sql_query in (RETRIES_EXHAUSTED_SQL, GENERATION_ERROR_SQL)
+
+
+def _failed_sql(error: Exception) -> str:
+    """
+    (Internal Helper) The placeholder query returned when SQL generation failed.
+    """
+    if llm_gateway.is_retryable(error):
+        # The gateway already retried overload / quota errors.
+        logger.error("Failed to generate SQL after multiple retries.")
+        return RETRIES_EXHAUSTED_SQL
+    logger.error("An unexpected, non-retryable error occurred: %s", error)
+    return GENERATION_ERROR_SQL
+
+def generate_sql_query(user_query: str, retrieved_docs: list) -> str:
+    """
+    Uses an LLM to generate a PostgreSQL query based on user input and retrieved context.
+    Blocking callers such as scripts are served at batch priority by the LLM gateway.
+
+    Args:
+        user_query (str): The original natural language query from the user.
+        retrieved_docs (list): A list of relevant documents from the retrieval agent.
+
+    Returns:
+        str: A single, executable PostgreSQL query string.
+    """
+    context = _cache_context(retrieved_docs)
+    cached = llm_cache.lookup("sql_generation", SQL_PROMPT_VERSION, user_query, context)
+    if cached is not None:
+        logger.debug("Using cached SQL: %s", cached)
+        return cached
+    prompt = _build_sql_prompt(user_query, retrieved_docs)
+
+    logger.debug("Generating SQL query from context...")
+    try:
+        with metrics.span("sql_llm") as span:
+            response_text = llm_gateway.generate(SQL_MODEL, prompt)
+            span.set(prompt_chars=len(prompt), response_chars=len(response_text))
+        cleaned_sql = _clean_sql(response_text)
+    except Exception as e:
+        return _failed_sql(e)
+
+    logger.debug("Successfully generated SQL: %s", cleaned_sql)
+    llm_cache.store("sql_generation", SQL_PROMPT_VERSION, user_query, cleaned_sql, context)
+    return cleaned_sql
+
+async def agenerate_sql_query(user_query: str, retrieved_docs: list, fallback: bool = True) -> str:
+    """
+    Async version of `generate_sql_query`, served at chat priority by the
+    LLM gateway without blocking the event loop. With `fallback=False` a
+    failed generation raises SQLGenerationError instead of returning the
+    placeholder query.
+    """
+    context = _cache_context(retrieved_docs)
+    cached = await llm_cache.alookup("sql_generation", SQL_PROMPT_VERSION, user_query, context)
+    if cached is not None:
+        logger.debug("Using cached SQL: %s", cached)
+        return cached
+    prompt = _build_sql_prompt(user_query, retrieved_docs)
+
+    logger.debug("Generating SQL query from context...")
+    try:
+        with metrics.span("sql_llm") as span:
+            response_text = await llm_gateway.agenerate(SQL_MODEL, prompt)
+            span.set(prompt_chars=len(prompt), response_chars=len(response_text))
+        cleaned_sql = _clean_sql(response_text)
+    except Exception as e:
+        if not fallback:
+            logger.warning("SQL generation failed: %s", e)
+            raise SQLGenerationError(str(e)) from e
+        return _failed_sql(e)
+
+    logger.debug("Successfully generated SQL: %s", cleaned_sql)
+    await llm_cache.astore("sql_generation", SQL_PROMPT_VERSION, user_query, cleaned_sql, context)
+    return cleaned_sql
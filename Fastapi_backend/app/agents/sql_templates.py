@@ -0,0 +1,202 @@
+import os
+import re
+import logging
+import threading
+from datetime import date
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional, Tuple
+from psycopg2.extensions import adapt
+from .filter_parser import parse_conditions
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Set SQL_TEMPLATES=0 to send every question to the LLM SQL generator.
+SQL_TEMPLATES = os.getenv("SQL_TEMPLATES", "1") != "0"
+
+# table -> time column
+TABLES = {
+    'average_ocean_profiles': '"TIME"',
+    'argo_depth_ocean_profiles': 'time_period',
+}
+
+# Intents in priority order, with the phrases that signal them. The phrases are
+# removed before the rest of the question is parsed for filters.
+INTENTS = [
+    ('trend', re.compile(
+        r'\b(?:trends?|over\s+(?:the\s+)?years|over\s+time|year[\s-]+(?:by|over|to)[\s-]+year|'
+        r'yearly|annual(?:ly)?|inter-?annual|changed|changing)\b', re.IGNORECASE)),
+    ('depth_profile', re.compile(
+        r'\b(?:(?:depth|vertical)\s+)?profiles?\b|\b(?:across|by|with|at\s+all)\s+depths?\b', re.IGNORECASE)),
+    ('surface_average', re.compile(r'\b(?:average|mean|avg|typical)\b', re.IGNORECASE)),
+]
+MEASURES = re.compile(r'\b(?:temperatures?|temps?|sst|salinity|salinities)\b', re.IGNORECASE)
+# "from 2015 to 2020" / "between 2015 and 2020", used by trend questions.
+YEAR_RANGE = re.compile(
+    r'\b(?:from|between)\s+((?:19|20)\d{2})\s+(?:to|and|-|until|through)\s+((?:19|20)\d{2})\b', re.IGNORECASE,
+)
+MEASURE_COLUMNS = {'temperature': 'avg_temperature', 'salinity': 'avg_salinity'}
+SQL_OPERATORS = {'$eq': '=', '$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+_lock = threading.Lock()
+_stats = {'questions': 0, 'llm_fallback': 0, 'disabled': 0}
+_intent_counts: Dict[str, int] = {}
+
+
+def _where(conditions: List[Dict[str, Any]], time_column: str, year_range: Optional[Tuple[int, int]],
+           has_depth: bool) -> Optional[Tuple[List[str], Dict[str, Any]]]:
+    """
+    (Internal Helper) WHERE clauses and params for the parsed conditions, or
+    None when a condition has no equivalent in the table.
+    """
+    clauses: List[str] = []
+    params: Dict[str, Any] = {}
+    year = month = None
+    for condition in conditions:
+        (field, spec), = condition.items()
+        (operator, value), = spec.items()
+        if field == 'year':
+            year = value
+        elif field == 'month':
+            month = value
+        elif field in ('latitude', 'longitude', 'depth') or field in MEASURE_COLUMNS:
+            if field == 'depth' and not has_depth:
+                return None
+            column = MEASURE_COLUMNS.get(field, field)
+            name = f"{field}_{len(params)}"
+            clauses.append(f"{column} {SQL_OPERATORS[operator]} %({name})s")
+            params[name] = value
+        else:
+            # float_ids live in a text column; leave those questions to the LLM.
+            return None
+
+    if year_range is not None:
+        if year is not None:
+            return None
+        clauses.append(f"{time_column} >= %(start_date)s AND {time_column} < %(end_date)s")
+        params['start_date'], params['end_date'] = date(year_range[0], 1, 1), date(year_range[1] + 1, 1, 1)
+    elif year is not None and month is not None:
+        clauses.append(f"{time_column} >= %(start_date)s AND {time_column} < %(end_date)s")
+        params['start_date'] = date(year, month, 1)
+        params['end_date'] = date(year + month // 12, month % 12 + 1, 1)
+    elif year is not None:
+        clauses.append(f"{time_column} >= %(start_date)s AND {time_column} < %(end_date)s")
+        params['start_date'], params['end_date'] = date(year, 1, 1), date(year + 1, 1, 1)
+    if month is not None and year is None:
+        clauses.append(f"EXTRACT(MONTH FROM {time_column}) = %(month)s")
+        params['month'] = month
+    return clauses, params
+
+
+def _build(intent: str, conditions: List[Dict[str, Any]],
+           year_range: Optional[Tuple[int, int]]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """(Internal Helper) The SQL and params for one intent, or None when the template does not fit."""
+    fields = {field for condition in conditions for field in condition}
+    if 'latitude' not in fields:
+        # Every template is scoped to a region.
+        return None
+    has_depth_filter = 'depth' in fields
+    if intent == 'surface_average' and not ({'year', 'month'} & fields):
+        return None
+
+    table = 'argo_depth_ocean_profiles' if intent == 'depth_profile' or has_depth_filter else 'average_ocean_profiles'
+    time_column = TABLES[table]
+    where = _where(conditions, time_column, year_range, table == 'argo_depth_ocean_profiles')
+    if where is None:
+        return None
+    clauses, params = where
+    where_sql = " WHERE " + " AND ".join(clauses) if clauses else ""
+
+    measures = (
+        "COUNT(*) AS n_observations, "
+        "AVG(avg_temperature) AS avg_temperature, AVG(avg_salinity) AS avg_salinity"
+    )
+    if intent == 'surface_average':
+        sql = (
+            f"SELECT {measures}, COUNT(DISTINCT grid_id) AS n_grid_cells, "
+            f"MIN({time_column}) AS first_date, MAX({time_column}) AS last_date, "
+            f"MIN(avg_temperature) AS min_temperature, MAX(avg_temperature) AS max_temperature, "
+            f"MIN(avg_salinity) AS min_salinity, MAX(avg_salinity) AS max_salinity "
+            f'FROM "{table}"{where_sql}'
+        )
+    elif intent == 'depth_profile':
+        sql = f'SELECT depth, {measures} FROM "{table}"{where_sql} GROUP BY depth ORDER BY depth'
+    else:
+        sql = (
+            f"SELECT EXTRACT(YEAR FROM {time_column})::int AS year, {measures} "
+            f'FROM "{table}"{where_sql} GROUP BY 1 ORDER BY 1'
+        )
+    return sql, params
+
+
+def _match(user_query: str) -> Optional[Dict[str, Any]]:
+    """(Internal Helper) The template for `user_query`, or None."""
+    if not MEASURES.search(user_query):
+        return None
+    for intent, pattern in INTENTS:
+        if not pattern.search(user_query):
+            continue
+        rest = pattern.sub(' ', user_query)
+        year_range = None
+        if intent == 'trend':
+            found = YEAR_RANGE.search(rest)
+            if found:
+                year_range = tuple(sorted((int(found.group(1)), int(found.group(2)))))
+                rest = YEAR_RANGE.sub(' ', rest)
+        conditions = parse_conditions(rest)
+        if conditions is None:
+            return None
+        built = _build(intent, conditions, year_range)
+        if built is None:
+            return None
+        sql, params = built
+        return {'intent': intent, 'sql': sql, 'params': params}
+    return None
+
+
+def render_sql(template: Dict[str, Any]) -> str:
+    """The template's SQL with its params inlined, for display and logging."""
+    return template['sql'] % {
+        name: adapt(value).getquoted().decode() for name, value in template['params'].items()
+    }
+
+
+def match_template(user_query: str) -> Optional[Dict[str, Any]]:
+    """
+    Classifies the question into one of the common intents and compiles the
+    matching parameterized SQL, so the LLM SQL step can be skipped.
+
+    Intents: `trend` (yearly averages over a region), `depth_profile`
+    (averages per depth over a region) and `surface_average` (one average
+    over a region and month or year). The filters come from the rule-based
+    filter parser; anything it cannot read sends the question to the LLM.
+
+    Args:
+        user_query (str): The user's natural language query.
+
+    Returns:
+        Optional[dict]: `intent`, `sql` and `params` for `execute_secure_query`,
+        or None to generate the SQL with the LLM.
+    """
+    template = _match(user_query) if SQL_TEMPLATES else None
+    with _lock:
+        _stats['questions'] += 1
+        if template is not None:
+            _intent_counts[template['intent']] = _intent_counts.get(template['intent'], 0) + 1
+        else:
+            _stats['llm_fallback'] += 1
+            _stats['disabled'] += not SQL_TEMPLATES
+    if template is not None:
+        logger.debug("Matched SQL template '%s': %s", template['intent'], render_sql(template))
+    return template
+
+
+def get_template_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats['intents'] = dict(_intent_counts)
+    stats['enabled'] = SQL_TEMPLATES
+    matched = stats['questions'] - stats['llm_fallback']
+    stats['template_rate'] = round(matched / stats['questions'], 3) if stats['questions'] else 0.0
+    return stats
@@ -1,44 +1,41 @@
-import json
-from google import genai
-import os
+import logging
 from dotenv import load_dotenv
-import time
-from datetime import datetime, date
+from ..services import llm_gateway, metrics
+from ..services.result_digest import digest_results
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-model = genai.Client(api_key=GEMINI_API_KEY)
+load_dotenv()
 
-def json_serial(obj):
-    """JSON serializer for objects not serializable by default json code"""
-    if isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    raise TypeError(f"Type {type(obj)} not serializable")
+SUMMARY_MODEL = "gemini-2.5-flash"
 
-def summarize_and_respond(user_query: str, sql_results: list) -> str:
+def _build_summary_prompt(user_query: str, sql_results: list, truncated: bool = False) -> str:
     """
-    Synthesizes information from ChromaDB and PostgreSQL to generate a final answer.
-    The final answer is formatted using Markdown for improved readability.
-
-    Args:
-        user_query (str): The original user query.
-        sql_results (list): Precise data from the PostgreSQL query.
-
-    Returns:
-        str: A final, cohesive natural language answer formatted in Markdown.
+    Builds the summarization prompt from the user query and the SQL results.
+    Results too large for the prompt budget are replaced by a statistical digest.
     """
-    
-    # Convert the list of dictionaries to a more readable string format
-    sql_results_str = json.dumps(sql_results, indent=2, default=json_serial)
+    sql_results_str, digest_report = digest_results(sql_results)
+
+    if digest_report['mode'] == 'digest':
+        data_heading = (
+            f"**Statistical Digest of the PostgreSQL Results ({digest_report['rows']} rows; overall and "
+            f"per-group count/min/max/mean/std/trend_per_year, plus representative sample rows):**"
+        )
+    else:
+        data_heading = "**Precise Data from PostgreSQL Database (specific values):**"
+    if truncated:
+        data_heading += (
+            f"\n    (The query matched more rows than the row limit; only the first "
+            f"{len(sql_results)} are included.)"
+        )
 
-    prompt = f"""
+    return f"""
     You are an expert oceanographer's assistant. Your task is to synthesize information from a database query to provide a comprehensive, natural language answer to the user's question.
 
     **User's Original Question:**
     "{user_query}"
 
-    **Precise Data from PostgreSQL Database (specific values):**
+    {data_heading}
     {sql_results_str}
 
     **Instructions:**
@@ -56,19 +53,84 @@ def summarize_and_respond(user_query: str, sql_results: list) -> str:
     **Final Answer:**
     """
 
-    print("> Synthesizing the final answer...")
+# Returned instead of an answer when the summary LLM call failed.
+SUMMARY_FAILED_ANSWER = "I'm sorry, but I encountered an error while trying to formulate a final response."
+
+def _clean_answer(response_text: str) -> str:
+    return response_text.strip().replace("```", "").strip()
+
+def summarize_and_respond(user_query: str, sql_results: list, truncated: bool = False) -> str:
+    """
+    Synthesizes information from ChromaDB and PostgreSQL to generate a final answer.
+    The final answer is formatted using Markdown for improved readability.
+
+    Args:
+        user_query (str): The original user query.
+        sql_results (list): Precise data from the PostgreSQL query.
+        truncated (bool): Whether the results were cut off at the row limit.
+
+    Returns:
+        str: A final, cohesive natural language answer formatted in Markdown.
+    """
+    
+    prompt = _build_summary_prompt(user_query, sql_results, truncated)
+
+    logger.debug("Synthesizing the final answer...")
     
     try:
-        time.sleep(3)
-        response = model.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
-        final_answer = response.text.strip().replace("```", "").strip()
-        print(final_answer)
+        with metrics.span("summary_llm") as span:
+            response_text = llm_gateway.generate(SUMMARY_MODEL, prompt)
+            span.set(prompt_chars=len(prompt), response_chars=len(response_text))
+        final_answer = _clean_answer(response_text)
     except Exception as e:
-        print(f"An error occurred during final answer generation: {e}")
-        final_answer = "I'm sorry, but I encountered an error while trying to formulate a final response."
+        logger.error("An error occurred during final answer generation: %s", e)
+        final_answer = SUMMARY_FAILED_ANSWER
+
+    logger.debug("Final answer generated: %s", final_answer)
+    return final_answer
+
+async def asummarize_and_respond(user_query: str, sql_results: list, truncated: bool = False) -> str:
+    """
+    Async version of `summarize_and_respond`, served at chat priority by the
+    LLM gateway, which also paces calls against the rate limit.
+    """
+    prompt = _build_summary_prompt(user_query, sql_results, truncated)
+
+    logger.debug("Synthesizing the final answer...")
+
+    try:
+        with metrics.span("summary_llm") as span:
+            response_text = await llm_gateway.agenerate(SUMMARY_MODEL, prompt)
+            span.set(prompt_chars=len(prompt), response_chars=len(response_text))
+        final_answer = _clean_answer(response_text)
+    except Exception as e:
+        logger.error("An error occurred during final answer generation: %s", e)
+        final_answer = SUMMARY_FAILED_ANSWER
+
+    logger.debug("Final answer generated: %s", final_answer)
+    return final_answer
+
+async def astream_summary(user_query: str, sql_results: list, truncated: bool = False):
+    """
+    Streaming version of `asummarize_and_respond`. Yields the answer text in
+    chunks as Gemini produces them, so the client can render it immediately.
+    """
+    prompt = _build_summary_prompt(user_query, sql_results, truncated)
 
-    print("> Final answer generated.")
-    return final_answer
\ No newline at end of file
+    logger.debug("Streaming the final answer...")
+    with metrics.span("summary_llm") as span:
+        response_chars = 0
+        # Trailing backticks are held back until the next chunk shows whether
+        # they start a ``` fence split across chunks.
+        pending = ""
+        async for text in llm_gateway.astream(SUMMARY_MODEL, prompt):
+            response_chars += len(text)
+            text = (pending + text).replace("```", "")
+            kept = text.rstrip("`")
+            pending = text[len(kept):]
+            if kept:
+                yield kept
+        if pending:
+            yield pending
+        span.set(prompt_chars=len(prompt), response_chars=response_chars)
+    logger.debug("Final answer streamed.")
@@ -0,0 +1,249 @@
+# In file: app/api/pipeline.py
+
+import os
+import math
+import asyncio
+import logging
+import threading
+import numpy as np
+from collections import deque
+from fastapi import HTTPException
+from typing import Any, Awaitable, Callable, Dict, Optional
+from ..agents.retrieval_agent import aretrieve_vector_docs, aquery_vector_docs
+from ..agents.sql_agent import agenerate_sql_query, is_failed_sql, SQLGenerationError
+from ..agents.combined_agent import agenerate_filter_and_sql
+from ..agents import sql_templates
+from ..services.postgres_service import aexecute_guarded_query, QueryRejectedError
+
+logger = logging.getLogger(__name__)
+
+# How the retrieval and SQL stages are scheduled:
+# - sequential:  filter -> vector search -> SQL generation -> SQL execution.
+# - speculative: a SQL draft is generated from the bare question and executed
+#                while the filter and vector search run; it is kept if it
+#                returned rows, otherwise SQL is regenerated with the context.
+# - combined:    one LLM call returns both the filter and the SQL, then the
+#                vector search and SQL execution run concurrently.
+PIPELINE_MODES = ('sequential', 'speculative', 'combined')
+RAG_PIPELINE_MODE = os.getenv("RAG_PIPELINE_MODE", "sequential")
+LATENCY_WINDOW = 500  # most recent requests per mode used for percentiles
+
+# Per-stage time limits (seconds) for the RAG pipeline.
+STAGE_TIMEOUTS = {
+    "retrieval": float(os.getenv("RETRIEVAL_TIMEOUT", 60)),
+    "sql_generation": float(os.getenv("SQL_GENERATION_TIMEOUT", 60)),
+    "sql_execution": float(os.getenv("SQL_EXECUTION_TIMEOUT", 30)),
+    "summarization": float(os.getenv("SUMMARIZATION_TIMEOUT", 90)),
+}
+
+Emit = Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]]
+
+_lock = threading.Lock()
+_latencies: Dict[str, deque] = {mode: deque(maxlen=LATENCY_WINDOW) for mode in PIPELINE_MODES}
+_mode_stats = {mode: {'requests': 0, 'total_seconds': 0.0, 'sql_sources': {}} for mode in PIPELINE_MODES}
+
+async def run_stage(stage: str, coro):
+    """
+    Awaits one pipeline stage, failing with a 504 if it exceeds its time limit.
+    """
+    try:
+        return await asyncio.wait_for(coro, timeout=STAGE_TIMEOUTS[stage])
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail=f"The {stage} stage did not finish within {STAGE_TIMEOUTS[stage]:g}s."
+        )
+
+def resolve_mode(mode: Optional[str]) -> str:
+    """The pipeline mode for a request, rejecting unknown names with a 400."""
+    mode = mode or RAG_PIPELINE_MODE
+    if mode not in PIPELINE_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown pipeline mode '{mode}'. Use one of: {', '.join(PIPELINE_MODES)}."
+        )
+    return mode
+
+async def _aexecute_template(template: dict) -> dict:
+    """
+    Runs a compiled SQL template through the guarded path. Templates are
+    fixed, parameterized aggregates, so they skip the cost check, but an
+    unfiltered depth profile or trend still scans the whole table and stays
+    bound by the read-only connection and the statement_timeout.
+    """
+    return await aexecute_guarded_query(template['sql'], params=template['params'], max_cost=math.inf)
+
+def _retrieval_failed(retrieval: asyncio.Task) -> bool:
+    """(Internal Helper) True if the vector search already failed or found nothing."""
+    if not retrieval.done():
+        return False
+    return retrieval.cancelled() or retrieval.exception() is not None or not retrieval.result()
+
+async def _draft_sql(query: str, retrieval: asyncio.Task) -> Optional[tuple]:
+    """
+    (Internal Helper) Speculative SQL draft: generated from the bare question,
+    then executed. Returns (sql, execution), or None when the LLM call failed,
+    a stage timed out or the retrieval had already failed, so the caller
+    regenerates the SQL with the retrieved context instead.
+
+    Cancelling this task does not stop a query already handed to a worker
+    thread; it runs on until it finishes or hits its statement_timeout.
+    """
+    try:
+        sql_query = await run_stage("sql_generation", agenerate_sql_query(query, [], fallback=False))
+        if _retrieval_failed(retrieval):
+            return None
+        execution = await run_stage("sql_execution", aexecute_guarded_query(sql_query))
+    except (SQLGenerationError, QueryRejectedError):
+        return None
+    except HTTPException as e:
+        if e.status_code != 504:
+            raise
+        logger.info("Speculative SQL draft timed out: %s", e.detail)
+        return None
+    return sql_query, execution
+
+async def _await_docs(retrieval) -> list:
+    """(Internal Helper) Awaits the vector search, failing with a 404 when it found nothing."""
+    retrieved_docs = await retrieval
+    if not retrieved_docs:
+        # Handle case where no documents are found
+        raise HTTPException(status_code=404, detail="No relevant documents found in the vector database.")
+    return retrieved_docs
+
+async def _sequential(query: str, k: int, template: Optional[dict], emit) -> tuple:
+    logger.debug("Running retrieval agent")
+    retrieved_docs = await _await_docs(run_stage("retrieval", aretrieve_vector_docs(query, k)))
+    await emit("retrieval", {"retrieved_docs": retrieved_docs})
+
+    logger.debug("Running SQL generation agent")
+    if template is not None:
+        sql_query = sql_templates.render_sql(template)
+        await emit("sql_generation", {"generated_sql": sql_query})
+        execution = await run_stage("sql_execution", _aexecute_template(template))
+        return retrieved_docs, sql_query, execution, 'template'
+
+    sql_query = await run_stage("sql_generation", agenerate_sql_query(query, retrieved_docs))
+    await emit("sql_generation", {"generated_sql": sql_query})
+    logger.debug("Executing SQL query")
+    execution = await run_stage("sql_execution", aexecute_guarded_query(sql_query))
+    return retrieved_docs, sql_query, execution, 'llm'
+
+async def _speculative(query: str, k: int, template: Optional[dict], emit) -> tuple:
+    retrieval = asyncio.create_task(run_stage("retrieval", aretrieve_vector_docs(query, k)))
+    if template is not None:
+        draft = asyncio.create_task(run_stage("sql_execution", _aexecute_template(template)))
+    else:
+        draft = asyncio.create_task(_draft_sql(query, retrieval))
+    try:
+        retrieved_docs = await _await_docs(retrieval)
+        await emit("retrieval", {"retrieved_docs": retrieved_docs})
+        if template is not None:
+            sql_query = sql_templates.render_sql(template)
+            await emit("sql_generation", {"generated_sql": sql_query})
+            return retrieved_docs, sql_query, await draft, 'template'
+
+        drafted = await draft
+        if drafted is not None and drafted[1]['error'] is None and drafted[1]['rows']:
+            sql_query, execution = drafted
+            logger.debug("Keeping the speculative SQL draft.")
+            await emit("sql_generation", {"generated_sql": sql_query})
+            return retrieved_docs, sql_query, execution, 'speculative'
+    finally:
+        for task in (retrieval, draft):
+            task.cancel()
+
+    logger.info("Speculative SQL draft returned nothing; regenerating with the retrieved context.")
+    sql_query = await run_stage("sql_generation", agenerate_sql_query(query, retrieved_docs))
+    await emit("sql_generation", {"generated_sql": sql_query})
+    execution = await run_stage("sql_execution", aexecute_guarded_query(sql_query))
+    return retrieved_docs, sql_query, execution, 'llm'
+
+async def _combined(query: str, k: int, template: Optional[dict], emit) -> tuple:
+    if template is not None:
+        return await _speculative(query, k, template, emit)
+    generated = await run_stage("sql_generation", agenerate_filter_and_sql(query))
+    if generated is None:
+        logger.warning("Combined call failed; falling back to the sequential pipeline.")
+        return await _sequential(query, k, None, emit)
+    where_filter, sql_query = generated
+    await emit("sql_generation", {"generated_sql": sql_query})
+
+    retrieval = asyncio.create_task(run_stage("retrieval", aquery_vector_docs(query, where_filter, k)))
+    execution_task = asyncio.create_task(run_stage("sql_execution", aexecute_guarded_query(sql_query)))
+    try:
+        retrieved_docs = await _await_docs(retrieval)
+        await emit("retrieval", {"retrieved_docs": retrieved_docs})
+        return retrieved_docs, sql_query, await execution_task, 'combined'
+    finally:
+        for task in (retrieval, execution_task):
+            task.cancel()
+
+async def arun_pipeline(query: str, k: int, mode: str, emit: Emit = None) -> Dict[str, Any]:
+    """
+    Runs retrieval, SQL generation and SQL execution for one question in the
+    given mode (see PIPELINE_MODES). Questions that match a SQL template skip
+    the LLM SQL step in every mode; outside sequential mode the template
+    query also runs concurrently with the vector search.
+
+    Args:
+        query (str): The user's natural language query.
+        k (int): The number of documents to retrieve.
+        mode (str): One of PIPELINE_MODES.
+        emit: Optional async callback, called as `emit(stage, payload)` when
+            a stage's output is ready.
+
+    Returns:
+        dict: `retrieved_docs`, `generated_sql`, `execution` (as returned by
+        `aexecute_guarded_query`), `sql_source` ('template', 'llm',
+        'speculative', 'combined', or 'failed' when SQL generation fell back
+        to its placeholder query) and `sql_template` (the intent or None).
+    """
+    template = sql_templates.match_template(query)
+    intent = template['intent'] if template is not None else None
+
+    async def stage_emit(stage, payload):
+        if emit is None:
+            return
+        if stage == "sql_generation":
+            payload = dict(payload, sql_template=intent)
+        await emit(stage, payload)
+
+    runner = {'sequential': _sequential, 'speculative': _speculative, 'combined': _combined}[mode]
+    retrieved_docs, sql_query, execution, sql_source = await runner(query, k, template, stage_emit)
+    if is_failed_sql(sql_query):
+        sql_source = 'failed'
+    if emit is not None:
+        await emit("sql_execution", {
+            "sql_results": execution['rows'], "sql_truncated": execution['truncated'],
+            "sql_error": execution['error'], "sql_source": sql_source,
+        })
+    return {
+        'retrieved_docs': retrieved_docs,
+        'generated_sql': sql_query,
+        'execution': execution,
+        'sql_source': sql_source,
+        'sql_template': intent,
+    }
+
+def record_latency(mode: str, seconds: float, sql_source: str):
+    """Records the end-to-end latency of one answered (non-cached) question."""
+    with _lock:
+        stats = _mode_stats[mode]
+        stats['requests'] += 1
+        stats['total_seconds'] += seconds
+        stats['sql_sources'][sql_source] = stats['sql_sources'].get(sql_source, 0) + 1
+        _latencies[mode].append(seconds)
+
+def get_pipeline_stats() -> Dict[str, Any]:
+    with _lock:
+        modes = {}
+        for mode in PIPELINE_MODES:
+            stats = dict(_mode_stats[mode], sql_sources=dict(_mode_stats[mode]['sql_sources']))
+            recent = np.array(_latencies[mode]) if _latencies[mode] else None
+            stats['mean_seconds'] = round(stats['total_seconds'] / stats['requests'], 3) if stats['requests'] else None
+            stats['p50_seconds'] = round(float(np.percentile(recent, 50)), 3) if recent is not None else None
+            stats['p95_seconds'] = round(float(np.percentile(recent, 95)), 3) if recent is not None else None
+            stats['total_seconds'] = round(stats['total_seconds'], 3)
+            modes[mode] = stats
+    return {'default_mode': RAG_PIPELINE_MODE, 'modes': modes}
@@ -1,63 +1,216 @@
 # In file: app/api/routes.py
 
-from fastapi import APIRouter, HTTPException, Query
+import json
+import time
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, Query, Request, Response, BackgroundTasks
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from typing import List, Optional
 from ..schemas.models import QueryRequest, QueryResponse
-from ..agents.retrieval_agent import retrieve_vector_docs
-from ..agents.sql_agent import generate_sql_query
-from ..agents.summarization_agent import summarize_and_respond
-from ..services.postgres_service import execute_sql_query
-from ..schemas.models import TimeSeriesResponse
+from ..agents.summarization_agent import asummarize_and_respond, astream_summary, SUMMARY_FAILED_ANSWER
+from ..agents import sql_templates
+from . import pipeline
+from .pipeline import STAGE_TIMEOUTS, run_stage
+from ..schemas.models import TimeSeriesResponse, TimeSeriesBatchRequest, TimeSeriesBatchResponse
 from datetime import date
-from ..services import argo_service
+from ..services import argo_service, result_cache
+from ..services import answer_cache
+from ..services import export_service
+from ..services import columnar
+from ..services import result_digest
+from ..services import metrics
 
-# Create a new router
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Create a new router; every endpoint gets handler and serialization spans.
+router = APIRouter(route_class=metrics.InstrumentedRoute)
+
+def _cacheable(result: dict, final_answer: str) -> bool:
+    """
+    (Internal Helper) True if an answer may go into the answer cache: the SQL
+    was generated and ran without error and the summary succeeded. A cached
+    failure would otherwise be replayed to every paraphrase of the question.
+    """
+    return (
+        result['execution']['error'] is None
+        and result['sql_source'] != 'failed'
+        and bool(final_answer)
+        and final_answer != SUMMARY_FAILED_ANSWER
+    )
 
 @router.post("/query", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
+async def process_query(request: QueryRequest, response: Response, background_tasks: BackgroundTasks):
     """
     Receives a user query and orchestrates the full RAG pipeline.
+    Every stage is awaited, so slow LLM, Chroma or Postgres calls don't
+    block other requests on the same worker. Questions similar enough to
+    one already answered for the current dataset are served from the
+    semantic answer cache. `request.mode` picks how retrieval and SQL
+    generation are scheduled (see `pipeline.PIPELINE_MODES`).
     """
     try:
-        # --- Step 1: Retrieval Agent ---
-        # Get the most relevant documents from ChromaDB.
-        print("--- Running Retrieval Agent ---")
-        retrieved_docs = retrieve_vector_docs(request.query, request.k)
-        
-        if not retrieved_docs:
-            # Handle case where no documents are found
-            raise HTTPException(status_code=404, detail="No relevant documents found in the vector database.")
-
-        # --- Step 2: SQL Generation Agent ---
-        # Use the retrieved context to generate a SQL query.
-        print("\n--- Running SQL Generation Agent ---")
-        sql_query = generate_sql_query(request.query, retrieved_docs)
+        start = time.perf_counter()
+        mode = pipeline.resolve_mode(request.mode)
+        cached = await answer_cache.alookup(request.query, request.k)
+        if cached:
+            logger.info(
+                "Answer cache hit (similarity %.3f to %r), saved ~%.1fs.",
+                cached['similarity'], cached['matched_query'], cached['seconds_saved'],
+            )
+            response.headers["X-Answer-Cache"] = (
+                f"hit; similarity={cached['similarity']:.3f}; saved={cached['seconds_saved']:.2f}s"
+            )
+            return QueryResponse(**cached['response'])
+        response.headers["X-Answer-Cache"] = "miss"
 
-        # --- Step 3: Execute the SQL Query ---
-        # Run the generated query against the PostgreSQL database.
-        print("\n--- Executing SQL Query ---")
-        sql_results = execute_sql_query(sql_query)
+        # --- Steps 1-3: Retrieval, SQL generation and SQL execution ---
+        # Scheduled according to the pipeline mode.
+        result = await pipeline.arun_pipeline(request.query, request.k, mode)
+        execution = result['execution']
+        sql_results = execution['rows']
 
         # --- Step 4: Summarization Agent ---
         # Synthesize a final answer from all gathered context.
-        print("\n--- Running Summarization Agent ---")
-        final_answer = summarize_and_respond(request.query, sql_results)
+        logger.debug("Running summarization agent")
+        final_answer = await run_stage("summarization", asummarize_and_respond(request.query, sql_results, execution['truncated']))
         
         # --- Step 5: Return the final, structured response ---
-        return QueryResponse(
+        query_response = QueryResponse(
             user_query=request.query,
             final_answer=final_answer,
-            retrieved_docs=retrieved_docs,
-            generated_sql=sql_query,
-            sql_results=sql_results
+            retrieved_docs=result['retrieved_docs'],
+            generated_sql=result['generated_sql'],
+            sql_results=sql_results,
+            sql_truncated=execution['truncated'],
+            sql_error=execution['error'],
         )
+        elapsed = time.perf_counter() - start
+        pipeline.record_latency(mode, elapsed, result['sql_source'])
+        response.headers["X-Pipeline-Mode"] = f"{mode}; sql={result['sql_source']}; elapsed={elapsed:.2f}s"
+        if _cacheable(result, final_answer):
+            background_tasks.add_task(
+                answer_cache.astore, request.query, request.k,
+                jsonable_encoder(query_response), elapsed
+            )
+        return query_response
 
+    except HTTPException:
+        # 400 (unknown mode), 404 (no documents) and 504 (stage timeout) are passed through as-is.
+        raise
     except Exception as e:
         # A general error handler for any unexpected issues in the pipeline
-        print(f"An unexpected error occurred in the pipeline: {e}")
+        logger.exception("An unexpected error occurred in the pipeline: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
     
+def _sse(event: str, data) -> str:
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+async def _query_event_stream(request: QueryRequest):
+    """
+    Runs the same pipeline as `process_query`, emitting an event as each
+    stage completes and streaming the summary text as it is generated.
+    In the concurrent pipeline modes the stage events can arrive in a
+    different order than in sequential mode.
+
+    Events: `stage` (one per completed stage, with its output), `token`
+    (summary text chunks), `done` (the full QueryResponse) and `error`.
+    """
+    start = time.perf_counter()
+
+    def elapsed():
+        return round(time.perf_counter() - start, 3)
+
+    stage_events: asyncio.Queue = asyncio.Queue()
+
+    async def emit(stage, payload):
+        await stage_events.put(_sse("stage", {"stage": stage, "elapsed_seconds": elapsed(), **payload}))
+
+    pipeline_task = None
+    try:
+        mode = pipeline.resolve_mode(request.mode)
+        cached = await answer_cache.alookup(request.query, request.k)
+        if cached:
+            yield _sse("stage", {"stage": "answer_cache", "elapsed_seconds": elapsed(),
+                                 "similarity": cached['similarity']})
+            yield _sse("done", cached['response'])
+            return
+
+        # Stage events are forwarded as the pipeline produces them.
+        pipeline_task = asyncio.create_task(pipeline.arun_pipeline(request.query, request.k, mode, emit=emit))
+        while not (pipeline_task.done() and stage_events.empty()):
+            next_event = asyncio.create_task(stage_events.get())
+            await asyncio.wait({pipeline_task, next_event}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event.done():
+                yield next_event.result()
+            else:
+                next_event.cancel()
+        result = pipeline_task.result()
+        execution = result['execution']
+        sql_results = execution['rows']
+
+        # The summary is streamed chunk by chunk under the same overall time limit.
+        deadline = time.perf_counter() + STAGE_TIMEOUTS["summarization"]
+        chunks = []
+        summary_stream = astream_summary(request.query, sql_results, execution['truncated']).__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(summary_stream.__anext__(), timeout=deadline - time.perf_counter())
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise HTTPException(
+                        status_code=504,
+                        detail=f"The summarization stage did not finish within {STAGE_TIMEOUTS['summarization']:g}s."
+                    )
+                chunks.append(chunk)
+                yield _sse("token", {"text": chunk})
+        finally:
+            # Closes the model stream on a timeout or a client disconnect too.
+            await summary_stream.aclose()
+        final_answer = "".join(chunks).strip()
+        yield _sse("stage", {"stage": "summarization", "elapsed_seconds": elapsed()})
+
+        query_response = QueryResponse(
+            user_query=request.query,
+            final_answer=final_answer,
+            retrieved_docs=result['retrieved_docs'],
+            generated_sql=result['generated_sql'],
+            sql_results=sql_results,
+            sql_truncated=execution['truncated'],
+            sql_error=execution['error'],
+        )
+        yield _sse("done", query_response)
+        pipeline.record_latency(mode, elapsed(), result['sql_source'])
+        if _cacheable(result, final_answer):
+            await answer_cache.astore(request.query, request.k, jsonable_encoder(query_response), elapsed())
+
+    except HTTPException as e:
+        yield _sse("error", {"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        logger.exception("An unexpected error occurred in the streaming pipeline: %s", e)
+        yield _sse("error", {"status_code": 500, "detail": str(e)})
+    finally:
+        if pipeline_task is not None and not pipeline_task.done():
+            # The client went away mid-pipeline.
+            pipeline_task.cancel()
+
+@router.post("/query/stream")
+async def process_query_stream(request: QueryRequest):
+    """
+    Streaming variant of `/query` over Server-Sent Events. Intermediate
+    results (retrieved documents, SQL, SQL results) are sent as soon as they
+    exist and the answer is streamed token by token.
+    """
+    return StreamingResponse(
+        _query_event_stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --- NEW ENDPOINT FOR TIME-SERIES AT A SPECIFIC DEPTH ---
 @router.get(
     "/timeseries_at_depth/",
@@ -69,12 +222,28 @@ def get_timeseries_at_depth_endpoint(
     lng: float, 
     start_date: date, 
     end_date: date, 
-    depth: int  # The new required parameter
+    depth: int,  # The new required parameter
+    request: Request,
+    response: Response,
 ):
     """
     Calculates the grid_id and returns the time-series of avg_temperature
     and avg_salinity for a SINGLE specified depth.
+
+    Clients sending `Accept: application/vnd.apache.arrow.stream` or
+    `application/vnd.argo.columnar+json` get the series as columns instead.
     """
+    response.headers["Vary"] = "Accept"
+    fmt = columnar.negotiate(request.headers.get("accept"))
+    if fmt != 'json':
+        rows = argo_service.get_timeseries_at_depth_rows(lat, lng, start_date, end_date, depth)
+        metadata = {
+            'grid_id': rows[0]['grid_id'],
+            'latitude': rows[0]['latitude'],
+            'longitude': rows[0]['longitude'],
+            'depth': depth,
+        }
+        return columnar.columnar_response(columnar.timeseries_columns(rows), metadata, fmt)
     return argo_service.get_timeseries_at_depth_data(
         lat=lat, 
         lng=lng, 
@@ -83,27 +252,65 @@ def get_timeseries_at_depth_endpoint(
         depth=depth
     )
 
+@router.post(
+    "/timeseries_at_depth/batch",
+    response_model=TimeSeriesBatchResponse,
+    summary="Get time-series data for several points and depths at once"
+)
+def get_timeseries_batch_endpoint(request: TimeSeriesBatchRequest):
+    """
+    Returns one time-series per requested (lat, lng, depth) point, fetched
+    with a single database query.
+    """
+    return argo_service.get_timeseries_batch_data(
+        points=[{'lat': p.lat, 'lng': p.lng, 'depth': p.depth} for p in request.points],
+        start_date=request.start_date,
+        end_date=request.end_date,
+    )
+
 # Example endpoint in routes.py
 @router.get(
     "/depth_time_contour/",
     summary="Get depth-time contour data for temperature or salinity"
 )
 def get_depth_time_contour(
+    request: Request,
+    response: Response,
     lat: float,
     lng: float,
     start_date: date,
     end_date: date,
     variable: str = "temperature",
+    time_step_days: Optional[int] = Query(
+        None, ge=1, description="Average onto a regular time axis with this step (days)"
+    ),
 ):
     """
     Returns a matrix of values (temperature or salinity) for each depth and time.
+
+    Columnar clients (see /timeseries_at_depth/) get a `time` column plus one
+    column per depth, named after the depth in meters.
     """
+    response.headers["Vary"] = "Accept"
+    fmt = columnar.negotiate(request.headers.get("accept"))
+    if fmt != 'json':
+        contour = argo_service.get_depth_time_contour_arrays(
+            lat, lng, start_date, end_date, variable, time_step_days
+        )
+        metadata = {
+            'grid_id': contour['grid_id'],
+            'variable': contour['variable'],
+            'time_step_days': time_step_days,
+            'depths': contour['depths'].tolist(),
+        }
+        return columnar.columnar_response(columnar.contour_columns(contour), metadata, fmt)
     return argo_service.get_depth_time_contour_data(
         lat=lat,
         lng=lng,
         start_date=start_date,
         end_date=end_date,
         variable=variable,
+        time_step_days=time_step_days,
     )
 
 # --- NEW: Trajectory endpoint ---
@@ -111,7 +318,13 @@ def get_depth_time_contour(
 def get_trajectories(
     argo_ids: List[str] = Query(..., description="One or more Argo IDs; repeat param or comma-separated"),
     start_date: Optional[date] = None,
-    end_date: Optional[date] = None
+    end_date: Optional[date] = None,
+    zoom: Optional[int] = Query(
+        None, ge=0, le=22, description="Map zoom level; simplifies tracks to what is visible at it"
+    ),
+    time_step_days: Optional[int] = Query(
+        None, ge=1, description="Keep at most one point per this many days"
+    ),
 ):
     # Normalize: support comma-separated values in addition to repeated params
     normalized_ids: List[str] = []
@@ -119,7 +332,51 @@ def get_trajectories(
         parts = [p.strip() for p in raw.split(',') if p.strip()]
         for p in parts:
             normalized_ids.append('np.int64(' + p + ')')
-    return argo_service.get_trajectories_by_argo_ids(argo_ids=normalized_ids, start_date=start_date, end_date=end_date)
+    return argo_service.get_trajectories_by_argo_ids(
+        argo_ids=normalized_ids,
+        start_date=start_date,
+        end_date=end_date,
+        zoom=zoom,
+        time_step_days=time_step_days,
+    )
+
+# --- Bulk export ---
+@router.get("/export/{dataset}")
+def export_data(
+    dataset: str,
+    export_format: str = Query("csv", alias="format", description="csv, parquet or netcdf"),
+    min_lat: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    min_lon: Optional[float] = None,
+    max_lon: Optional[float] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    min_depth: Optional[int] = None,
+    max_depth: Optional[int] = None,
+):
+    """
+    Streams the 'surface' (average_ocean_profiles) or 'depth'
+    (argo_depth_ocean_profiles) table, filtered by bounding box, dates and
+    depth, as a downloadable file. Rows are read in chunks from a server-side
+    cursor, so exports of any size use bounded memory.
+    """
+    stream, media_type, filename = export_service.open_export(
+        dataset,
+        export_format,
+        min_lat=min_lat,
+        max_lat=max_lat,
+        min_lon=min_lon,
+        max_lon=max_lon,
+        start_date=start_date,
+        end_date=end_date,
+        min_depth=min_depth,
+        max_depth=max_depth,
+    )
+    return StreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @router.get("/debug/argo_ids")
 def debug_argo_ids():
@@ -137,4 +394,90 @@ def debug_argo_ids():
         results = execute_secure_query(sql, {})
         return {"sample_argo_float_ids": results}
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+@router.get("/debug/pool")
+def debug_pool():
+    """
+    Connection pool statistics for the PostgreSQL service: the main pool and
+    the read-only pool that runs generated and template SQL.
+    """
+    from ..services.postgres_service import get_pool_stats, get_readonly_pool_stats
+    return {'main': get_pool_stats(), 'readonly': get_readonly_pool_stats()}
+
+@router.get("/debug/llm_cache")
+def debug_llm_cache():
+    """Hit/miss counters and size of the persistent LLM response cache."""
+    from ..services.llm_cache import get_cache_stats
+    return get_cache_stats()
+
+@router.get("/debug/answer_cache")
+def debug_answer_cache():
+    """Hit rate and latency saved by the semantic answer cache."""
+    return answer_cache.get_cache_stats()
+
+@router.get("/debug/result_cache")
+def debug_result_cache():
+    """Hit/miss counters and memory use of the dashboard result cache."""
+    return result_cache.get_cache_stats()
+
+@router.get("/debug/result_digest")
+def debug_result_digest():
+    """How much the SQL results sent to the summarizer were compressed."""
+    return result_digest.get_digest_stats()
+
+@router.get("/debug/filter_parser")
+def debug_filter_parser():
+    """How often retrieval filters came from the rule-based parser instead of the LLM."""
+    from ..agents.filter_parser import get_parser_stats
+    return get_parser_stats()
+
+@router.get("/debug/sql_templates")
+def debug_sql_templates():
+    """How many chat questions were answered by a SQL template, per intent."""
+    return sql_templates.get_template_stats()
+
+@router.get("/debug/pipeline")
+def debug_pipeline():
+    """End-to-end latency of answered questions per pipeline mode."""
+    return pipeline.get_pipeline_stats()
+
+@router.get("/debug/llm_gateway")
+def debug_llm_gateway():
+    """Queue depth, wait times, retries and coalesced calls of the shared LLM gateway."""
+    from ..services.llm_gateway import get_gateway_stats
+    return get_gateway_stats()
+
+def _require_profile_access(request: Request):
+    """(Internal Helper) Rejects reads of profile reports without the profiling token."""
+    from ..services.profiler import can_read_reports, PROFILE_TOKEN_HEADER
+    if not can_read_reports(request.headers, request.query_params):
+        raise HTTPException(status_code=403, detail=f"Profile reports need a valid {PROFILE_TOKEN_HEADER} header.")
+
+@router.get("/debug/profiles")
+def debug_profiles(request: Request):
+    """Profiler settings and the most recent request profiles (see `X-Profile`)."""
+    from ..services.profiler import get_profiler_stats, list_reports
+    _require_profile_access(request)
+    return {**get_profiler_stats(), 'reports': list_reports()}
+
+@router.get("/debug/profiles/{profile_id}")
+def debug_profile(
+    request: Request,
+    profile_id: str,
+    report_format: str = Query("json", alias="format", description="json, or folded for flamegraph tools"),
+):
+    """
+    One request profile: wall time per category and function, or the raw
+    collapsed stacks for flamegraph.pl / speedscope with `format=folded`.
+    """
+    from ..services.profiler import get_report
+    _require_profile_access(request)
+    report = get_report(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"No profile '{profile_id}'.")
+    if report_format not in ("json", "folded"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'folded'")
+    if report_format == "folded":
+        return PlainTextResponse(report['folded'] + "\n")
+    return report
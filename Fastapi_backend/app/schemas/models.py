@@ -6,6 +6,7 @@ from datetime import date
 class QueryRequest(BaseModel):
     query: str
     k: int = 10 # Number of documents to retrieve, with a default value
+    mode: Optional[str] = None  # 'sequential', 'speculative' or 'combined'; defaults to RAG_PIPELINE_MODE
 
 # Pydantic model for the final, structured response
 class QueryResponse(BaseModel):
@@ -14,6 +15,8 @@ class QueryResponse(BaseModel):
     retrieved_docs: List[Dict[str, Any]]
     generated_sql: str
     sql_results: List[Dict[str, Any]]
+    sql_truncated: bool = False  # more rows matched than the row cap allowed
+    sql_error: Optional[Dict[str, Any]] = None  # set when the guardrails rejected or stopped the query
 
 
 # Represents a single data point in time
@@ -29,6 +32,31 @@ class TimeSeriesResponse(BaseModel):
     longitude: float
     profiles: List[TimeSeriesPoint]
 
+# --- Batch time-series ---
+class TimeSeriesLocation(BaseModel):
+    lat: float
+    lng: float
+    depth: int
+
+class TimeSeriesBatchRequest(BaseModel):
+    points: List[TimeSeriesLocation]
+    start_date: date
+    end_date: date
+
+# One series per requested point, in request order. Points without data
+# come back with empty profiles and no latitude/longitude.
+class TimeSeriesBatchItem(BaseModel):
+    lat: float
+    lng: float
+    depth: int
+    grid_id: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    profiles: List[TimeSeriesPoint]
+
+class TimeSeriesBatchResponse(BaseModel):
+    series: List[TimeSeriesBatchItem]
+
 
 # --- Trajectories ---
 class TrajectoryPoint(BaseModel):
@@ -40,6 +68,7 @@ class TrajectoryPoint(BaseModel):
 class TrajectorySeries(BaseModel):
     argo_id: str
     points: List[TrajectoryPoint]
+    total_points: Optional[int] = None  # points before simplification
 
 class TrajectoriesResponse(BaseModel):
     trajectories: List[TrajectorySeries]
\ No newline at end of file
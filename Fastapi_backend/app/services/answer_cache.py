@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import logging
+import time
+import asyncio
+import hashlib
+import threading
+import chromadb
+from dotenv import load_dotenv
+from typing import Optional, Dict, Any
+from .dataset_version import get_dataset_version
+from .llm_cache import normalize_query, LLMCache, CACHE_DIR
+from ..agents.filter_parser import parse_conditions, REGIONS, MONTHS, MONTH_ABBREVIATIONS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHROMA_HOST = os.getenv("CHROMA_HOST", 'localhost')
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", 8000))
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_COLLECTION = os.getenv("ANSWER_CACHE_COLLECTION", 'argo_answer_cache')
+# Cosine similarity a previous question needs to be answered from the cache.
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.92))
+# Responses (with their SQL rows) are kept here, keyed by the Chroma entry id;
+# Chroma only holds the question and small metadata.
+ANSWER_CACHE_PAYLOAD_PATH = os.getenv("ANSWER_CACHE_PAYLOAD_PATH") or os.path.join(CACHE_DIR, "answer_cache.sqlite3")
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 5000))
+# Answers older than this (seconds) are recomputed even if the dataset is unchanged.
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 86400))
+
+_NUMBER_TOKEN = re.compile(r"(-?\d+(?:\.\d+)?)\s*°?\s*([nsew])?\b")
+_MONTH_TOKEN = re.compile(r"\b(" + "|".join(sorted(list(MONTHS) + list(MONTH_ABBREVIATIONS), key=len, reverse=True)) + r")\b")
+
+_lock = threading.Lock()
+_collection = None
+_payloads = None
+_pruned_version = None
+_stats = {
+    'lookups': 0,
+    'hits': 0,
+    'misses': 0,
+    'stores': 0,
+    'errors': 0,
+    'missing_payloads': 0,
+    'total_seconds_saved': 0.0,
+    'total_lookup_seconds': 0.0,
+}
+
+
+def _get_collection():
+    global _collection
+    if _collection is None:
+        client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+        _collection = client.get_or_create_collection(
+            name=ANSWER_CACHE_COLLECTION, metadata={"hnsw:space": "cosine"}
+        )
+    return _collection
+
+
+def _get_payloads() -> LLMCache:
+    global _payloads
+    if _payloads is None:
+        with _lock:
+            if _payloads is None:
+                _payloads = LLMCache(
+                    ANSWER_CACHE_PAYLOAD_PATH, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL
+                )
+    return _payloads
+
+
+def query_entities(query: str) -> str:
+    """
+    Fingerprint of the things in a question that change its answer but not
+    its embedding much: the parsed filter conditions, every number (with a
+    hemisphere letter if one follows), month names and regions. A cached
+    answer is only served to a question with the same fingerprint, so
+    "... March 2023" never gets the answer to "... March 2022".
+    """
+    normalized = normalize_query(query)
+    months = {MONTHS.get(m) or MONTH_ABBREVIATIONS[m] for m in _MONTH_TOKEN.findall(normalized)}
+    entities = {
+        'conditions': sorted(json.dumps(c, sort_keys=True) for c in parse_conditions(query) or []),
+        'numbers': sorted({number + hemisphere for number, hemisphere in _NUMBER_TOKEN.findall(normalized)}),
+        'months': sorted(months),
+        'regions': sorted(region for region in REGIONS if region in normalized),
+    }
+    return hashlib.sha256(json.dumps(entities, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _prune_stale(collection, version: str):
+    """Removes answers computed against an older dataset (runs once per version)."""
+    global _pruned_version
+    if _pruned_version == version:
+        return
+    collection.delete(where={"dataset_version": {"$ne": version}})
+    _pruned_version = version
+
+
+def lookup(query: str, k: int) -> Optional[Dict[str, Any]]:
+    """
+    Finds the most similar previously answered question for the current
+    dataset version with the same entities (see `query_entities`), answered
+    within the last ANSWER_CACHE_TTL seconds. Returns a dict with the stored
+    `response`, the `similarity` and the `seconds_saved`, or None on a miss.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    start = time.perf_counter()
+    try:
+        version = get_dataset_version()
+        collection = _get_collection()
+        with _lock:
+            _prune_stale(collection, version)
+        entities = query_entities(query)
+        results = collection.query(
+            query_texts=[normalize_query(query)],
+            n_results=1,
+            where={"$and": [
+                {"dataset_version": {"$eq": version}}, {"k": {"$eq": k}}, {"entities": {"$eq": entities}},
+                {"created_at": {"$gte": time.time() - ANSWER_CACHE_TTL}},
+            ]},
+            include=['metadatas', 'distances']
+        )
+        payload = None
+        if results and results['ids'] and results['ids'][0]:
+            if 1.0 - results['distances'][0][0] >= ANSWER_CACHE_THRESHOLD:
+                payload = _get_payloads().get("answer", version, results['ids'][0][0])
+                if payload is None:
+                    with _lock:
+                        _stats['missing_payloads'] += 1
+    except Exception as e:
+        logger.warning("Answer cache lookup failed: %s", e)
+        with _lock:
+            _stats['errors'] += 1
+        return None
+
+    lookup_seconds = time.perf_counter() - start
+    hit = None
+    if results and results['metadatas'] and results['metadatas'][0]:
+        similarity = 1.0 - results['distances'][0][0]
+        metadata = results['metadatas'][0][0]
+        if payload is not None:
+            hit = {
+                'response': json.loads(payload),
+                'similarity': similarity,
+                'matched_query': metadata.get('query'),
+                'seconds_saved': max(0.0, metadata.get('pipeline_seconds', 0.0) - lookup_seconds),
+            }
+
+    with _lock:
+        _stats['lookups'] += 1
+        _stats['total_lookup_seconds'] += lookup_seconds
+        if hit:
+            _stats['hits'] += 1
+            _stats['total_seconds_saved'] += hit['seconds_saved']
+        else:
+            _stats['misses'] += 1
+    return hit
+
+
+def store(query: str, k: int, response: Dict[str, Any], pipeline_seconds: float):
+    """Saves a freshly computed answer under the current dataset version."""
+    if not ANSWER_CACHE_ENABLED:
+        return
+    try:
+        version = get_dataset_version()
+        normalized = normalize_query(query)
+        entry_id = hashlib.sha256(f"{version}|{k}|{normalized}".encode("utf-8")).hexdigest()
+        # The payload goes in first, so a Chroma entry never points at nothing.
+        _get_payloads().set("answer", version, entry_id, json.dumps(response))
+        _get_collection().upsert(
+            ids=[entry_id],
+            documents=[normalized],
+            metadatas=[{
+                'dataset_version': version,
+                'k': k,
+                'entities': query_entities(query),
+                'query': query,
+                'pipeline_seconds': pipeline_seconds,
+                'created_at': time.time(),
+            }]
+        )
+        with _lock:
+            _stats['stores'] += 1
+    except Exception as e:
+        logger.warning("Answer cache store failed: %s", e)
+        with _lock:
+            _stats['errors'] += 1
+
+
+async def alookup(query: str, k: int) -> Optional[Dict[str, Any]]:
+    return await asyncio.to_thread(lookup, query, k)
+
+
+async def astore(query: str, k: int, response: Dict[str, Any], pipeline_seconds: float):
+    await asyncio.to_thread(store, query, k, response, pipeline_seconds)
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+    stats.update({
+        'enabled': ANSWER_CACHE_ENABLED,
+        'threshold': ANSWER_CACHE_THRESHOLD,
+        'hit_rate': stats['hits'] / stats['lookups'] if stats['lookups'] else 0.0,
+        'avg_seconds_saved_per_hit': stats['total_seconds_saved'] / stats['hits'] if stats['hits'] else 0.0,
+        'avg_lookup_seconds': stats['total_lookup_seconds'] / stats['lookups'] if stats['lookups'] else 0.0,
+    })
+    return stats
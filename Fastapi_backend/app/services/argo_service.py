@@ -1,28 +1,62 @@
+import os
+import re
 import math
+import time
+import logging
+import threading
 from datetime import date
+import numpy as np
+from psycopg2 import errors as pg_errors
 from fastapi import HTTPException
-from . import postgres_service
+from . import postgres_service, result_cache
 from app.schemas.models import TimeSeriesResponse
 # Add TrajectoriesResponse to the import statement
-from app.schemas.models import TimeSeriesResponse, TrajectoriesResponse
-from typing import List, Dict, Any
+from app.schemas.models import TimeSeriesResponse, TrajectoriesResponse, TimeSeriesBatchResponse
+from typing import List, Dict, Any, Optional
 
-def get_timeseries_at_depth_data(
+logger = logging.getLogger(__name__)
+
+# Upper bound on the number of points in one batch time-series request.
+TIMESERIES_BATCH_MAX_POINTS = int(os.getenv("TIMESERIES_BATCH_MAX_POINTS", 50))
+
+def compute_grid_id(lat: float, lng: float) -> str:
+    """
+    Returns the id of the 2° x 2° grid cell containing (lat, lng), in the
+    same '<center_lat>_<center_lon>' format used by the tables.
+    """
+    grid_lat_size, grid_lon_size = 2.0, 2.0
+    grid_lat_center = math.floor(lat / grid_lat_size) * grid_lat_size + (grid_lat_size / 2)
+    grid_lon_center = math.floor(lng / grid_lon_size) * grid_lon_size + (grid_lon_size / 2)
+    return f"{grid_lat_center}_{grid_lon_center}"
+
+def _fetch_rows(cache_key: tuple, sql_query: str, params) -> List[Dict[str, Any]]:
+    """
+    (Internal Helper) Runs a dashboard query through the result cache.
+    `cache_key` must capture everything the query depends on; empty results
+    are cached too, so repeated clicks on empty cells don't reach Postgres.
+    """
+    def run():
+        return [dict(row) for row in postgres_service.execute_secure_query(sql_query, params)]
+
+    try:
+        return result_cache.cached(cache_key, run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database query failed: {e}")
+
+def get_timeseries_at_depth_rows(
     lat: float, 
     lng: float, 
     start_date: date, 
     end_date: date, 
     depth: int
-) -> TimeSeriesResponse:
+) -> List[Dict[str, Any]]:
     """
-    Calculates the grid_id and fetches the time-series data for a single,
+    Calculates the grid_id and fetches the time-series rows for a single,
     specified depth from the 'Argo_Depth_Ocean_Profiles' table.
+    Raises 404 when there are none.
     """
     # Calculate the target grid_id directly
-    grid_lat_size, grid_lon_size = 2.0, 2.0
-    grid_lat_center = math.floor(lat / grid_lat_size) * grid_lat_size + (grid_lat_size / 2)
-    grid_lon_center = math.floor(lng / grid_lon_size) * grid_lon_size + (grid_lon_size / 2)
-    target_grid_id = f"{grid_lat_center}_{grid_lon_center}"
+    target_grid_id = compute_grid_id(lat, lng)
 
     # This query gets the time-series for ONLY the specified depth
     sql_query = """
@@ -49,16 +83,29 @@ def get_timeseries_at_depth_data(
         'end_date': end_date
     }
 
-    try:
-        results = postgres_service.execute_secure_query(sql_query, params)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database query failed: {e}")
+    results = _fetch_rows(
+        ('timeseries', target_grid_id, depth, start_date, end_date), sql_query, params
+    )
 
     if not results:
         raise HTTPException(
             status_code=404, 
             detail=f"No data found for grid '{target_grid_id}' at depth {depth}m in the specified date range."
         )
+    return results
+
+def get_timeseries_at_depth_data(
+    lat: float, 
+    lng: float, 
+    start_date: date, 
+    end_date: date, 
+    depth: int
+) -> TimeSeriesResponse:
+    """
+    Calculates the grid_id and fetches the time-series data for a single,
+    specified depth from the 'Argo_Depth_Ocean_Profiles' table.
+    """
+    results = get_timeseries_at_depth_rows(lat, lng, start_date, end_date, depth)
 
     first_row = results[0]
     response_data = {
@@ -69,27 +116,179 @@ def get_timeseries_at_depth_data(
     }
     return TimeSeriesResponse(**response_data)
 
-def get_depth_time_contour_data(
+def get_timeseries_batch_data(
+    points: List[Dict[str, Any]],
+    start_date: date,
+    end_date: date,
+) -> TimeSeriesBatchResponse:
+    """
+    Time-series for several (lat, lng, depth) points in one round trip.
+
+    All grid_ids are resolved up front. Series already in the result cache
+    (shared with `get_timeseries_at_depth_data`) are reused, and the rest
+    are fetched together with a single query that joins the table against
+    the unnested (grid_id, depth) pairs.
+    """
+    if not points:
+        raise HTTPException(status_code=400, detail="No points provided")
+    if len(points) > TIMESERIES_BATCH_MAX_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {TIMESERIES_BATCH_MAX_POINTS} points can be requested at once.",
+        )
+
+    targets = [(compute_grid_id(p['lat'], p['lng']), p['depth']) for p in points]
+
+    series: Dict[tuple, List[Dict[str, Any]]] = {}
+    missing = []
+    for target in dict.fromkeys(targets):
+        rows = result_cache.get(('timeseries', target[0], target[1], start_date, end_date))
+        if rows is None:
+            missing.append(target)
+        else:
+            series[target] = rows
+
+    if missing:
+        sql_query = """
+            SELECT
+                p.grid_id,
+                p.depth,
+                p.latitude,
+                p.longitude,
+                p.time_period as time,
+                p.avg_temperature,
+                p.avg_salinity
+            FROM
+                unnest(%(grid_ids)s::text[], %(depths)s::int[]) AS q(grid_id, depth)
+                JOIN "argo_depth_ocean_profiles" p
+                  ON p.grid_id = q.grid_id AND p.depth = q.depth
+            WHERE
+                p.time_period BETWEEN %(start_date)s AND %(end_date)s
+            ORDER BY
+                p.grid_id, p.depth, p.time_period ASC;
+        """
+        params = {
+            'grid_ids': [grid_id for grid_id, _ in missing],
+            'depths': [depth for _, depth in missing],
+            'start_date': start_date,
+            'end_date': end_date,
+        }
+        try:
+            rows = postgres_service.execute_secure_query(sql_query, params)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database query failed: {e}")
+
+        fetched: Dict[tuple, List[Dict[str, Any]]] = {target: [] for target in missing}
+        for row in rows:
+            row = dict(row)
+            fetched[(row['grid_id'], row.pop('depth'))].append(row)
+        for target, target_rows in fetched.items():
+            result_cache.put(('timeseries', target[0], target[1], start_date, end_date), target_rows)
+        series.update(fetched)
+
+    items = []
+    for point, target in zip(points, targets):
+        rows = series[target]
+        items.append({
+            'lat': point['lat'],
+            'lng': point['lng'],
+            'depth': point['depth'],
+            'grid_id': target[0],
+            'latitude': rows[0]['latitude'] if rows else None,
+            'longitude': rows[0]['longitude'] if rows else None,
+            'profiles': rows,
+        })
+    return TimeSeriesBatchResponse(series=items)
+
+def contour_arrays(
+    rows: List[Dict[str, Any]],
+    column: str,
+    time_step_days: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """
+    Pivots (time, depth, value) rows into a depth x time matrix with NumPy,
+    in time linear in the number of rows.
+
+    Without `time_step_days` the time axis holds every distinct date in the
+    rows. With it, values are averaged into fixed bins of that many days
+    starting at `start_date` (default: first date) and running to `end_date`
+    (default: last date); empty bins are NaN.
+
+    Returns:
+        tuple: (datetime64[D] time axis, sorted int depths, float matrix of
+        shape [len(depths)][len(times)] with NaN for missing values)
+    """
+    times = np.array([r['time'] for r in rows], dtype='datetime64[D]')
+    depths = np.array([r['depth'] for r in rows], dtype=np.int64)
+    values = np.array([r[column] for r in rows], dtype=float)  # NULL -> NaN
+
+    unique_depths, depth_idx = np.unique(depths, return_inverse=True)
+
+    if time_step_days:
+        origin = np.datetime64(start_date, 'D') if start_date else times.min()
+        last = np.datetime64(end_date, 'D') if end_date else times.max()
+        n_bins = int((last - origin).astype(int) // time_step_days) + 1
+        time_idx = (times - origin).astype(int) // time_step_days
+        in_range = (time_idx >= 0) & (time_idx < n_bins) & ~np.isnan(values)
+
+        sums = np.zeros((len(unique_depths), n_bins))
+        counts = np.zeros((len(unique_depths), n_bins))
+        np.add.at(sums, (depth_idx[in_range], time_idx[in_range]), values[in_range])
+        np.add.at(counts, (depth_idx[in_range], time_idx[in_range]), 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            matrix = sums / counts
+        axis = origin + np.arange(n_bins) * np.timedelta64(time_step_days, 'D')
+    else:
+        axis, time_idx = np.unique(times, return_inverse=True)
+        matrix = np.full((len(unique_depths), len(axis)), np.nan)
+        matrix[depth_idx, time_idx] = values
+
+    return axis, unique_depths, matrix
+
+def build_contour_matrix(
+    rows: List[Dict[str, Any]],
+    column: str,
+    time_step_days: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """
+    JSON-ready version of `contour_arrays`.
+
+    Returns:
+        tuple: (times as ISO strings, sorted depths, matrix as nested lists
+        of float | None with shape [len(depths)][len(times)])
+    """
+    return _contour_to_lists(*contour_arrays(
+        rows, column, time_step_days=time_step_days, start_date=start_date, end_date=end_date
+    ))
+
+def _contour_to_lists(axis: np.ndarray, depths: np.ndarray, matrix: np.ndarray):
+    """(Internal Helper) Converts contour arrays to ISO dates and nested lists with None for NaN."""
+    missing = np.isnan(matrix)
+    matrix = matrix.astype(object)
+    matrix[missing] = None
+    return np.datetime_as_string(axis, unit='D').tolist(), depths.tolist(), matrix.tolist()
+
+def get_depth_time_contour_arrays(
     lat: float,
     lng: float,
     start_date: date,
     end_date: date,
     variable: str = "temperature",
+    time_step_days: Optional[int] = None,
 ) -> Dict[str, Any]:
     """
-    Build a depth-time temperature contour dataset for a given grid cell
-    between start_date and end_date.
+    Depth-time contour for a grid cell as NumPy arrays (see `contour_arrays`),
+    for serializers that don't go through nested JSON lists.
 
-    Returns dict with keys:
-      - times: List[date string]
-      - depths: List[int]
-      - temperature_matrix: List[List[float | None]] with shape [len(depths)][len(times)]
+    Returns dict with keys: grid_id, variable, time_step_days, times
+    (datetime64[D]), depths (int array), matrix (float array, NaN = missing)
     """
     # Calculate the target grid_id
-    grid_lat_size, grid_lon_size = 2.0, 2.0
-    grid_lat_center = math.floor(lat / grid_lat_size) * grid_lat_size + (grid_lat_size / 2)
-    grid_lon_center = math.floor(lng / grid_lon_size) * grid_lon_size + (grid_lon_size / 2)
-    target_grid_id = f"{grid_lat_center}_{grid_lon_center}"
+    target_grid_id = compute_grid_id(lat, lng)
 
     # Validate variable
     variable = variable.lower()
@@ -119,10 +318,9 @@ def get_depth_time_contour_data(
         'end_date': end_date,
     }
 
-    try:
-        rows = postgres_service.execute_secure_query(sql_query.format(column=column), params)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database query failed: {e}")
+    rows = _fetch_rows(
+        ('contour', target_grid_id, column, start_date, end_date), sql_query.format(column=column), params
+    )
 
     if not rows:
         raise HTTPException(
@@ -132,71 +330,116 @@ def get_depth_time_contour_data(
             ),
         )
 
-    # Collect unique sorted times and depths
-    unique_times: List[date] = []
-    unique_depths_set = set()
-    for r in rows:
-        t = r['time']
-        if t not in unique_times:
-            unique_times.append(t)
-        unique_depths_set.add(r['depth'])
-    unique_depths: List[int] = sorted(unique_depths_set)
-
-    # Create map (depth -> index) and (time -> index)
-    time_to_idx: Dict[date, int] = {t: i for i, t in enumerate(unique_times)}
-    depth_to_idx: Dict[int, int] = {d: i for i, d in enumerate(unique_depths)}
-
-    # Initialize matrix with None
-    matrix: List[List[Any]] = [
-        [None for _ in range(len(unique_times))] for _ in range(len(unique_depths))
-    ]
+    axis, unique_depths, matrix = contour_arrays(
+        rows, column, time_step_days=time_step_days, start_date=start_date, end_date=end_date
+    )
+    return {
+        'grid_id': target_grid_id,
+        'variable': variable,
+        'time_step_days': time_step_days,
+        'times': axis,
+        'depths': unique_depths,
+        'matrix': matrix,
+    }
 
-    # Fill matrix
-    for r in rows:
-        ti = time_to_idx[r['time']]
-        di = depth_to_idx[r['depth']]
-        matrix[di][ti] = r[column]
+def get_depth_time_contour_data(
+    lat: float,
+    lng: float,
+    start_date: date,
+    end_date: date,
+    variable: str = "temperature",
+    time_step_days: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Build a depth-time temperature contour dataset for a given grid cell
+    between start_date and end_date, optionally regridded to a fixed time
+    step of `time_step_days` days.
 
-    # Convert dates to ISO strings for JSON
-    times_str: List[str] = [t.isoformat() for t in unique_times]
+    Returns dict with keys:
+      - times: List[date string]
+      - depths: List[int]
+      - matrix: List[List[float | None]] with shape [len(depths)][len(times)]
+    """
+    contour = get_depth_time_contour_arrays(lat, lng, start_date, end_date, variable, time_step_days)
+    times_str, unique_depths, matrix = _contour_to_lists(contour['times'], contour['depths'], contour['matrix'])
 
     return {
-        'grid_id': target_grid_id,
+        'grid_id': contour['grid_id'],
         'times': times_str,
         'depths': unique_depths,
-        'variable': variable,
+        'variable': contour['variable'],
+        'time_step_days': time_step_days,
         'matrix': matrix,
     }
 
 
-def get_trajectories_by_argo_ids(argo_ids: list, start_date: date = None, end_date: date = None) -> TrajectoriesResponse:
-    """
-    Fetch trajectory points (time, lat, lon) for each provided Argo float ID
-    from the surface-level table where `argo_float_ids` contains that ID.
+# Built by build_float_index.py, which ingest_data.py runs after every ingest.
+FLOAT_MEMBERSHIP_TABLE = "argo_float_membership"
+# Seconds between checks that the membership table still matches its source.
+FLOAT_MEMBERSHIP_CHECK_TTL = float(os.getenv("FLOAT_MEMBERSHIP_CHECK_TTL", 300))
+# Same fingerprint build_float_index.py stores as the table comment.
+_MEMBERSHIP_STATE_SQL = f"""
+    SELECT obj_description(to_regclass('{FLOAT_MEMBERSHIP_TABLE}'), 'pg_class') AS built,
+           (SELECT COUNT(*)::text || '|' || COALESCE(MAX("TIME")::text, '')
+            FROM "average_ocean_profiles") AS source
+"""
+# Simplified trajectories may deviate from the real track by this many screen pixels.
+TRAJECTORY_TOLERANCE_PX = float(os.getenv("TRAJECTORY_TOLERANCE_PX", 1.0))
+_membership_lock = threading.Lock()
+_membership_current = False
+_membership_checked_at = None
 
-    The `Average_Ocean_Profiles` schema provided has columns:
-    TIME (date), grid_id (text), latitude (float8), longitude (float8),
-    avg_temperature (float8), avg_salinity (float8), argo_float_ids (jsonb)
-
-    We query rows where the jsonb array contains the given argo_id.
+def parse_float_id(argo_id: str) -> Optional[int]:
     """
-    if not argo_ids:
-        raise HTTPException(status_code=400, detail="No argo_ids provided")
+    Extracts the numeric float id from '2901861' or 'np.int64(2901861)'.
+    Returns None for anything else.
+    """
+    match = re.fullmatch(r"\s*(?:np\.int64\(\s*)?(\d+)\s*\)?\s*", argo_id)
+    return int(match.group(1)) if match else None
 
-    # Single query: expand comma-separated text into rows and filter via ANY(list)
-    date_filter_clauses = []
-    params: list = [argo_ids]  # psycopg2 adapts Python list to SQL array for ANY
+def _date_filter(column: str, start_date: Optional[date], end_date: Optional[date], params: list) -> str:
+    """(Internal Helper) Appends optional date bounds to `params` and returns the SQL for them."""
+    clauses = []
     if start_date is not None:
-        date_filter_clauses.append("\"TIME\" >= %s")
+        clauses.append(f"{column} >= %s")
         params.append(start_date)
     if end_date is not None:
-        date_filter_clauses.append("\"TIME\" <= %s")
+        clauses.append(f"{column} <= %s")
         params.append(end_date)
-    date_filter_sql = (" AND " + " AND ".join(date_filter_clauses)) if date_filter_clauses else ""
+    return (" AND " + " AND ".join(clauses)) if clauses else ""
 
+def _membership_trajectory_rows(float_ids: List[int], start_date: date = None, end_date: date = None):
+    """
+    (Internal Helper) Trajectory points from the normalized membership table,
+    an index lookup on (float_id, time).
+    """
+    params: list = [float_ids]
     sql_query = (
+        f"""
+        SELECT float_id,
+               time,
+               latitude,
+               longitude,
+               grid_id
+        FROM {FLOAT_MEMBERSHIP_TABLE}
+        WHERE float_id = ANY(%s)
+        """
+        + _date_filter("time", start_date, end_date, params) +
+        """
+        ORDER BY time ASC, float_id ASC
         """
-        SELECT btrim(elem) AS argo_id,
+    )
+    return postgres_service.execute_secure_query(sql_query, params)
+
+def _legacy_trajectory_rows(float_ids: List[int], start_date: date = None, end_date: date = None):
+    """
+    (Internal Helper) Trajectory points found by unpacking `argo_float_ids`
+    on every row of the surface table. Used while the membership table is missing or stale.
+    """
+    params: list = [[f"np.int64({float_id})" for float_id in float_ids]]
+    sql_query = (
+        """
+        SELECT substring(replace(btrim(elem), 'np.int64', '') FROM '[0-9]+')::bigint AS float_id,
                "TIME" as time,
                latitude,
                longitude,
@@ -210,27 +453,201 @@ def get_trajectories_by_argo_ids(argo_ids: list, start_date: date = None, end_da
         ) AS elem
         WHERE btrim(elem) = ANY(%s)
         """
-        + date_filter_sql +
+        + _date_filter('"TIME"', start_date, end_date, params) +
         """
-        ORDER BY "TIME" ASC
+        ORDER BY "TIME" ASC, float_id ASC
         """
     )
+    return postgres_service.execute_secure_query(sql_query, params)
 
-    try:
-        rows = postgres_service.execute_secure_query(sql_query, params)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database query failed: {e}")
+def _membership_is_current() -> bool:
+    """
+    (Internal Helper) True if the membership table exists and was built from
+    the current contents of the surface table. Re-checked at most every
+    FLOAT_MEMBERSHIP_CHECK_TTL seconds.
+    """
+    global _membership_current, _membership_checked_at
+    now = time.monotonic()
+    with _membership_lock:
+        if _membership_checked_at is not None and now - _membership_checked_at < FLOAT_MEMBERSHIP_CHECK_TTL:
+            return _membership_current
+        state = postgres_service.execute_secure_query(_MEMBERSHIP_STATE_SQL)[0]
+        current = state['built'] is not None and state['built'] == state['source']
+        if not current and (_membership_current or _membership_checked_at is None):
+            logger.warning(
+                "'%s' is missing or older than average_ocean_profiles; run build_float_index.py. "
+                "Scanning argo_float_ids instead.", FLOAT_MEMBERSHIP_TABLE
+            )
+        _membership_current, _membership_checked_at = current, now
+        return current
+
+def _fetch_trajectory_rows(float_ids: List[int], start_date: date = None, end_date: date = None):
+    """
+    (Internal Helper) Raw trajectory rows for `float_ids`, from the membership
+    table when it matches the surface table and from the legacy scan otherwise.
+    """
+    global _membership_checked_at
+    if _membership_is_current():
+        try:
+            rows = _membership_trajectory_rows(float_ids, start_date, end_date)
+            return [dict(row) for row in rows]
+        except pg_errors.UndefinedTable:
+            # Dropped since the last check.
+            with _membership_lock:
+                _membership_checked_at = None
+    rows = _legacy_trajectory_rows(float_ids, start_date, end_date)
+    return [dict(row) for row in rows]
 
-    # Group by argo_id
-    id_to_points = {}
+def _group_points(rows: List[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+    """(Internal Helper) Groups time-ordered rows into per-float point lists."""
+    tracks: Dict[int, List[Dict[str, Any]]] = {}
     for row in rows:
-        key = row["argo_id"]
-        id_to_points.setdefault(key, []).append({
+        tracks.setdefault(row["float_id"], []).append({
             "time": row["time"],
             "latitude": row["latitude"],
             "longitude": row["longitude"],
             "grid_id": row["grid_id"],
         })
+    return tracks
+
+def zoom_tolerance(zoom: int) -> float:
+    """Degrees covered by TRAJECTORY_TOLERANCE_PX pixels on a 256px-tile web map at `zoom`."""
+    return TRAJECTORY_TOLERANCE_PX * 360.0 / (256 * 2 ** zoom)
+
+def decimate_by_time(times: np.ndarray, time_step_days: int) -> np.ndarray:
+    """
+    Keeps the first point in every `time_step_days`-day bin, plus the last
+    point. Returns a boolean mask over `times` (sorted datetime64[D]).
+    """
+    keep = np.zeros(len(times), dtype=bool)
+    if len(times) == 0:
+        return keep
+    bins = (times - times[0]).astype(int) // time_step_days
+    _, first_in_bin = np.unique(bins, return_index=True)
+    keep[first_in_bin] = True
+    keep[-1] = True
+    return keep
 
-    trajectories = [{"argo_id": k, "points": v} for k, v in id_to_points.items()]
-    return TrajectoriesResponse(trajectories=trajectories)
\ No newline at end of file
+def douglas_peucker(lats: np.ndarray, lons: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker line simplification in the lon/lat plane. Returns a boolean
+    mask of the vertices to keep; the end points are always kept.
+    """
+    n = len(lats)
+    keep = np.ones(n, dtype=bool)
+    if n < 3 or tolerance <= 0:
+        return keep
+    keep[1:-1] = False
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        x0, y0 = lons[first], lats[first]
+        dx, dy = lons[last] - x0, lats[last] - y0
+        xs, ys = lons[first + 1:last] - x0, lats[first + 1:last] - y0
+        norm = math.hypot(dx, dy)
+        if norm == 0:
+            distances = np.hypot(xs, ys)
+        else:
+            distances = np.abs(xs * dy - ys * dx) / norm
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+def simplify_points(points: List[Dict[str, Any]], zoom: Optional[int], time_step_days: Optional[int]):
+    """(Internal Helper) Applies temporal decimation, then zoom-based simplification, to one track."""
+    if len(points) < 3:
+        return points
+    if time_step_days:
+        times = np.array([p["time"] for p in points], dtype='datetime64[D]')
+        points = [p for p, kept in zip(points, decimate_by_time(times, time_step_days)) if kept]
+    if zoom is not None:
+        lats = np.array([p["latitude"] for p in points], dtype=float)
+        lons = np.array([p["longitude"] for p in points], dtype=float)
+        points = [p for p, kept in zip(points, douglas_peucker(lats, lons, zoom_tolerance(zoom))) if kept]
+    return points
+
+def get_trajectories_by_argo_ids(
+    argo_ids: list,
+    start_date: date = None,
+    end_date: date = None,
+    zoom: Optional[int] = None,
+    time_step_days: Optional[int] = None,
+) -> TrajectoriesResponse:
+    """
+    Fetch trajectory points (time, lat, lon) for each provided Argo float ID.
+
+    IDs may be plain numbers or in the 'np.int64(<id>)' form stored in
+    `average_ocean_profiles`; each trajectory's `argo_id` echoes the ID as
+    it was requested. Points come from the `argo_float_membership` table,
+    falling back to scanning `average_ocean_profiles.argo_float_ids` while
+    that table is missing or older than the surface table.
+
+    With `time_step_days`, at most one point per that many days is kept.
+    With `zoom` (web-map zoom level), tracks are simplified with
+    Douglas-Peucker to what is distinguishable at that zoom. Simplified tracks
+    are cached per float and level, so panning over the same floats is cheap.
+    """
+    if not argo_ids:
+        raise HTTPException(status_code=400, detail="No argo_ids provided")
+
+    requested: Dict[int, str] = {}
+    for argo_id in argo_ids:
+        float_id = parse_float_id(argo_id)
+        if float_id is not None:
+            requested.setdefault(float_id, argo_id)
+    float_ids = sorted(requested)
+
+    tracks: Dict[int, Dict[str, Any]] = {}
+    try:
+        if zoom is None and not time_step_days:
+            rows = []
+            if float_ids:
+                rows = result_cache.cached(
+                    ('trajectories', tuple(float_ids), start_date, end_date),
+                    lambda: _fetch_trajectory_rows(float_ids, start_date, end_date),
+                )
+            tracks = {
+                float_id: {"points": points, "total_points": len(points)}
+                for float_id, points in _group_points(rows).items()
+            }
+        else:
+            missing = []
+            for float_id in float_ids:
+                track = result_cache.get(('track', float_id, zoom, time_step_days, start_date, end_date))
+                if track is None:
+                    missing.append(float_id)
+                else:
+                    tracks[float_id] = track
+            if missing:
+                raw = _group_points(_fetch_trajectory_rows(missing, start_date, end_date))
+                for float_id in missing:
+                    points = raw.get(float_id, [])
+                    track = {
+                        "points": simplify_points(points, zoom, time_step_days),
+                        "total_points": len(points),
+                    }
+                    result_cache.put(('track', float_id, zoom, time_step_days, start_date, end_date), track)
+                    tracks[float_id] = track
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database query failed: {e}")
+
+    # Floats in order of their first fix, as before.
+    ordered = sorted(
+        (float_id for float_id, track in tracks.items() if track["points"]),
+        key=lambda float_id: (tracks[float_id]["points"][0]["time"], float_id),
+    )
+    trajectories = [
+        {
+            "argo_id": requested[float_id],
+            "points": tracks[float_id]["points"],
+            "total_points": tracks[float_id]["total_points"],
+        }
+        for float_id in ordered
+    ]
+    return TrajectoriesResponse(trajectories=trajectories)
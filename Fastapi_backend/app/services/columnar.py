@@ -0,0 +1,126 @@
+import json
+import numpy as np
+from fastapi import Response
+from typing import Any, Dict, Optional
+from . import metrics
+
+# Optional dependency: without it, Arrow is simply never negotiated.
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.argo.columnar+json"
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    Picks the response format from an Accept header: 'arrow', 'columnar' or
+    'json' (the default, also for */* and anything unrecognized). Media
+    ranges are tried in order of their q-value.
+    """
+    if not accept:
+        return 'json'
+    ranges = []
+    for position, part in enumerate(accept.split(',')):
+        media_type, *options = [item.strip() for item in part.split(';')]
+        q = 1.0
+        for option in options:
+            if option.startswith('q='):
+                try:
+                    q = float(option[2:])
+                except ValueError:
+                    q = 0.0
+        ranges.append((-q, position, media_type.lower()))
+    for neg_q, _, media_type in sorted(ranges):
+        if neg_q == 0:
+            break
+        if media_type == ARROW_MEDIA_TYPE and pa is not None:
+            return 'arrow'
+        if media_type == COLUMNAR_JSON_MEDIA_TYPE:
+            return 'columnar'
+        if media_type in ('application/json', 'application/*', '*/*'):
+            return 'json'
+    return 'json'
+
+
+def _dtype_name(values: np.ndarray) -> str:
+    if np.issubdtype(values.dtype, np.datetime64):
+        return 'date'
+    if np.issubdtype(values.dtype, np.integer):
+        return 'int64'
+    if np.issubdtype(values.dtype, np.floating):
+        return 'float64'
+    return 'string'
+
+
+def _json_values(values: np.ndarray) -> list:
+    """(Internal Helper) A column as a JSON-ready list: ISO dates, None for NaN."""
+    if np.issubdtype(values.dtype, np.datetime64):
+        return np.datetime_as_string(values, unit='D').tolist()
+    if np.issubdtype(values.dtype, np.floating):
+        missing = np.isnan(values)
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = None
+    return values.tolist()
+
+
+def encode_columnar_json(columns: Dict[str, np.ndarray], metadata: Dict[str, Any]) -> bytes:
+    """
+    Compact JSON with one typed array per column:
+    {"metadata": {...}, "length": n, "dtypes": {...}, "columns": {"name": [...]}}
+    """
+    length = len(next(iter(columns.values()))) if columns else 0
+    payload = {
+        'metadata': metadata,
+        'length': length,
+        'dtypes': {name: _dtype_name(values) for name, values in columns.items()},
+        'columns': {name: _json_values(values) for name, values in columns.items()},
+    }
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def encode_arrow(columns: Dict[str, np.ndarray], metadata: Dict[str, Any]) -> bytes:
+    """Arrow IPC stream with a single record batch; `metadata` goes into the schema as JSON."""
+    arrays = {
+        name: pa.array(values.astype('datetime64[D]') if _dtype_name(values) == 'date' else values,
+                       from_pandas=True)
+        for name, values in columns.items()
+    }
+    table = pa.table(arrays).replace_schema_metadata(
+        {key: json.dumps(value) for key, value in metadata.items()}
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def columnar_response(columns: Dict[str, np.ndarray], metadata: Dict[str, Any], fmt: str) -> Response:
+    """Serializes `columns` in the negotiated non-default format."""
+    with metrics.span("columnar_encode") as span:
+        if fmt == 'arrow':
+            body, media_type = encode_arrow(columns, metadata), ARROW_MEDIA_TYPE
+        else:
+            body, media_type = encode_columnar_json(columns, metadata), COLUMNAR_JSON_MEDIA_TYPE
+        span.set(bytes=len(body))
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+
+
+def timeseries_columns(rows) -> Dict[str, np.ndarray]:
+    """Time-series rows (time, avg_temperature, avg_salinity) as NumPy columns."""
+    return {
+        'time': np.array([r['time'] for r in rows], dtype='datetime64[D]'),
+        'avg_temperature': np.array([r['avg_temperature'] for r in rows], dtype=float),
+        'avg_salinity': np.array([r['avg_salinity'] for r in rows], dtype=float),
+    }
+
+
+def contour_columns(contour: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """A contour (see `argo_service.get_depth_time_contour_arrays`) as a time column plus one column per depth."""
+    columns = {'time': contour['times']}
+    for depth, values in zip(contour['depths'].tolist(), contour['matrix']):
+        columns[str(depth)] = values
+    return columns
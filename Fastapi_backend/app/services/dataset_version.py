@@ -0,0 +1,57 @@
+import os
+import time
+import logging
+import threading
+import chromadb
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHROMA_HOST = os.getenv("CHROMA_HOST", 'localhost')
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", 8000))
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", 'argo_profiles')
+DATASET_VERSION_TTL = float(os.getenv("DATASET_VERSION_TTL", 30))  # seconds between refreshes
+
+# Written by ingest_data.py into the profile collection's metadata after every run.
+DATASET_VERSION_KEY = "dataset_version"
+UNVERSIONED = "unversioned"
+
+_lock = threading.Lock()
+_client = None
+_version = None
+_checked_at = 0.0
+
+
+def _fetch_version() -> str:
+    global _client
+    if _client is None:
+        _client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+    metadata = _client.get_collection(name=COLLECTION_NAME).metadata or {}
+    return str(metadata.get(DATASET_VERSION_KEY, UNVERSIONED))
+
+
+def get_dataset_version() -> str:
+    """
+    Returns the token that identifies the currently ingested dataset.
+    Caches derived from the data compare against it to detect re-ingestion.
+    The value is re-read from Chroma at most every DATASET_VERSION_TTL seconds.
+    """
+    global _version, _checked_at
+    now = time.monotonic()
+    if _version is not None and now - _checked_at < DATASET_VERSION_TTL:
+        return _version
+    with _lock:
+        if _version is None or now - _checked_at >= DATASET_VERSION_TTL:
+            try:
+                new_version = _fetch_version()
+                if _version is not None and new_version != _version:
+                    logger.info("Dataset version changed: %s -> %s", _version, new_version)
+                _version = new_version
+            except Exception as e:
+                logger.warning("Could not read the dataset version from ChromaDB: %s", e)
+                if _version is None:
+                    _version = UNVERSIONED
+            _checked_at = now
+    return _version
@@ -0,0 +1,270 @@
+import io
+import os
+import csv
+import time
+import uuid
+import logging
+import tempfile
+from datetime import date
+import numpy as np
+from fastapi import HTTPException
+from dotenv import load_dotenv
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from . import postgres_service, metrics
+
+# Optional dependencies: only the export formats that need them are disabled.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# --- Export Configuration ---
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", 50000))  # rows per server-side cursor fetch
+EXPORT_FILE_BLOCK_BYTES = 1024 * 1024  # block size when streaming a finished temp file
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'netcdf': ('application/x-netcdf', 'nc'),
+}
+
+# dataset -> (table, time column, selected columns, has depth)
+EXPORT_DATASETS = {
+    'surface': (
+        'average_ocean_profiles',
+        '"TIME"',
+        ['"TIME" AS time', 'grid_id', 'latitude', 'longitude', 'avg_temperature', 'avg_salinity', 'argo_float_ids'],
+        False,
+    ),
+    'depth': (
+        'argo_depth_ocean_profiles',
+        'time_period',
+        ['time_period AS time', 'grid_id', 'depth', 'latitude', 'longitude', 'avg_temperature', 'avg_salinity'],
+        True,
+    ),
+}
+
+
+def _build_export_query(dataset: str, filters: Dict[str, Any]) -> Tuple[str, Dict[str, Any], List[str]]:
+    """(Internal Helper) Returns the parameterized SQL, its params and the output column names."""
+    table, time_column, columns, has_depth = EXPORT_DATASETS[dataset]
+    clauses = []
+    params: Dict[str, Any] = {}
+    bounds = [
+        ('min_lat', 'latitude >= %(min_lat)s'),
+        ('max_lat', 'latitude <= %(max_lat)s'),
+        ('min_lon', 'longitude >= %(min_lon)s'),
+        ('max_lon', 'longitude <= %(max_lon)s'),
+        ('start_date', f'{time_column} >= %(start_date)s'),
+        ('end_date', f'{time_column} <= %(end_date)s'),
+    ]
+    if has_depth:
+        bounds += [('min_depth', 'depth >= %(min_depth)s'), ('max_depth', 'depth <= %(max_depth)s')]
+    for name, clause in bounds:
+        if filters.get(name) is not None:
+            clauses.append(clause)
+            params[name] = filters[name]
+
+    sql_query = f'SELECT {", ".join(columns)} FROM "{table}"'
+    if clauses:
+        sql_query += " WHERE " + " AND ".join(clauses)
+    sql_query += f" ORDER BY {time_column}, grid_id" + (", depth" if has_depth else "")
+    names = [column.split(' AS ')[-1].strip('"') for column in columns]
+    return sql_query, params, names
+
+
+def _iter_row_chunks(sql_query: str, params: Dict[str, Any]) -> Iterator[List[tuple]]:
+    """
+    (Internal Helper) Yields result rows in chunks of EXPORT_CHUNK_ROWS through a
+    server-side (named) cursor, so only one chunk is ever held in memory.
+    The pooled connection is held until the generator is exhausted or closed.
+    The `export_query` span counts only the database time, not the time the
+    consumer spends encoding each chunk.
+    """
+    span = metrics.Span("export_query")
+    with postgres_service.get_connection() as conn:
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = EXPORT_CHUNK_ROWS
+            start = time.perf_counter()
+            cursor.execute(sql_query, params)
+            total = 0
+            while True:
+                rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+                span.seconds += time.perf_counter() - start
+                if not rows:
+                    break
+                total += len(rows)
+                yield rows
+                start = time.perf_counter()
+            span.set(rows=total)
+            metrics.record(span)
+            logger.info("Exported %d rows.", total)
+
+
+def _csv_stream(chunks: Iterator[List[tuple]], names: List[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the caller in pieces."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _arrow_schema(names: List[str]):
+    types = {'time': pa.date32(), 'grid_id': pa.string(), 'argo_float_ids': pa.string(), 'depth': pa.int32()}
+    return pa.schema([(name, types.get(name, pa.float64())) for name in names])
+
+
+def _arrow_table(rows: List[tuple], schema):
+    columns = list(zip(*rows))
+    return pa.table(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+    )
+
+
+def _parquet_stream(chunks: Iterator[List[tuple]], names: List[str]) -> Iterator[bytes]:
+    """Writes one Parquet row group per chunk and yields the bytes as they are produced."""
+    schema = _arrow_schema(names)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in chunks:
+        writer.write_table(_arrow_table(rows, schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _netcdf_stream(chunks: Iterator[List[tuple]], names: List[str]) -> Iterator[bytes]:
+    """
+    NetCDF needs a seekable file, so chunks are appended along an unlimited
+    'obs' dimension in a temporary file, which is then streamed and deleted.
+    Memory stays bounded by one chunk; disk use by the size of the export.
+    """
+    handle, path = tempfile.mkstemp(suffix=".nc")
+    os.close(handle)
+    try:
+        with netCDF4.Dataset(path, "w", format="NETCDF4") as nc:
+            nc.createDimension("obs", None)
+            time_var = nc.createVariable("time", "i4", ("obs",))
+            time_var.units = "days since 1970-01-01"
+            time_var.calendar = "standard"
+            variables = {"time": time_var}
+            for name in names:
+                if name == "time":
+                    continue
+                if name in ("grid_id", "argo_float_ids"):
+                    variables[name] = nc.createVariable(name, str, ("obs",))
+                elif name == "depth":
+                    variables[name] = nc.createVariable(name, "i4", ("obs",))
+                    variables[name].units = "m"
+                else:
+                    variables[name] = nc.createVariable(name, "f8", ("obs",), fill_value=np.nan)
+            offset = 0
+            for rows in chunks:
+                columns = dict(zip(names, zip(*rows)))
+                end = offset + len(rows)
+                for name, variable in variables.items():
+                    values = columns[name]
+                    if name == "time":
+                        values = np.array(values, dtype="datetime64[D]").astype("i4")
+                    elif variable.dtype == str:
+                        values = np.array(["" if v is None else str(v) for v in values], dtype=object)
+                    elif name == "depth":
+                        values = np.array(values, dtype="i4")
+                    else:
+                        values = np.array(values, dtype="f8")
+                    variable[offset:end] = values
+                offset = end
+
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(EXPORT_FILE_BLOCK_BYTES)
+                if not block:
+                    break
+                yield block
+    finally:
+        os.remove(path)
+
+
+def open_export(
+    dataset: str,
+    export_format: str,
+    min_lat: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    min_lon: Optional[float] = None,
+    max_lon: Optional[float] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    min_depth: Optional[int] = None,
+    max_depth: Optional[int] = None,
+) -> Tuple[Iterator[bytes], str, str]:
+    """
+    Validates an export request and returns (byte stream, media type, filename).
+    Nothing is read from the database until the stream is iterated.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=400, detail=f"dataset must be one of {sorted(EXPORT_DATASETS)}")
+    export_format = export_format.lower()
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(EXPORT_FORMATS)}")
+    if export_format == 'parquet' and pq is None:
+        raise HTTPException(status_code=501, detail="Parquet export requires the 'pyarrow' package.")
+    if export_format == 'netcdf' and netCDF4 is None:
+        raise HTTPException(status_code=501, detail="NetCDF export requires the 'netCDF4' package.")
+    if (min_depth is not None or max_depth is not None) and not EXPORT_DATASETS[dataset][3]:
+        raise HTTPException(status_code=400, detail="Depth filters only apply to the 'depth' dataset.")
+
+    filters = {
+        'min_lat': min_lat, 'max_lat': max_lat, 'min_lon': min_lon, 'max_lon': max_lon,
+        'start_date': start_date, 'end_date': end_date, 'min_depth': min_depth, 'max_depth': max_depth,
+    }
+    sql_query, params, names = _build_export_query(dataset, filters)
+    chunks = _iter_row_chunks(sql_query, params)
+
+    if export_format == 'csv':
+        stream = _csv_stream(chunks, names)
+    elif export_format == 'parquet':
+        stream = _parquet_stream(chunks, names)
+    else:
+        stream = _netcdf_stream(chunks, names)
+
+    media_type, extension = EXPORT_FORMATS[export_format]
+    return stream, media_type, f"argo_{dataset}.{extension}"
@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+from typing import Optional, Dict, Any
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# --- Cache Configuration ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Local cache files live under CACHE_DIR (default: Fastapi_backend/.cache), not the working directory.
+CACHE_DIR = os.getenv("CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), ".cache"
+)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH") or os.path.join(CACHE_DIR, "llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))  # seconds
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizes a user question for cache keys: case, surrounding whitespace,
+    repeated spaces and trailing punctuation don't change the answer.
+    """
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+def prompt_version(*parts: str) -> str:
+    """
+    Fingerprints a prompt template (plus model name). Any edit to the template
+    produces a new version, which invalidates the entries cached under the old one.
+    """
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class LLMCache:
+    """
+    Disk-backed (SQLite) cache for LLM responses with LRU eviction and a TTL.
+
+    Entries are stored per namespace (one per agent call) together with the
+    prompt version they were produced by, so they survive restarts but not
+    prompt changes.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 ttl: float = LLM_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, namespace: str, counter: str, amount: int = 1):
+        counters = self._counters.setdefault(
+            namespace, {'hits': 0, 'misses': 0, 'stores': 0, 'expired': 0, 'evictions': 0, 'invalidated': 0}
+        )
+        counters[counter] += amount
+
+    @staticmethod
+    def make_key(namespace: str, version: str, query: str, context: str = "") -> str:
+        raw = json.dumps([namespace, version, normalize_query(query), context])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, namespace: str, version: str, query: str, context: str = "") -> Optional[str]:
+        key = self.make_key(namespace, version, query, context)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count(namespace, 'misses')
+                return None
+            value, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._count(namespace, 'expired')
+                self._count(namespace, 'misses')
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._count(namespace, 'hits')
+            return value
+
+    def set(self, namespace: str, version: str, query: str, value: str, context: str = ""):
+        key = self.make_key(namespace, version, query, context)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, namespace, prompt_version, value, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, version, value, now, now),
+            )
+            self._count(namespace, 'stores')
+            overflow = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self._count(namespace, 'evictions', overflow)
+
+    def invalidate_stale(self, namespace: str, current_version: str) -> int:
+        """Drops every entry of `namespace` produced by an older prompt version."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM llm_cache WHERE namespace = ? AND prompt_version != ?",
+                (namespace, current_version),
+            )
+            if cursor.rowcount:
+                self._count(namespace, 'invalidated', cursor.rowcount)
+            return cursor.rowcount
+
+    def clear(self, namespace: str = None):
+        with self._lock:
+            if namespace is None:
+                self._conn.execute("DELETE FROM llm_cache")
+            else:
+                self._conn.execute("DELETE FROM llm_cache WHERE namespace = ?", (namespace,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = dict(self._conn.execute(
+                "SELECT namespace, COUNT(*) FROM llm_cache GROUP BY namespace"
+            ).fetchall())
+            namespaces = {}
+            for namespace in set(sizes) | set(self._counters):
+                counters = dict(self._counters.get(namespace, {}))
+                lookups = counters.get('hits', 0) + counters.get('misses', 0)
+                counters['entries'] = sizes.get(namespace, 0)
+                counters['hit_rate'] = counters.get('hits', 0) / lookups if lookups else 0.0
+                namespaces[namespace] = counters
+            return {
+                'enabled': LLM_CACHE_ENABLED,
+                'path': self.path,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'entries': sum(sizes.values()),
+                'namespaces': namespaces,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache:
+    """Returns the process-wide cache, opening the database on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
+
+
+def register_prompt(namespace: str, version: str):
+    """
+    Called once per agent prompt at import time. Removes entries left over
+    from previous versions of that prompt.
+    """
+    if not LLM_CACHE_ENABLED:
+        return
+    removed = get_cache().invalidate_stale(namespace, version)
+    if removed:
+        logger.info("LLM cache: dropped %d '%s' entries from an older prompt version.", removed, namespace)
+
+
+def lookup(namespace: str, version: str, query: str, context: str = "") -> Optional[str]:
+    if not LLM_CACHE_ENABLED:
+        return None
+    return get_cache().get(namespace, version, query, context)
+
+
+def store(namespace: str, version: str, query: str, value: str, context: str = ""):
+    if LLM_CACHE_ENABLED:
+        get_cache().set(namespace, version, query, value, context)
+
+
+async def alookup(namespace: str, version: str, query: str, context: str = "") -> Optional[str]:
+    """`lookup` for async callers; the SQLite read runs in a worker thread."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    return await asyncio.to_thread(lookup, namespace, version, query, context)
+
+
+async def astore(namespace: str, version: str, query: str, value: str, context: str = ""):
+    """`store` for async callers; the SQLite write runs in a worker thread."""
+    if LLM_CACHE_ENABLED:
+        await asyncio.to_thread(store, namespace, version, query, value, context)
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    if not LLM_CACHE_ENABLED:
+        return {'enabled': False}
+    return get_cache().stats()
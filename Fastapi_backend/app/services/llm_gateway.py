@@ -0,0 +1,310 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import hashlib
+import logging
+import itertools
+import threading
+from google import genai
+from dotenv import load_dotenv
+from typing import Any, AsyncIterator, Dict, Optional
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# --- Gateway Configuration ---
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+LLM_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", 60))  # sustained upstream requests per minute
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", 10))  # requests allowed back to back
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))  # upstream calls in flight at once
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 2.0))  # seconds, doubled per retry
+LLM_COALESCE = os.getenv("LLM_COALESCE", "true").lower() in ("1", "true", "yes")
+
+# Lower value is served first. Chat requests wait on users; batch work does not.
+PRIORITIES = {'chat': 0, 'batch': 1}
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for temporary overload / quota errors from the LLM API."""
+    return "503" in str(error) or "429" in str(error) or "RESOURCE_EXHAUSTED" in str(error)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `reserve()` always succeeds and returns how long
+    the caller must wait before using its token, so reservations are served
+    in order even while the bucket is empty.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def drain(self):
+        """Empties the bucket after the upstream reported a quota error."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+class LLMGateway:
+    """
+    The single path from the agents to Gemini. Requests from any thread or
+    event loop are scheduled on one background event loop, which applies a
+    token-bucket rate limit, a concurrency cap with priority queues,
+    non-blocking retries with jitter, and coalescing of identical in-flight
+    prompts into one upstream call.
+    """
+
+    def __init__(self, api_key: str = GEMINI_API_KEY, rate_per_minute: float = LLM_RATE_LIMIT_RPM,
+                 burst: int = LLM_RATE_BURST, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES, retry_base_delay: float = LLM_RETRY_BASE_DELAY,
+                 coalesce: bool = LLM_COALESCE):
+        self.client = genai.Client(api_key=api_key)
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.coalesce = coalesce
+
+        # Scheduler state; only touched from the gateway loop.
+        self._active = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._inflight: Dict[str, list] = {}  # prompt key -> [task, waiter count]
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'upstream_calls': 0,
+            'coalesced': 0,
+            'retries': 0,
+            'errors': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+            'max_queue_depth': 0,
+        }
+        self._requests_by_priority = {name: 0 for name in PRIORITIES}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+    def _count(self, counter: str, amount=1):
+        with self._stats_lock:
+            self._stats[counter] += amount
+
+    # --- Scheduling (gateway loop) ---
+
+    async def _acquire(self, priority: str):
+        """Waits for a concurrency slot and a rate-limit token, highest priority first."""
+        start = time.perf_counter()
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+        else:
+            future = self._loop.create_future()
+            heapq.heappush(self._waiters, (PRIORITIES[priority], next(self._seq), future))
+            with self._stats_lock:
+                self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], len(self._waiters))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as the caller gave up.
+                    self._release()
+                raise
+        try:
+            await asyncio.sleep(self.bucket.reserve())
+        except asyncio.CancelledError:
+            self._release()
+            raise
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats['total_wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # the slot passes straight to the next waiter
+                return
+        self._active -= 1
+
+    async def _backoff(self, attempt: int, error: Exception):
+        delay = self.retry_base_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+        logger.warning(
+            "Model is overloaded (error: %s). Retrying in %.1fs... (%d/%d)", error, delay, attempt + 1, self.max_retries
+        )
+        self._count('retries')
+        if "429" in str(error) or "RESOURCE_EXHAUSTED" in str(error):
+            self.bucket.drain()
+        await asyncio.sleep(delay)
+
+    async def _call_upstream(self, model: str, contents: str, priority: str) -> str:
+        """One generate call with retries; the slot is released while backing off."""
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority)
+            try:
+                self._count('upstream_calls')
+                response = await self.client.aio.models.generate_content(model=model, contents=contents)
+                return response.text
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self._count('errors')
+                    raise
+                error = e
+            finally:
+                self._release()
+            await self._backoff(attempt, error)
+
+    async def _generate(self, model: str, contents: str, priority: str) -> str:
+        """Coalesces identical in-flight prompts onto one upstream task."""
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._requests_by_priority[priority] += 1
+        if not self.coalesce:
+            return await self._call_upstream(model, contents, priority)
+
+        key = hashlib.sha256(f"{model}\x00{contents}".encode("utf-8")).hexdigest()
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = self._loop.create_task(self._call_upstream(model, contents, priority))
+            entry = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._count('coalesced')
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            entry[1] -= 1
+            if entry[1] == 0:
+                # Nobody is waiting for this answer any more.
+                entry[0].cancel()
+            raise
+
+    async def _stream(self, model: str, contents: str, priority: str, put):
+        """Streams one response, retrying only before the first chunk arrived."""
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._requests_by_priority[priority] += 1
+        for attempt in range(self.max_retries + 1):
+            sent = False
+            await self._acquire(priority)
+            try:
+                self._count('upstream_calls')
+                stream = await self.client.aio.models.generate_content_stream(model=model, contents=contents)
+                async for chunk in stream:
+                    if chunk.text:
+                        sent = True
+                        put(chunk.text)
+                return
+            except Exception as e:
+                if sent or not is_retryable(e) or attempt == self.max_retries:
+                    self._count('errors')
+                    raise
+                error = e
+            finally:
+                self._release()
+            await self._backoff(attempt, error)
+
+    # --- Public API (any thread / loop) ---
+
+    async def agenerate(self, model: str, contents: str, priority: str = 'chat') -> str:
+        """Generates a response and returns its text, without blocking the caller's event loop."""
+        future = asyncio.run_coroutine_threadsafe(self._generate(model, contents, priority), self._loop)
+        return await asyncio.wrap_future(future)
+
+    def generate(self, model: str, contents: str, priority: str = 'batch') -> str:
+        """Blocking version of `agenerate` for synchronous callers."""
+        return asyncio.run_coroutine_threadsafe(self._generate(model, contents, priority), self._loop).result()
+
+    async def astream(self, model: str, contents: str, priority: str = 'chat') -> AsyncIterator[str]:
+        """Yields the response text in chunks as the model produces them."""
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        def put(item):
+            loop.call_soon_threadsafe(chunks.put_nowait, item)
+
+        future = asyncio.run_coroutine_threadsafe(self._stream(model, contents, priority, put), self._loop)
+        future.add_done_callback(lambda _: put(finished))
+        try:
+            while True:
+                item = await chunks.get()
+                if item is finished:
+                    break
+                yield item
+            future.result()  # re-raise upstream errors
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['requests_by_priority'] = dict(self._requests_by_priority)
+        queued = list(self._waiters)
+        stats['queue_depth'] = len(queued)
+        stats['queue_depth_by_priority'] = {
+            name: sum(1 for rank, _, _ in queued if rank == value) for name, value in PRIORITIES.items()
+        }
+        stats['active'] = self._active
+        stats['inflight_prompts'] = len(self._inflight)
+        # Every upstream attempt waits once for a slot and a token.
+        stats['mean_wait_seconds'] = (
+            stats['total_wait_seconds'] / stats['upstream_calls'] if stats['upstream_calls'] else 0.0
+        )
+        stats['rate_limit_rpm'] = self.bucket.rate * 60
+        stats['max_concurrency'] = self.max_concurrency
+        return stats
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+
+async def agenerate(model: str, contents: str, priority: str = 'chat') -> str:
+    return await get_gateway().agenerate(model, contents, priority)
+
+
+def generate(model: str, contents: str, priority: str = 'batch') -> str:
+    return get_gateway().generate(model, contents, priority)
+
+
+async def astream(model: str, contents: str, priority: str = 'chat') -> AsyncIterator[str]:
+    async for chunk in get_gateway().astream(model, contents, priority):
+        yield chunk
+
+
+def get_gateway_stats() -> Dict[str, Any]:
+    return get_gateway().stats()
@@ -0,0 +1,304 @@
+import time
+import logging
+import bisect
+import asyncio
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from fastapi.routing import APIRoute
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = "argo"
+# Histogram bucket upper bounds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+SIZE_BUCKETS = (100, 1000, 4000, 16000, 64000, 256000, 1000000)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name, self.help, self.label_names = name, help_text, label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help_text, label_names
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else _number(bound)
+                    lines.append(
+                        f"{self.name}_bucket{_labels(self.label_names + ('le',), key + (le,))} {cumulative}"
+                    )
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+# --- Registry ---
+HTTP_REQUESTS = Counter(
+    f"{METRICS_PREFIX}_http_requests_total", "HTTP requests by route, method and status.",
+    ("route", "method", "status"),
+)
+HTTP_DURATION = Histogram(
+    f"{METRICS_PREFIX}_http_request_duration_seconds", "Time to produce the HTTP response.", ("route", "method"),
+)
+STAGE_DURATION = Histogram(
+    f"{METRICS_PREFIX}_stage_duration_seconds",
+    "Duration of one pipeline or endpoint stage (LLM calls, Chroma query, DB query, serialization).",
+    ("stage", "route"),
+)
+STAGE_ERRORS = Counter(f"{METRICS_PREFIX}_stage_errors_total", "Stages that raised an exception.", ("stage", "route"))
+STAGE_ROWS = Histogram(
+    f"{METRICS_PREFIX}_stage_rows", "Rows or documents returned by a stage.", ("stage", "route"), ROW_BUCKETS,
+)
+PROMPT_CHARS = Histogram(
+    f"{METRICS_PREFIX}_llm_prompt_chars", "Prompt size sent to the LLM, in characters.", ("stage",), SIZE_BUCKETS,
+)
+RESPONSE_CHARS = Histogram(
+    f"{METRICS_PREFIX}_llm_response_chars", "LLM response size, in characters.", ("stage",), SIZE_BUCKETS,
+)
+RESPONSE_BYTES = Histogram(
+    f"{METRICS_PREFIX}_serialized_bytes", "Serialized response body size.", ("route", "format"), SIZE_BUCKETS,
+)
+_REGISTRY = [
+    HTTP_REQUESTS, HTTP_DURATION, STAGE_DURATION, STAGE_ERRORS, STAGE_ROWS,
+    PROMPT_CHARS, RESPONSE_CHARS, RESPONSE_BYTES,
+]
+_gauge_sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_gauges(name: str, source: Callable[[], Dict[str, Any]]):
+    """
+    Exposes the numeric values of a stats dict (e.g. `get_pool_stats`) as
+    gauges named `argo_<name>_<key>`, read each time /metrics is scraped.
+    """
+    _gauge_sources[name] = source
+
+
+# --- Per-request traces and spans ---
+_trace: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("argo_trace", default=None)
+
+
+class Span:
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.attributes: Dict[str, Any] = {}
+        self.seconds = 0.0
+
+    def set(self, **attributes):
+        """Attaches sizes to the span: `rows`, `prompt_chars`, `response_chars` or anything else."""
+        self.attributes.update(attributes)
+
+
+def _route_label() -> str:
+    trace = _trace.get()
+    return trace['route'] if trace is not None else ""
+
+
+@contextmanager
+def span(stage: str) -> Iterator[Span]:
+    """
+    Times one stage of the current request and records it in the stage
+    histograms and the request's trace. Works around sync code and awaits.
+    If the request is being profiled, the calling thread is sampled from
+    here on.
+    """
+    trace = _trace.get()
+    if trace is not None and trace.get('profiler') is not None:
+        trace['profiler'].watch_current_thread()
+    current = Span(stage)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage, route=_route_label())
+        raise
+    finally:
+        current.seconds = time.perf_counter() - start
+        record(current)
+
+
+def record(current: Span):
+    """Records a finished span (also used for spans timed by hand)."""
+    route = _route_label()
+    STAGE_DURATION.observe(current.seconds, stage=current.stage, route=route)
+    attributes = current.attributes
+    if 'rows' in attributes:
+        STAGE_ROWS.observe(attributes['rows'], stage=current.stage, route=route)
+    if 'prompt_chars' in attributes:
+        PROMPT_CHARS.observe(attributes['prompt_chars'], stage=current.stage)
+    if 'response_chars' in attributes:
+        RESPONSE_CHARS.observe(attributes['response_chars'], stage=current.stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace['spans'].append(current)
+
+
+def start_trace(route: str = "") -> contextvars.Token:
+    return _trace.set({'route': route, 'spans': [], 'start': time.perf_counter()})
+
+
+def current_trace() -> Optional[Dict[str, Any]]:
+    return _trace.get()
+
+
+def end_trace(token: contextvars.Token):
+    _trace.reset(token)
+
+
+def stage_totals(trace: Dict[str, Any]) -> Dict[str, float]:
+    """Seconds spent in each stage of the trace, summed over its spans."""
+    totals: Dict[str, float] = {}
+    for finished in trace['spans']:
+        totals[finished.stage] = totals.get(finished.stage, 0.0) + finished.seconds
+    return totals
+
+
+def server_timing(trace: Dict[str, Any]) -> str:
+    """The trace's spans summed per stage, as a `Server-Timing` header value."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stage_totals(trace).items())
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    """(Internal Helper) Wraps a route endpoint in a `handler` span, keeping its signature."""
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            with span("handler"):
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def timed(*args, **kwargs):
+            with span("handler"):
+                return endpoint(*args, **kwargs)
+    return timed
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    Route class that times each endpoint call (`handler`) and everything
+    FastAPI does after it, mostly response validation and JSON encoding
+    (`serialization`).
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def _route_label(self, request) -> str:
+        """
+        The route template including any include_router prefix, which the
+        route itself does not always know: the concrete path with this
+        route's part swapped for its template.
+        """
+        try:
+            concrete = self.path_format.format(**{
+                name: self.param_convertors[name].to_string(value)
+                for name, value in request.path_params.items()
+            })
+        except (KeyError, ValueError, AssertionError):
+            return self.path_format
+        path = request.url.path
+        if path.endswith(concrete):
+            return path[:len(path) - len(concrete)] + self.path_format
+        return self.path_format
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def instrumented_handler(request):
+            route_path = self._route_label(request)
+            trace = _trace.get()
+            if trace is not None:
+                trace['route'] = route_path
+            start = time.perf_counter()
+            response = await handler(request)
+            if trace is not None:
+                handled = sum(s.seconds for s in trace['spans'] if s.stage == "handler")
+                serialization = Span("serialization")
+                serialization.seconds = max(time.perf_counter() - start - handled, 0.0)
+                body = getattr(response, "body", None)
+                if body is not None:
+                    serialization.set(bytes=len(body))
+                    fmt = response.media_type or ""
+                    RESPONSE_BYTES.observe(len(body), route=route_path, format=fmt)
+                record(serialization)
+            return response
+
+        return instrumented_handler
+
+
+def observe_request(route: str, method: str, status: int, seconds: float):
+    HTTP_REQUESTS.inc(route=route, method=method, status=status)
+    HTTP_DURATION.observe(seconds, route=route, method=method)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    for name, source in _gauge_sources.items():
+        try:
+            values = source()
+        except Exception as e:
+            logger.warning("Could not collect '%s' metrics: %s", name, e)
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric_name = f"{METRICS_PREFIX}_{name}_{key}"
+            lines.extend([f"# TYPE {metric_name} gauge", f"{metric_name} {_number(value)}"])
+    return "\n".join(lines) + "\n"
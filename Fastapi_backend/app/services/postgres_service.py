@@ -1,39 +1,292 @@
 
 import os
+import re
+import json
+import math
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import errors as pg_errors
+from psycopg2.pool import PoolError
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from . import metrics
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set.")
 
+# --- Connection Pool Configuration ---
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", 1))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", 10))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", 10))  # seconds to wait for a free connection
+PG_POOL_MAX_LIFETIME = float(os.getenv("PG_POOL_MAX_LIFETIME", 1800))  # recycle connections older than this
+PG_POOL_PING_AFTER = float(os.getenv("PG_POOL_PING_AFTER", 5))  # ping connections idle longer than this
+
+# --- Guardrails for LLM-generated SQL ---
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", 10000))
+SQL_MAX_COST = float(os.getenv("SQL_MAX_COST", 1_000_000))  # planner cost units, from EXPLAIN
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", 1000))
+# Generated SQL runs on its own connections, preferably as a read-only role.
+SQL_READONLY_DATABASE_URL = os.getenv("SQL_READONLY_DATABASE_URL") or DATABASE_URL
+# Every transaction on those connections is read-only, including any that
+# a smuggled COMMIT would start.
+SQL_READONLY_OPTIONS = "-c default_transaction_read_only=on"
+
+
+class PoolTimeoutError(PoolError):
+    """Raised when no connection becomes free within the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    A thread-safe psycopg2 connection pool shared by the whole process.
+
+    Connections are checked on checkout: closed, expired or unresponsive
+    connections are replaced transparently. When all `max_size` connections
+    are busy, callers wait up to `timeout` seconds and then get a
+    `PoolTimeoutError` instead of opening yet another Postgres backend.
+    """
+
+    def __init__(self, dsn: str, min_size: int = PG_POOL_MIN_SIZE, max_size: int = PG_POOL_MAX_SIZE,
+                 timeout: float = PG_POOL_TIMEOUT, max_lifetime: float = PG_POOL_MAX_LIFETIME,
+                 ping_after: float = PG_POOL_PING_AFTER, connect_kwargs: Dict[str, Any] = None):
+        self.dsn = dsn
+        self.connect_kwargs = connect_kwargs or {}
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        self._idle = []  # [(conn, created_at, returned_at)], most recently used last
+        self._created_at = {}  # id(conn) -> creation time, for connections in use
+        self._size = 0
+        self._waiting = 0
+        self._stats = {
+            'checkouts': 0,
+            'connections_created': 0,
+            'connections_recycled': 0,
+            'connections_broken': 0,
+            'timeouts': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+        }
+        for _ in range(self.min_size):
+            try:
+                conn = self._connect()
+            except psycopg2.Error as e:
+                logger.error("Could not pre-open pooled connection: %s", e)
+                break
+            now = time.monotonic()
+            self._idle.append((conn, now, now))
+            self._size += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        with self._cond:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _is_healthy(self, conn, created_at: float, returned_at: float) -> bool:
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if now - returned_at > self.ping_after:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self, timeout: float = None):
+        """Checks out a healthy connection, waiting up to `timeout` seconds."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        entry = None
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available after {timeout:.1f}s "
+                            f"(pool max size {self.max_size})."
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            waited = time.monotonic() - start
+            self._stats['checkouts'] += 1
+            self._stats['total_wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+
+        try:
+            if entry is not None:
+                conn, created_at, returned_at = entry
+                if self._is_healthy(conn, created_at, returned_at):
+                    self._created_at[id(conn)] = created_at
+                    return conn
+                with self._cond:
+                    self._stats['connections_recycled'] += 1
+                self._close_quietly(conn)
+            conn = self._connect()
+            self._created_at[id(conn)] = time.monotonic()
+            return conn
+        except Exception:
+            # The slot we reserved was never handed out; give it back.
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, discard: bool = False):
+        """Returns a connection to the pool, closing it if it is broken."""
+        created_at = self._created_at.pop(id(conn), time.monotonic())
+        if not discard and not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            self._close_quietly(conn)
+            with self._cond:
+                self._stats['connections_broken'] += 1
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            # putconn() rolls back; a connection that can't even do that is discarded.
+            self.putconn(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'waiting': self._waiting,
+                'avg_wait_seconds': (
+                    stats['total_wait_seconds'] / stats['checkouts'] if stats['checkouts'] else 0.0
+                ),
+            })
+            return stats
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+
+_pool = None
+_readonly_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Returns the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE_URL)
+    return _pool
+
+
+def get_connection(timeout: float = None):
+    """Context manager that checks a connection out of the shared pool."""
+    return get_pool().connection(timeout)
+
+
+def get_readonly_pool() -> ConnectionPool:
+    """
+    Returns the pool used for untrusted (generated) SQL. Its connections are
+    opened with `default_transaction_read_only=on`, as SQL_READONLY_DATABASE_URL
+    (a read-only role, ideally; DATABASE_URL otherwise).
+    """
+    global _readonly_pool
+    if _readonly_pool is None:
+        with _pool_lock:
+            if _readonly_pool is None:
+                _readonly_pool = ConnectionPool(
+                    SQL_READONLY_DATABASE_URL, connect_kwargs={'options': SQL_READONLY_OPTIONS}
+                )
+    return _readonly_pool
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    return get_pool().stats()
+
+
+def get_readonly_pool_stats() -> Dict[str, Any]:
+    return get_readonly_pool().stats()
+
+
+def close_pool():
+    for pool in (_pool, _readonly_pool):
+        if pool is not None:
+            pool.closeall()
+
+
 def execute_sql_query(sql_query: str) -> list:
-    conn = None
     try:
-        # Connect using the single connection string
-        conn = psycopg2.connect(DATABASE_URL)
-        
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            # ... rest of the function is exactly the same
-            print(f"> Executing SQL: {sql_query}")
-            cursor.execute(sql_query)
-            results = [dict(row) for row in cursor.fetchall()]
-            print(f"> Found {len(results)} records from PostgreSQL.")
-            return results
-            
+        with get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                logger.debug("Executing SQL: %s", sql_query)
+                with metrics.span("db_query") as span:
+                    cursor.execute(sql_query)
+                    results = [dict(row) for row in cursor.fetchall()]
+                    span.set(rows=len(results))
+                logger.debug("Found %d records from PostgreSQL.", len(results))
+                return results
+
     except psycopg2.Error as e:
-        print(f"❌ Database error: {e}")
+        logger.error("Database error: %s", e)
         return []
-        
-    finally:
-        if conn is not None:
-            conn.close()
-            print("> Database connection closed.")
 
 
 def execute_secure_query(sql_query: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
@@ -41,22 +294,216 @@ def execute_secure_query(sql_query: str, params: Dict[str, Any] = None) -> List[
     Executes a SQL query with parameters in a secure way.
     This is intended for new, dashboard-related features.
     """
-    conn = None
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            print(f"> Executing SECURE SQL.")
-            # Pass the query and params separately for safe execution
-            cursor.execute(sql_query, params)
-            results = cursor.fetchall()
-            print(f"> Found {len(results)} records from PostgreSQL.")
-            return results
-            
+        with get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                logger.debug("Executing SECURE SQL.")
+                with metrics.span("db_query") as span:
+                    # Pass the query and params separately for safe execution
+                    cursor.execute(sql_query, params)
+                    results = cursor.fetchall()
+                    span.set(rows=len(results))
+                logger.debug("Found %d records from PostgreSQL.", len(results))
+                return results
+
     except psycopg2.Error as e:
-        print(f"❌ Database error: {e}")
+        logger.error("Database error: %s", e)
         raise e
-        
-    finally:
-        if conn is not None:
-            conn.close()
-            print("> Database connection closed.")
\ No newline at end of file
+
+
+class QueryRejectedError(Exception):
+    """A generated query that was refused or stopped by the execution guardrails."""
+
+    def __init__(self, reason: str, message: str, **details):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+        self.details = details
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'reason': self.reason, 'message': self.message, **self.details}
+
+
+# Ways a single SELECT can still write or change session state: data-modifying
+# CTEs, SELECT ... INTO and set_config(). The read-only transaction would stop
+# the writes too; rejecting them early gives a clearer error.
+_FORBIDDEN_KEYWORDS = re.compile(r"\b(insert|update|delete|merge|into|set_config)\b", re.IGNORECASE)
+_DOLLAR_QUOTE = re.compile(r"\$[A-Za-z_][A-Za-z_0-9]*\$|\$\$")
+
+
+def _sql_skeleton(sql_query: str) -> str:
+    """
+    (Internal Helper) `sql_query` with comments and the contents of string
+    literals, quoted identifiers and dollar-quoted strings blanked out,
+    keeping every other character at its position.
+    """
+    out = list(sql_query)
+    i, n = 0, len(sql_query)
+
+    def blank(start, end):
+        for j in range(start, end):
+            if out[j] not in "\r\n":
+                out[j] = " "
+
+    while i < n:
+        ch = sql_query[i]
+        if sql_query.startswith("--", i):
+            end = sql_query.find("\n", i)
+            end = n if end == -1 else end
+            blank(i, end)
+            i = end
+        elif sql_query.startswith("/*", i):
+            depth, j = 1, i + 2
+            while j < n and depth:
+                if sql_query.startswith("/*", j):
+                    depth, j = depth + 1, j + 2
+                elif sql_query.startswith("*/", j):
+                    depth, j = depth - 1, j + 2
+                else:
+                    j += 1
+            if depth:
+                raise QueryRejectedError('parse_error', "Query rejected: unterminated comment.")
+            blank(i, j)
+            i = j
+        elif ch in ("'", '"'):
+            # E'...' takes backslash escapes, but only as its own token: in
+            # WHERE'...' the e ends a keyword and the string is a plain one.
+            escapes = (
+                ch == "'" and i > 0 and sql_query[i - 1] in "eE"
+                and not (i > 1 and (sql_query[i - 2].isalnum() or sql_query[i - 2] in "_$"))
+            )
+            j = i + 1
+            while True:
+                if j >= n:
+                    raise QueryRejectedError('parse_error', "Query rejected: unterminated quoted string.")
+                if escapes and sql_query[j] == "\\":
+                    j += 2
+                elif sql_query[j] == ch:
+                    if sql_query.startswith(ch * 2, j):
+                        j += 2
+                    else:
+                        break
+                else:
+                    j += 1
+            blank(i + 1, j)
+            i = j + 1
+        elif ch == "$" and _DOLLAR_QUOTE.match(sql_query, i) and not (i and (sql_query[i - 1].isalnum() or sql_query[i - 1] == "_")):
+            tag = _DOLLAR_QUOTE.match(sql_query, i).group(0)
+            end = sql_query.find(tag, i + len(tag))
+            if end == -1:
+                raise QueryRejectedError('parse_error', "Query rejected: unterminated dollar-quoted string.")
+            blank(i + len(tag), end)
+            i = end + len(tag)
+        else:
+            i += 1
+    return "".join(out)
+
+
+def _single_select(sql_query: str) -> str:
+    """
+    (Internal Helper) Checks that `sql_query` is exactly one SELECT (or WITH
+    ... SELECT) statement and returns it without the trailing `;`. Raises
+    QueryRejectedError for anything else, e.g. a `; COMMIT; CREATE ...` tail.
+    """
+    skeleton = _sql_skeleton(sql_query).rstrip()
+    while skeleton.endswith(";"):
+        skeleton = skeleton[:-1].rstrip()
+    if ";" in skeleton:
+        raise QueryRejectedError('multiple_statements', "Query rejected: only a single statement is allowed.")
+    words = skeleton.split(None, 1)
+    if not words or words[0].lower() not in ("select", "with"):
+        raise QueryRejectedError('not_select', "Query rejected: only SELECT queries are allowed.")
+    forbidden = _FORBIDDEN_KEYWORDS.search(skeleton)
+    if forbidden:
+        raise QueryRejectedError(
+            'not_select', f"Query rejected: '{forbidden.group(0).upper()}' is not allowed in a read-only query."
+        )
+    return sql_query[:len(skeleton)].strip()
+
+
+def _explain_cost(cursor, sql_query: str, params: Dict[str, Any] = None) -> float:
+    """(Internal Helper) The planner's total cost estimate for `sql_query`."""
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql_query, params)
+    try:
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return float(plan[0]['Plan']['Total Cost'])
+    except (TypeError, KeyError, IndexError, ValueError) as e:
+        raise QueryRejectedError('database_error', f"Could not read the query plan: {e}")
+
+
+def execute_guarded_query(sql_query: str, max_rows: int = None, max_cost: float = None,
+                          statement_timeout_ms: int = None, params: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Executes an untrusted (LLM-generated) query with guardrails:
+
+    - it must be a single SELECT / WITH statement;
+    - it runs on a connection whose transactions are all read-only (see
+      `get_readonly_pool`), with a local `statement_timeout`;
+    - it is rejected without running if its EXPLAIN cost exceeds `max_cost`
+      (pass `math.inf` to skip the EXPLAIN entirely);
+    - at most `max_rows` rows are fetched, through a server-side cursor.
+
+    `params` are bound with psycopg2's `%(name)s` placeholders, as in
+    `execute_secure_query`. Never raises for query problems. Returns a dict with `rows`, `truncated`
+    (more rows existed than were returned), `row_cap`, `estimated_cost` and
+    `error` (None, or a dict with `reason`, `message` and details).
+    """
+    max_rows = SQL_MAX_ROWS if max_rows is None else max_rows
+    max_cost = SQL_MAX_COST if max_cost is None else max_cost
+    statement_timeout_ms = SQL_STATEMENT_TIMEOUT_MS if statement_timeout_ms is None else statement_timeout_ms
+    result: Dict[str, Any] = {
+        'rows': [], 'truncated': False, 'row_cap': max_rows, 'estimated_cost': None, 'error': None,
+    }
+
+    try:
+        # DECLARE ... CURSOR FOR takes a single statement without the terminator.
+        sql_query = _single_select(sql_query)
+        with metrics.span("sql_execution") as span, get_readonly_pool().connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute(f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}")
+                logger.debug("Executing guarded SQL: %s", sql_query)
+                cost = _explain_cost(cursor, sql_query, params) if math.isfinite(max_cost) else None
+                result['estimated_cost'] = cost
+                if cost is not None and cost > max_cost:
+                    raise QueryRejectedError(
+                        'cost_limit',
+                        f"Query rejected: estimated cost {cost:.0f} exceeds the limit of {max_cost:.0f}.",
+                        estimated_cost=cost, max_cost=max_cost,
+                    )
+
+            with conn.cursor(name=f"guarded_{uuid.uuid4().hex}", cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(sql_query, params)
+                rows = cursor.fetchmany(max_rows + 1)
+            span.set(rows=len(rows))
+
+        result['truncated'] = len(rows) > max_rows
+        result['rows'] = [dict(row) for row in rows[:max_rows]]
+        logger.debug(
+            "Found %d records from PostgreSQL%s", len(result['rows']),
+            f" (truncated at {max_rows})." if result['truncated'] else ".",
+        )
+    except QueryRejectedError as e:
+        logger.warning("%s", e.message)
+        result['error'] = e.to_dict()
+    except pg_errors.QueryCanceled as e:
+        logger.warning("Query cancelled by statement_timeout: %s", e)
+        result['error'] = {
+            'reason': 'timeout',
+            'message': f"Query exceeded the {statement_timeout_ms} ms statement timeout.",
+            'statement_timeout_ms': statement_timeout_ms,
+        }
+    except pg_errors.ReadOnlySqlTransaction as e:
+        logger.warning("Write attempted in read-only query: %s", e)
+        result['error'] = {'reason': 'read_only', 'message': "Only read-only queries are allowed."}
+    except psycopg2.Error as e:
+        logger.error("Database error: %s", e)
+        result['error'] = {'reason': 'database_error', 'message': str(e).strip()}
+    return result
+
+
+async def aexecute_guarded_query(sql_query: str, **limits) -> Dict[str, Any]:
+    """Async wrapper around `execute_guarded_query`."""
+    return await asyncio.to_thread(execute_guarded_query, sql_query, **limits)
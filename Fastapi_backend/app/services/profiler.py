@@ -0,0 +1,265 @@
+import os
+import sys
+import time
+import uuid
+import hmac
+import logging
+import threading
+from collections import Counter, deque
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional, Tuple
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# --- Profiling Configuration ---
+# Off unless an admin turns it on; while off, requests are never profiled.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+# When set, the X-Profile header / `profile` query value must equal it, and
+# reading stored reports needs it in X-Profile-Token / `token`.
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", 5))  # time between samples
+PROFILING_KEEP = int(os.getenv("PROFILING_KEEP", 20))  # most recent reports kept in memory
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+PROFILE_TOKEN_QUERY_PARAM = "token"
+TOP_FUNCTIONS = 30
+# Frames from files under this directory count as our own code.
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Where a sample's time went, judged by the innermost Python frame. C calls
+# (psycopg2's execute, socket reads) show up as the Python frame calling them.
+_CATEGORY_RULES: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ('postgres', ('/psycopg2/', 'postgres_service.py')),
+    ('network', ('/socket.py', '/ssl.py', '/httpx/', '/httpcore/', '/h11/', '/urllib3/', '/grpc/',
+                 '/google/genai/', '/chromadb/api/')),
+    ('waiting', ('/selectors.py', '/threading.py', '/queue.py', '/concurrent/futures/')),
+)
+
+_lock = threading.Lock()
+_reports: deque = deque(maxlen=PROFILING_KEEP)
+_stats = {
+    'profiled_requests': 0,
+    'rejected_requests': 0,
+    'rejected_reads': 0,
+    'total_samples': 0,
+}
+
+
+def requested(headers, query_params) -> bool:
+    """
+    True if the request asked to be profiled and is allowed to. Costs one
+    flag check when profiling is disabled.
+    """
+    if not PROFILING_ENABLED:
+        return False
+    flag = headers.get(PROFILE_HEADER) or query_params.get(PROFILE_QUERY_PARAM)
+    if not flag:
+        return False
+    if PROFILING_TOKEN and not hmac.compare_digest(flag.encode("utf-8"), PROFILING_TOKEN.encode("utf-8")):
+        with _lock:
+            _stats['rejected_requests'] += 1
+        return False
+    return True
+
+
+def can_read_reports(headers, query_params) -> bool:
+    """
+    True if the caller may read stored reports, which hold stacks, file
+    paths and request paths: it must present PROFILING_TOKEN when one is set.
+    """
+    if not PROFILING_TOKEN:
+        return True
+    token = headers.get(PROFILE_TOKEN_HEADER) or query_params.get(PROFILE_TOKEN_QUERY_PARAM) or ""
+    if hmac.compare_digest(token.encode("utf-8"), PROFILING_TOKEN.encode("utf-8")):
+        return True
+    with _lock:
+        _stats['rejected_reads'] += 1
+    return False
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # Keep the path short but unambiguous: package dir + file.
+    short = "/".join(filename.replace("\\", "/").rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def _category(frame) -> str:
+    filename = frame.f_code.co_filename.replace("\\", "/")
+    for category, patterns in _CATEGORY_RULES:
+        if any(pattern in filename for pattern in patterns):
+            return category
+    return 'python'
+
+
+class RequestProfiler:
+    """
+    Wall-clock sampling profiler for one request. A background thread
+    records the stacks of the threads working on the request (the event
+    loop thread that received it, plus any worker thread that opens a
+    metrics span for it) every PROFILING_INTERVAL_MS. Samples are taken
+    whether a thread is running or blocked, so time spent waiting on
+    Postgres or the network shows up too.
+
+    On the event loop thread, samples also include other requests served
+    concurrently; profile on a quiet worker for the cleanest picture.
+    """
+
+    def __init__(self, method: str, path: str, interval_ms: float = PROFILING_INTERVAL_MS):
+        self.id = uuid.uuid4().hex[:12]
+        self.method, self.path = method, path
+        self.interval = interval_ms / 1000.0
+        self._threads: Dict[int, str] = {}
+        self._threads_lock = threading.Lock()
+        self._stacks: Counter = Counter()
+        self._leaf_categories: Counter = Counter()
+        self._app_labels = set()
+        self._ticks = 0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.id}", daemon=True)
+        self.started = self.finished = 0.0
+
+    def watch_current_thread(self):
+        """Adds the calling thread to the sampled set (idempotent)."""
+        ident = threading.get_ident()
+        if ident not in self._threads:
+            with self._threads_lock:
+                self._threads[ident] = threading.current_thread().name
+
+    def start(self):
+        self.watch_current_thread()
+        self.started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.finished = time.perf_counter()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._threads_lock:
+                watched = list(self._threads.items())
+            self._ticks += 1
+            for ident, thread_name in watched:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                self._leaf_categories[_category(frame)] += 1
+                stack = []
+                while frame is not None:
+                    label = _frame_label(frame)
+                    if frame.f_code.co_filename.startswith(APP_ROOT):
+                        self._app_labels.add(label)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(thread_name)
+                stack.reverse()
+                self._stacks[tuple(stack)] += 1
+
+    def report(self, status: Optional[int] = None, stages: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """
+        The finished profile: wall-time totals per category and per function,
+        and the stacks in the collapsed ("folded") format that flamegraph.pl,
+        speedscope and inferno read. `functions` ranks every function by
+        self time; `app_functions` ranks this app's own functions by the
+        time spent in them and everything they called.
+        """
+        wall = self.finished - self.started
+        # Each tick covers wall / ticks seconds of every sampled thread.
+        tick_seconds = wall / self._ticks if self._ticks else 0.0
+        total_seconds: Counter = Counter()
+        self_seconds: Counter = Counter()
+        for stack, count in self._stacks.items():
+            seconds = count * tick_seconds
+            self_seconds[stack[-1]] += seconds
+            for label in set(stack[1:]):
+                total_seconds[label] += seconds
+
+        def breakdown(labels):
+            return [
+                {
+                    'function': label,
+                    'self_seconds': round(self_seconds.get(label, 0.0), 4),
+                    'total_seconds': round(total_seconds[label], 4),
+                }
+                for label in labels
+            ]
+
+        by_self = [label for label, _ in self_seconds.most_common(TOP_FUNCTIONS)]
+        app_by_total = sorted(self._app_labels, key=lambda label: -total_seconds[label])[:TOP_FUNCTIONS]
+        samples = sum(self._stacks.values())
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'status': status,
+            'created_at': time.time(),
+            'wall_seconds': round(wall, 4),
+            'interval_ms': self.interval * 1000,
+            'samples': samples,
+            'threads': sorted(self._threads.values()),
+            'categories': {
+                category: round(count * tick_seconds, 4) for category, count in self._leaf_categories.most_common()
+            },
+            'stages': {stage: round(seconds, 4) for stage, seconds in (stages or {}).items()},
+            'functions': breakdown(by_self),
+            'app_functions': breakdown(app_by_total),
+            'folded': "\n".join(
+                f"{';'.join(stack)} {count}" for stack, count in self._stacks.most_common()
+            ),
+        }
+
+
+def start(method: str, path: str) -> RequestProfiler:
+    profiler = RequestProfiler(method, path)
+    profiler.start()
+    return profiler
+
+
+def finish(profiler: RequestProfiler, status: Optional[int], stages: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Stops `profiler` and keeps its report for /api/debug/profiles."""
+    profiler.stop()
+    report = profiler.report(status, stages)
+    with _lock:
+        _reports.append(report)
+        _stats['profiled_requests'] += 1
+        _stats['total_samples'] += report['samples']
+    logger.info(
+        "Profiled %s %s in %.3fs (%d samples): %s", profiler.method, profiler.path,
+        report['wall_seconds'], report['samples'], report['categories'],
+    )
+    return report
+
+
+def get_report(profile_id: str) -> Optional[Dict[str, Any]]:
+    with _lock:
+        for report in _reports:
+            if report['id'] == profile_id:
+                return report
+    return None
+
+
+def list_reports() -> List[Dict[str, Any]]:
+    """Summaries of the kept reports, newest first (without stacks)."""
+    with _lock:
+        reports = list(_reports)
+    return [
+        {key: report[key] for key in ('id', 'method', 'path', 'status', 'created_at', 'wall_seconds', 'categories')}
+        for report in reversed(reports)
+    ]
+
+
+def get_profiler_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats['kept_reports'] = len(_reports)
+    stats['enabled'] = PROFILING_ENABLED
+    stats['token_required'] = bool(PROFILING_TOKEN)
+    stats['interval_ms'] = PROFILING_INTERVAL_MS
+    return stats
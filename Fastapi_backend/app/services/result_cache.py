@@ -0,0 +1,154 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from typing import Any, Callable, Dict, Hashable
+from .dataset_version import get_dataset_version
+
+load_dotenv()
+
+# --- Result Cache Configuration ---
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+_MISSING = object()
+
+
+class ResultCache:
+    """
+    In-memory LRU cache for dashboard query results, bounded by the total
+    (pickled) size of the stored values rather than by entry count.
+
+    Every entry belongs to the dataset version that was current when it was
+    stored. As soon as ingestion bumps the version, the whole cache is
+    dropped on the next access.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._version = None
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'oversized': 0,
+        }
+        self._by_kind: Dict[str, Dict[str, int]] = {}
+
+    def _check_version(self, version: str):
+        if version != self._version:
+            if self._entries:
+                self._stats['invalidations'] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def _count(self, key: Hashable, counter: str):
+        self._stats[counter] += 1
+        kind = key[0] if isinstance(key, tuple) and key else str(key)
+        self._by_kind.setdefault(kind, {'hits': 0, 'misses': 0})[counter] += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value for `key`, or `default` on a miss."""
+        version = get_dataset_version()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count(key, 'misses')
+                return default
+            self._entries.move_to_end(key)
+            self._count(key, 'hits')
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        self._store(key, value, get_dataset_version())
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value for `key`, or calls `compute()` and caches its
+        result. Exceptions raised by `compute` are not cached.
+        Cached values are shared between requests and must not be mutated.
+        """
+        version = get_dataset_version()
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = compute()
+        self._store(key, value, version)
+        return value
+
+    def _store(self, key: Hashable, value: Any, version: str):
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            if size > self.max_bytes:
+                self._stats['oversized'] += 1
+                return
+            # The dataset may have changed while the value was being computed.
+            if version != self._version:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            self._stats['stores'] += 1
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats.update({
+                'enabled': RESULT_CACHE_ENABLED,
+                'dataset_version': self._version,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hit_rate': stats['hits'] / lookups if lookups else 0.0,
+                'by_kind': {kind: dict(counts) for kind, counts in self._by_kind.items()},
+            })
+            return stats
+
+
+_cache = ResultCache()
+
+
+def cached(key: Hashable, compute: Callable[[], Any]) -> Any:
+    """Runs `compute()` through the process-wide result cache (unless disabled)."""
+    if not RESULT_CACHE_ENABLED:
+        return compute()
+    return _cache.get_or_compute(key, compute)
+
+
+def get(key: Hashable, default: Any = None) -> Any:
+    if not RESULT_CACHE_ENABLED:
+        return default
+    return _cache.get(key, default)
+
+
+def put(key: Hashable, value: Any):
+    if RESULT_CACHE_ENABLED:
+        _cache.put(key, value)
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    return _cache.stats()
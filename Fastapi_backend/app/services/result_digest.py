@@ -0,0 +1,220 @@
+import os
+import json
+import logging
+import threading
+import numpy as np
+from decimal import Decimal
+from datetime import date, datetime
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional, Tuple
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# --- Digest Configuration ---
+# Approximate prompt budget (tokens) for the SQL results given to the summarizer.
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", 4000))
+CHARS_PER_TOKEN = 4  # rough average for English text and JSON
+
+# Columns results are grouped by when present, plus the month of the first date column.
+GROUP_COLUMNS = ('depth', 'grid_id')
+# Numeric columns that describe where a row is rather than what was measured.
+COORDINATE_COLUMNS = ('latitude', 'longitude', 'depth')
+# (max groups per dimension, sample rows), from most to least detailed.
+DETAIL_LEVELS = [(100, 20), (50, 12), (20, 8), (10, 5), (5, 3), (0, 2), (0, 0)]
+
+_lock = threading.Lock()
+_stats = {'results': 0, 'digested': 0, 'raw_tokens': 0, 'prompt_tokens': 0}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def json_serial(obj):
+    """JSON serializer for dates and Decimals (numeric columns) in result rows."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def _classify_columns(rows: List[Dict[str, Any]]) -> Tuple[List[str], Optional[str]]:
+    """(Internal Helper) Returns (numeric columns, first date column)."""
+    numeric, date_column = [], None
+    for column in rows[0].keys():
+        values = [row.get(column) for row in rows if row.get(column) is not None]
+        if not values:
+            continue
+        if all(_is_number(v) for v in values):
+            numeric.append(column)
+        elif date_column is None and all(isinstance(v, (date, datetime)) for v in values):
+            date_column = column
+    return numeric, date_column
+
+
+def _round(value: float) -> float:
+    return float(f"{value:.4g}")
+
+
+def _describe(values: np.ndarray, years: Optional[np.ndarray]) -> Dict[str, Any]:
+    """(Internal Helper) count/min/max/mean/std of the non-NaN values, plus a linear trend per year."""
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return {'count': 0}
+    v = values[valid]
+    summary = {
+        'count': int(v.size),
+        'min': _round(v.min()),
+        'max': _round(v.max()),
+        'mean': _round(v.mean()),
+        'std': _round(v.std()),
+    }
+    if years is not None:
+        x = years[valid]
+        if v.size >= 3 and np.ptp(x) > 0:
+            summary['trend_per_year'] = _round(np.polyfit(x, v, 1)[0])
+    return summary
+
+
+def _group_sort_key(key: str):
+    """(Internal Helper) Orders numeric group keys (depths) numerically, the rest as text."""
+    try:
+        return (0, float(key), '')
+    except ValueError:
+        return (1, 0.0, key)
+
+
+def _sample_indices(values: Optional[np.ndarray], n_rows: int, k: int) -> List[int]:
+    """(Internal Helper) Evenly spaced rows, plus the rows holding the min and max of `values`."""
+    if k <= 0 or n_rows == 0:
+        return []
+    picked = set(np.linspace(0, n_rows - 1, num=min(k, n_rows)).round().astype(int).tolist())
+    if values is not None and not np.isnan(values).all():
+        picked.update((int(np.nanargmin(values)), int(np.nanargmax(values))))
+    return sorted(picked)
+
+
+def build_digest(rows: List[Dict[str, Any]], max_groups: int, sample_rows: int) -> Dict[str, Any]:
+    """
+    Compact statistical summary of `rows`: overall stats per numeric column,
+    per-group stats of the measured values by depth, grid cell and month
+    (largest groups first, at most `max_groups` per dimension), and a few
+    representative rows.
+    """
+    numeric, date_column = _classify_columns(rows)
+    columns = {
+        column: np.array([float(row[column]) if row.get(column) is not None else np.nan for row in rows])
+        for column in numeric
+    }
+    measures = [c for c in numeric if c not in COORDINATE_COLUMNS]
+
+    years = months = None
+    digest: Dict[str, Any] = {'row_count': len(rows), 'columns': list(rows[0].keys())}
+    if date_column:
+        dates = np.array(
+            [np.datetime64(row[date_column], 'D') if row.get(date_column) else np.datetime64('NaT') for row in rows]
+        )
+        valid_dates = dates[~np.isnat(dates)]
+        if valid_dates.size:
+            digest['time_range'] = {
+                'column': date_column,
+                'start': str(valid_dates.min()),
+                'end': str(valid_dates.max()),
+            }
+        years = (dates - np.datetime64('1970-01-01', 'D')).astype(float) / 365.25
+        months = np.datetime_as_string(dates.astype('datetime64[M]'))
+
+    digest['overall'] = {
+        column: _describe(columns[column], years if column in measures else None) for column in numeric
+    }
+
+    dimensions = [(c, [row.get(c) for row in rows]) for c in GROUP_COLUMNS if c in rows[0]]
+    if months is not None:
+        dimensions.append(('month', months.tolist()))
+    if max_groups > 0 and measures:
+        groups_out = {}
+        for name, keys in dimensions:
+            keys = np.array(['' if k is None else str(k) for k in keys])
+            unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            if len(unique) < 2 or len(unique) == len(rows):
+                continue  # one group, or one row per group: nothing to aggregate
+            order = sorted(range(len(unique)), key=lambda i: (-counts[i], unique[i]))[:max_groups]
+            groups_out[name] = {
+                'total_groups': int(len(unique)),
+                'groups': {
+                    unique[i]: {
+                        measure: _describe(columns[measure][inverse == i],
+                                           years[inverse == i] if years is not None else None)
+                        for measure in measures
+                    }
+                    for i in sorted(order, key=lambda i: _group_sort_key(unique[i]))
+                },
+            }
+        if groups_out:
+            digest['by_group'] = groups_out
+
+    primary = columns[measures[0]] if measures else None
+    digest['sample_rows'] = [rows[i] for i in _sample_indices(primary, len(rows), sample_rows)]
+    return digest
+
+
+def digest_results(sql_results: List[Dict[str, Any]], token_budget: int = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Prepares SQL results for the summarization prompt within `token_budget`.
+
+    Results that fit are passed through as JSON. Larger ones are replaced by
+    the most detailed `build_digest` that fits the budget.
+
+    Returns:
+        tuple: (text for the prompt, report with 'mode', 'rows',
+        'raw_tokens', 'prompt_tokens' and 'compression_ratio')
+    """
+    token_budget = SUMMARY_TOKEN_BUDGET if token_budget is None else token_budget
+    raw_text = json.dumps(sql_results, indent=2, default=json_serial)
+    raw_tokens = estimate_tokens(raw_text)
+    text, mode = raw_text, 'raw'
+
+    if sql_results and raw_tokens > token_budget:
+        mode = 'digest'
+        for max_groups, sample_rows in DETAIL_LEVELS:
+            digest = build_digest(sql_results, max_groups, sample_rows)
+            text = json.dumps(digest, default=json_serial, separators=(',', ':'))
+            if estimate_tokens(text) <= token_budget:
+                break
+
+    prompt_tokens = estimate_tokens(text)
+    report = {
+        'mode': mode,
+        'rows': len(sql_results),
+        'raw_tokens': raw_tokens,
+        'prompt_tokens': prompt_tokens,
+        'compression_ratio': round(raw_tokens / prompt_tokens, 2),
+    }
+    with _lock:
+        _stats['results'] += 1
+        _stats['digested'] += mode == 'digest'
+        _stats['raw_tokens'] += raw_tokens
+        _stats['prompt_tokens'] += prompt_tokens
+    if mode == 'digest':
+        logger.debug(
+            "Digested %d rows: ~%d -> ~%d tokens (%sx).",
+            len(sql_results), raw_tokens, prompt_tokens, report['compression_ratio'],
+        )
+    return text, report
+
+
+def get_digest_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+    stats['token_budget'] = SUMMARY_TOKEN_BUDGET
+    stats['overall_compression_ratio'] = (
+        round(stats['raw_tokens'] / stats['prompt_tokens'], 2) if stats['prompt_tokens'] else 1.0
+    )
+    return stats
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark for the depth-time contour builder.
+
+Compares the original list-based pivot (kept here as the baseline) with
+`argo_service.build_contour_matrix` on synthetic daily profiles at the six
+standard depths, for windows from one month to ten years.
+
+Run from Fastapi_backend/:
+    python -m benchmarks.bench_contour
+"""
+import os
+import time
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+# argo_service imports postgres_service, which refuses to load without a URL.
+# No connection is opened by this benchmark.
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+
+from app.services.argo_service import build_contour_matrix
+
+DEPTHS = [10, 100, 200, 500, 1000, 2000]
+WINDOWS = [("1 month", 30), ("1 year", 365), ("5 years", 5 * 365), ("10 years", 10 * 365)]
+REPEATS = 3
+
+
+def legacy_contour_matrix(rows: List[Dict[str, Any]], column: str):
+    """The pivot as it was before vectorization (quadratic in the number of dates)."""
+    unique_times: List[date] = []
+    unique_depths_set = set()
+    for r in rows:
+        t = r['time']
+        if t not in unique_times:
+            unique_times.append(t)
+        unique_depths_set.add(r['depth'])
+    unique_depths: List[int] = sorted(unique_depths_set)
+
+    time_to_idx: Dict[date, int] = {t: i for i, t in enumerate(unique_times)}
+    depth_to_idx: Dict[int, int] = {d: i for i, d in enumerate(unique_depths)}
+
+    matrix: List[List[Any]] = [
+        [None for _ in range(len(unique_times))] for _ in range(len(unique_depths))
+    ]
+    for r in rows:
+        matrix[depth_to_idx[r['depth']]][time_to_idx[r['time']]] = r[column]
+
+    times_str: List[str] = [t.isoformat() for t in unique_times]
+    return times_str, unique_depths, matrix
+
+
+def make_rows(days: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    rows = []
+    for offset in range(days):
+        t = start + timedelta(days=offset)
+        for depth in DEPTHS:
+            # ~2% of the cells are NULL, like gaps in the real profiles.
+            value = None if rng.random() < 0.02 else 28.0 - depth / 100.0 + rng.gauss(0, 0.5)
+            rows.append({'time': t, 'depth': depth, 'avg_temperature': value})
+    return rows
+
+
+def best_of(fn, *args, **kwargs) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    print(f"{'window':>10} {'rows':>8} {'legacy ms':>11} {'numpy ms':>10} {'speedup':>8} {'30d regrid ms':>14}")
+    for label, days in WINDOWS:
+        rows = make_rows(days)
+        assert build_contour_matrix(rows, 'avg_temperature') == legacy_contour_matrix(rows, 'avg_temperature')
+
+        legacy = best_of(legacy_contour_matrix, rows, 'avg_temperature')
+        vectorized = best_of(build_contour_matrix, rows, 'avg_temperature')
+        regridded = best_of(build_contour_matrix, rows, 'avg_temperature', time_step_days=30)
+        print(
+            f"{label:>10} {len(rows):>8} {legacy * 1000:>11.1f} {vectorized * 1000:>10.1f} "
+            f"{legacy / vectorized:>7.1f}x {regridded * 1000:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
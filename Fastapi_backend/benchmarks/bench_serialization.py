@@ -0,0 +1,103 @@
+"""
+Serialization benchmark for the dashboard endpoints: the default JSON path
+(Pydantic models / nested lists through FastAPI's jsonable_encoder) against
+the columnar JSON and Arrow IPC formats from `app.services.columnar`.
+
+Measures encode time and payload size on synthetic daily data; Arrow rows
+are skipped when pyarrow is not installed.
+
+Run from Fastapi_backend/:
+    python -m benchmarks.bench_serialization
+"""
+import os
+import json
+import time
+import random
+from datetime import date, timedelta
+
+# argo_service imports postgres_service, which refuses to load without a URL.
+# No connection is opened by this benchmark.
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+
+from fastapi.encoders import jsonable_encoder
+
+from app.schemas.models import TimeSeriesResponse
+from app.services import columnar
+from app.services.argo_service import contour_arrays, _contour_to_lists
+
+DEPTHS = [10, 100, 200, 500, 1000, 2000]
+WINDOWS = [("1 year", 365), ("10 years", 10 * 365), ("30 years", 30 * 365)]
+REPEATS = 5
+
+
+def make_rows(days: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = date(1995, 1, 1)
+    rows = []
+    for offset in range(days):
+        t = start + timedelta(days=offset)
+        for depth in DEPTHS:
+            rows.append({
+                'grid_id': '-1.0_59.0', 'latitude': -1.0, 'longitude': 59.0,
+                'time': t, 'depth': depth,
+                'avg_temperature': None if rng.random() < 0.02 else 28.0 - depth / 100.0 + rng.gauss(0, 0.5),
+                'avg_salinity': 35.0 + rng.gauss(0, 0.2),
+            })
+    return rows
+
+
+def best_of(fn):
+    timings, payload = [], None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        payload = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, len(payload)
+
+
+def timeseries_json(rows):
+    model = TimeSeriesResponse(grid_id='-1.0_59.0', latitude=-1.0, longitude=59.0, profiles=rows)
+    return json.dumps(jsonable_encoder(model)).encode('utf-8')
+
+
+def contour_json(rows):
+    times, depths, matrix = _contour_to_lists(*contour_arrays(rows, 'avg_temperature'))
+    return json.dumps(jsonable_encoder({'times': times, 'depths': depths, 'matrix': matrix})).encode('utf-8')
+
+
+def contour_table(rows):
+    times, depths, matrix = contour_arrays(rows, 'avg_temperature')
+    return columnar.contour_columns({'times': times, 'depths': depths, 'matrix': matrix})
+
+
+def report(label, n_rows, cases):
+    baseline_ms, baseline_bytes = cases[0][1]
+    for name, (ms, size) in cases:
+        print(f"{label:>22} {n_rows:>7} {name:>14} {ms:>9.1f} {size / 1024:>10.1f} "
+              f"{baseline_ms / ms:>7.1f}x {baseline_bytes / size:>6.1f}x")
+
+
+def main():
+    print(f"{'endpoint / window':>22} {'rows':>7} {'format':>14} {'ms':>9} {'KiB':>10} {'faster':>8} {'smaller':>7}")
+    for label, days in WINDOWS:
+        rows = make_rows(days)
+        series = [r for r in rows if r['depth'] == 100]
+        cases = [
+            ('json', best_of(lambda: timeseries_json(series))),
+            ('columnar json', best_of(lambda: columnar.encode_columnar_json(columnar.timeseries_columns(series), {}))),
+        ]
+        if columnar.pa is not None:
+            cases.append(('arrow', best_of(lambda: columnar.encode_arrow(columnar.timeseries_columns(series), {}))))
+        report(f"timeseries {label}", len(series), cases)
+
+        cases = [
+            ('json', best_of(lambda: contour_json(rows))),
+            ('columnar json', best_of(lambda: columnar.encode_columnar_json(contour_table(rows), {}))),
+        ]
+        if columnar.pa is not None:
+            cases.append(('arrow', best_of(lambda: columnar.encode_arrow(contour_table(rows), {}))))
+        report(f"contour {label}", len(rows), cases)
+
+
+if __name__ == "__main__":
+    main()
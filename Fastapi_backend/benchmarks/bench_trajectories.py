@@ -0,0 +1,55 @@
+"""
+Benchmark for trajectory lookups: the legacy scan that unpacks
+`average_ocean_profiles.argo_float_ids` on every row, against the
+`argo_float_membership` table built by build_float_index.py.
+
+Needs a database with both tables (DATABASE_URL, or the .env file).
+Run from Fastapi_backend/ after building the membership table:
+    python -m benchmarks.bench_trajectories
+"""
+import time
+import statistics
+
+from app.services import argo_service, postgres_service
+
+ID_COUNTS = [1, 10, 100]
+REPEATS = 20
+
+
+def sample_float_ids(n: int):
+    rows = postgres_service.execute_secure_query(
+        f"""
+        SELECT float_id FROM {argo_service.FLOAT_MEMBERSHIP_TABLE}
+        GROUP BY float_id ORDER BY COUNT(*) DESC, float_id LIMIT %s
+        """,
+        [n],
+    )
+    return [row['float_id'] for row in rows]
+
+
+def median_ms(fn, float_ids) -> float:
+    fn(float_ids)  # warm up the connection and the plan cache
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(float_ids)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    all_ids = sample_float_ids(max(ID_COUNTS))
+    print(f"{'ids':>5} {'points':>7} {'scan ms':>9} {'membership ms':>14} {'speedup':>8}")
+    for count in ID_COUNTS:
+        float_ids = all_ids[:count]
+        legacy_rows = argo_service._legacy_trajectory_rows(float_ids)
+        membership_rows = argo_service._membership_trajectory_rows(float_ids)
+        assert len(legacy_rows) == len(membership_rows)
+
+        legacy = median_ms(argo_service._legacy_trajectory_rows, float_ids)
+        membership = median_ms(argo_service._membership_trajectory_rows, float_ids)
+        print(f"{len(float_ids):>5} {len(membership_rows):>7} {legacy:>9.2f} {membership:>14.2f} {legacy / membership:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,23 @@
 # In file: main.py
 
-from fastapi import FastAPI
+import os
+import time
+import logging
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from app.api import routes as api_routes
+from app.services import postgres_service, metrics, llm_gateway, profiler
 from fastapi.middleware.cors import CORSMiddleware # 1. Add this import
+
+# Leveled logging for the whole app; LOG_LEVEL=DEBUG shows per-stage details.
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger("argo")
+
 origins = [
-    "http://localhost:3000", 
+    "http://localhost:3000",
 ]
 
 # Create the FastAPI app instance
@@ -22,9 +35,64 @@ app.add_middleware(
     allow_headers=["*"], # Allows all headers
 )
 
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """
+    Collects the spans of one request, records the request in the HTTP
+    metrics and reports the per-stage times in a `Server-Timing` header.
+    Requests flagged with `X-Profile` / `?profile=` are also sampled by the
+    profiler when an admin has enabled it (see services/profiler.py).
+    """
+    token = metrics.start_trace()
+    trace = metrics.current_trace()
+    profile = None
+    if profiler.requested(request.headers, request.query_params):
+        profile = trace['profiler'] = profiler.start(request.method, request.url.path)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        timing = metrics.server_timing(trace)
+        if timing:
+            response.headers["Server-Timing"] = timing
+        if profile is not None:
+            report = profiler.finish(profile, status, metrics.stage_totals(trace))
+            profile = None
+            response.headers["X-Profile-Id"] = report['id']
+            response.headers["X-Profile-Report"] = f"/api/debug/profiles/{report['id']}"
+        return response
+    finally:
+        if profile is not None:
+            # The request failed before a response existed; keep the profile anyway.
+            profiler.finish(profile, status, metrics.stage_totals(trace))
+        seconds = time.perf_counter() - start
+        # Unmatched paths share one label so scanners can't blow up the series count.
+        matched = request.scope.get("route")
+        route = trace['route'] or getattr(matched, "path", None) or "unmatched"
+        metrics.observe_request(route, request.method, status, seconds)
+        logger.debug(
+            "%s %s -> %s in %.3fs [%s]", request.method, route, status, seconds, metrics.server_timing(trace)
+        )
+        metrics.end_trace(token)
+
+@app.on_event("shutdown")
+def close_database_pool():
+    postgres_service.close_pool()
+
 # Include the API router
 app.include_router(api_routes.router, prefix="/api")
 
+# Connection pool and LLM gateway state are exported as gauges.
+metrics.register_gauges("db_pool", postgres_service.get_pool_stats)
+metrics.register_gauges("db_readonly_pool", postgres_service.get_readonly_pool_stats)
+metrics.register_gauges("llm_gateway", llm_gateway.get_gateway_stats)
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Counters and histograms in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/", tags=["Root"])
 async def read_root():
-    return {"message": "Welcome to the Argo Floatchat API!"}
\ No newline at end of file
+    return {"message": "Welcome to the Argo Floatchat API!"}
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The app modules read their configuration at import time; none of these
+# tests open a database connection.
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/argo_test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,51 @@
+import pytest
+
+from app.services import columnar
+from app.services.columnar import ARROW_MEDIA_TYPE, COLUMNAR_JSON_MEDIA_TYPE, negotiate
+
+
+@pytest.fixture
+def with_arrow(monkeypatch):
+    # negotiate only checks that pyarrow imported; the module itself is not used.
+    monkeypatch.setattr(columnar, "pa", object())
+
+
+@pytest.fixture
+def without_arrow(monkeypatch):
+    monkeypatch.setattr(columnar, "pa", None)
+
+
+@pytest.mark.parametrize("accept", [None, "", "*/*", "application/json", "text/html", "application/*"])
+def test_json_by_default(with_arrow, accept):
+    assert negotiate(accept) == 'json'
+
+
+def test_exact_media_types(with_arrow):
+    assert negotiate(ARROW_MEDIA_TYPE) == 'arrow'
+    assert negotiate(COLUMNAR_JSON_MEDIA_TYPE) == 'columnar'
+    assert negotiate(ARROW_MEDIA_TYPE.upper()) == 'arrow'
+
+
+def test_arrow_needs_pyarrow(without_arrow):
+    assert negotiate(ARROW_MEDIA_TYPE) == 'json'
+    assert negotiate(f"{ARROW_MEDIA_TYPE}, {COLUMNAR_JSON_MEDIA_TYPE};q=0.5") == 'columnar'
+
+
+def test_highest_q_value_wins(with_arrow):
+    assert negotiate(f"application/json;q=0.9, {COLUMNAR_JSON_MEDIA_TYPE}") == 'columnar'
+    assert negotiate(f"{ARROW_MEDIA_TYPE};q=0.2, application/json;q=0.8") == 'json'
+    assert negotiate(f"{COLUMNAR_JSON_MEDIA_TYPE};q=0.5, {ARROW_MEDIA_TYPE};q=0.6") == 'arrow'
+
+
+def test_ties_keep_header_order(with_arrow):
+    assert negotiate(f"{COLUMNAR_JSON_MEDIA_TYPE}, {ARROW_MEDIA_TYPE}") == 'columnar'
+    assert negotiate(f"{ARROW_MEDIA_TYPE}, {COLUMNAR_JSON_MEDIA_TYPE}") == 'arrow'
+
+
+def test_zero_and_invalid_q_values_are_refusals(with_arrow):
+    assert negotiate(f"{ARROW_MEDIA_TYPE};q=0") == 'json'
+    assert negotiate(f"{ARROW_MEDIA_TYPE};q=abc, {COLUMNAR_JSON_MEDIA_TYPE};q=0.1") == 'columnar'
+
+
+def test_unknown_types_are_skipped(with_arrow):
+    assert negotiate(f"text/csv, {COLUMNAR_JSON_MEDIA_TYPE};q=0.5") == 'columnar'
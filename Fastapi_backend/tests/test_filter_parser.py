@@ -0,0 +1,60 @@
+import pytest
+
+from app.agents.filter_parser import _parse, parse_conditions, parse_filter
+
+ARABIAN_SEA = [
+    {'latitude': {'$gte': 8.0}}, {'latitude': {'$lte': 25.0}},
+    {'longitude': {'$gte': 50.0}}, {'longitude': {'$lte': 75.0}},
+]
+
+
+def test_region_with_month_and_year():
+    assert parse_conditions("temperature in the Arabian Sea in March 2023") == ARABIAN_SEA + [
+        {'year': {'$eq': 2023}}, {'month': {'$eq': 3}},
+    ]
+
+
+def test_region_without_longitude_bounds():
+    assert parse_conditions("warmer than 28 near the equator") == [
+        {'latitude': {'$gte': -10.0}}, {'latitude': {'$lte': 10.0}}, {'temperature': {'$gt': 28.0}},
+    ]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("salinity above 35 psu", [{'salinity': {'$gt': 35.0}}]),
+    ("depth greater than 1000", [{'depth': {'$gt': 1000}}]),
+    ("salinity at 500 meters", [{'depth': {'$eq': 500}}]),
+    ("temperature between 25 and 20 degrees at 100 m depth", [
+        {'temperature': {'$gte': 20.0}}, {'temperature': {'$lte': 25.0}}, {'depth': {'$eq': 100}},
+    ]),
+    ("sst over 30 in sept 2020", [
+        {'temperature': {'$gt': 30.0}}, {'year': {'$eq': 2020}}, {'month': {'$eq': 9}},
+    ]),
+    ("temperature in 2022-07", [{'year': {'$eq': 2022}}, {'month': {'$eq': 7}}]),
+    ("ocean data in May 2021", [{'year': {'$eq': 2021}}, {'month': {'$eq': 5}}]),
+])
+def test_conditions(query, expected):
+    assert parse_conditions(query) == expected
+
+
+@pytest.mark.parametrize("query, reason", [
+    ("what may happen", 'no_match'),
+    ("temperature in the Arabian Sea and the Bay of Bengal", 'conflict'),
+    ("temperature in 2021 and 2022", 'conflict'),
+    ("temperature in 2022-13", 'unparsed_terms'),
+    ("profiles from 2022-07", 'unparsed_terms'),
+    # float_ids metadata is a comma-joined string; $eq / $in cannot match it.
+    ("temperature of float 2901861", 'float_ids'),
+    ("floats 2901861, 2902215 in March 2023", 'float_ids'),
+])
+def test_falls_back_to_the_llm(query, reason):
+    assert _parse(query) == (None, reason)
+    assert parse_conditions(query) is None
+
+
+def test_parse_filter_shapes():
+    assert parse_filter("salinity above 35 psu") == {'salinity': {'$gt': 35.0}}
+    assert parse_filter("temperature in the Arabian Sea in March 2023") == {'$and': ARABIAN_SEA + [
+        {'year': {'$eq': 2023}}, {'month': {'$eq': 3}},
+    ]}
+    assert parse_filter("temperature of float 2901861") is None
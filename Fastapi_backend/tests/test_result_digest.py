@@ -0,0 +1,90 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from app.services.result_digest import build_digest, digest_results, estimate_tokens
+
+
+def make_rows():
+    """Two depths x three grid cells x twelve months, warming 1 degree per year."""
+    rows = []
+    for depth in (5, 10):
+        for cell in ('a', 'b', 'c'):
+            for month in range(1, 13):
+                rows.append({
+                    'grid_id': cell,
+                    'time': date(2020, month, 1),
+                    'depth': depth,
+                    'latitude': 10.0,
+                    'temperature': 30.0 - depth + (month - 1) / 12,
+                    'salinity': Decimal("35.5"),
+                })
+    return rows
+
+
+def test_overall_statistics_and_time_range():
+    rows = make_rows()
+    digest = build_digest(rows, max_groups=10, sample_rows=0)
+    assert digest['row_count'] == 72
+    assert digest['columns'] == list(rows[0].keys())
+    assert digest['time_range'] == {'column': 'time', 'start': '2020-01-01', 'end': '2020-12-01'}
+    temperature = digest['overall']['temperature']
+    assert temperature['count'] == 72
+    assert temperature['min'] == 20.0
+    assert temperature['max'] == 25.92
+    assert abs(temperature['trend_per_year'] - 1.0) < 0.05
+    # Coordinates are described but get no trend.
+    assert 'trend_per_year' not in digest['overall']['latitude']
+    assert digest['overall']['salinity']['std'] == 0.0
+
+
+def test_groups_are_capped_and_ordered():
+    digest = build_digest(make_rows(), max_groups=2, sample_rows=0)
+    by_depth = digest['by_group']['depth']
+    assert by_depth['total_groups'] == 2
+    # Depths sort numerically, not as text.
+    assert list(by_depth['groups']) == ['5', '10']
+    assert by_depth['groups']['5']['temperature']['mean'] > by_depth['groups']['10']['temperature']['mean']
+    assert digest['by_group']['grid_id']['total_groups'] == 3
+    assert len(digest['by_group']['grid_id']['groups']) == 2
+    assert digest['by_group']['month']['total_groups'] == 12
+    assert list(digest['by_group']['month']['groups']) == ['2020-01', '2020-02']
+
+
+def test_no_groups_requested():
+    assert 'by_group' not in build_digest(make_rows(), max_groups=0, sample_rows=0)
+
+
+def test_samples_include_the_extremes():
+    rows = make_rows()
+    samples = build_digest(rows, max_groups=0, sample_rows=2)['sample_rows']
+    temperatures = [row['temperature'] for row in samples]
+    assert min(r['temperature'] for r in rows) in temperatures
+    assert max(r['temperature'] for r in rows) in temperatures
+    assert samples[0] is rows[0] and samples[-1] is rows[-1]
+
+
+def test_missing_values_are_skipped():
+    rows = [{'depth': 1, 'temperature': None}, {'depth': 2, 'temperature': 4.0}, {'depth': 3, 'temperature': 6.0}]
+    digest = build_digest(rows, max_groups=10, sample_rows=3)
+    assert digest['overall']['temperature'] == {'count': 2, 'min': 4.0, 'max': 6.0, 'mean': 5.0, 'std': 1.0}
+    assert 'time_range' not in digest
+    # One row per depth: nothing to aggregate.
+    assert 'by_group' not in digest
+
+
+def test_digest_results_passes_small_results_through():
+    rows = [{'depth': 1, 'temperature': 4.0}]
+    text, report = digest_results(rows, token_budget=1000)
+    assert report['mode'] == 'raw'
+    assert json.loads(text) == rows
+
+
+def test_digest_results_fits_the_budget():
+    rows = make_rows()
+    text, report = digest_results(rows, token_budget=600)
+    assert report['mode'] == 'digest'
+    assert report['rows'] == 72
+    assert estimate_tokens(text) <= 600
+    assert report['prompt_tokens'] < report['raw_tokens']
+    assert json.loads(text)['row_count'] == 72
@@ -0,0 +1,82 @@
+import pytest
+
+from app.services.postgres_service import QueryRejectedError, _single_select, _sql_skeleton
+
+
+def rejected(sql_query: str) -> str:
+    with pytest.raises(QueryRejectedError) as info:
+        _single_select(sql_query)
+    return info.value.reason
+
+
+def test_skeleton_keeps_positions():
+    sql_query = "SELECT 'a;b', \"c;d\" -- e;f\nFROM t /* g;h */"
+    skeleton = _sql_skeleton(sql_query)
+    assert len(skeleton) == len(sql_query)
+    assert ";" not in skeleton
+    assert skeleton.startswith("SELECT '   ', \"   \"")
+    assert "\nFROM t" in skeleton
+
+
+def test_line_comment_hides_everything_to_end_of_line():
+    assert _single_select("SELECT 1 -- ; DELETE FROM t") == "SELECT 1"
+    assert rejected("SELECT 1 -- comment\n; DELETE FROM t") == 'multiple_statements'
+
+
+def test_nested_block_comments():
+    assert _single_select("SELECT 1 /* outer /* inner; */ still; comment */ FROM t") == (
+        "SELECT 1 /* outer /* inner; */ still; comment */ FROM t"
+    )
+    # Postgres nests block comments, so the first */ does not end this one.
+    assert rejected("SELECT 1 /* a /* b */ ; DELETE FROM t") == 'parse_error'
+    assert rejected("SELECT 1 /* a /* b */ c */ ; DELETE FROM t") == 'multiple_statements'
+
+
+def test_dollar_quoted_strings():
+    assert _single_select("SELECT $$ ; DELETE FROM t $$ AS x") == "SELECT $$ ; DELETE FROM t $$ AS x"
+    assert _single_select("SELECT $tag$ it's; $$ $tag$ AS x;") == "SELECT $tag$ it's; $$ $tag$ AS x"
+    assert rejected("SELECT $tag$ ; DELETE FROM t $other$") == 'parse_error'
+    # $1 is a parameter, not the start of a dollar quote.
+    assert rejected("SELECT $1; DELETE FROM t") == 'multiple_statements'
+
+
+def test_standard_and_escape_strings():
+    assert _single_select("SELECT 'it''s; fine'") == "SELECT 'it''s; fine'"
+    assert _single_select("SELECT E'it\\'s; fine'") == "SELECT E'it\\'s; fine'"
+    # Outside E'', a backslash is an ordinary character and the quote closes the string.
+    assert rejected("SELECT 'a\\'; DELETE FROM t; --'") == 'multiple_statements'
+    # The e of WHERE does not make the following string an escape string.
+    assert rejected("SELECT 1 FROM t WHERE'a\\'; DELETE FROM t; --'") == 'multiple_statements'
+    assert rejected("SELECT 'unterminated") == 'parse_error'
+
+
+def test_quoted_identifiers():
+    assert _single_select('SELECT "a;b", "say ""delete""" FROM "into"') == (
+        'SELECT "a;b", "say ""delete""" FROM "into"'
+    )
+    assert rejected('SELECT "a;b"; DROP TABLE t') == 'multiple_statements'
+
+
+def test_data_modifying_statements():
+    assert rejected("WITH gone AS (DELETE FROM t RETURNING *) SELECT * FROM gone") == 'not_select'
+    assert rejected("WITH x AS (SELECT 1) INSERT INTO t SELECT * FROM x") == 'not_select'
+    assert rejected("SELECT * INTO copy_of_t FROM t") == 'not_select'
+    assert rejected("SELECT set_config('default_transaction_read_only', 'off', false)") == 'not_select'
+    assert rejected("DELETE FROM t") == 'not_select'
+    assert rejected("  ") == 'not_select'
+
+
+def test_keywords_inside_literals_are_allowed():
+    assert _single_select("SELECT 'update' AS action, updated_at FROM t") == (
+        "SELECT 'update' AS action, updated_at FROM t"
+    )
+    assert _single_select("SELECT CASE WHEN x > 0 THEN 1 END FROM t")
+
+
+def test_trailing_semicolons():
+    assert _single_select("SELECT 1;") == "SELECT 1"
+    assert _single_select("SELECT 1 ;; \n") == "SELECT 1"
+    assert _single_select("SELECT 1; -- done") == "SELECT 1"
+    assert _single_select("select 1 /* ; */ ;") == "select 1"
+    assert rejected("SELECT 1; SELECT 2") == 'multiple_statements'
+    assert rejected("SELECT 1;; SELECT 2;") == 'multiple_statements'
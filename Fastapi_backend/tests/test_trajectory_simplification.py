@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from app.services.argo_service import decimate_by_time, douglas_peucker, simplify_points, zoom_tolerance
+
+
+def test_short_tracks_and_zero_tolerance_keep_every_point():
+    assert douglas_peucker(np.array([0.0, 1.0]), np.array([0.0, 1.0]), 1.0).tolist() == [True, True]
+    lats = np.array([0.0, 5.0, 0.0, 5.0])
+    assert douglas_peucker(lats, np.arange(4.0), 0).all()
+
+
+def test_straight_line_keeps_only_the_end_points():
+    lons = np.linspace(0, 10, 11)
+    lats = 2 * lons + 1
+    assert douglas_peucker(lats, lons, 1e-9).tolist() == [True] + [False] * 9 + [True]
+
+
+def test_spike_is_kept_only_above_the_tolerance():
+    lons = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+    lats = np.array([0.0, 0.0, 0.5, 0.0, 0.0])
+    assert douglas_peucker(lats, lons, 0.4).tolist() == [True, False, True, False, True]
+    assert douglas_peucker(lats, lons, 0.6).tolist() == [True, False, False, False, True]
+
+
+def test_closed_loop_measures_from_the_start_point():
+    # First and last points coincide, so distances are to that point.
+    lons = np.array([0.0, 1.0, 2.0, 1.0, 0.0])
+    lats = np.array([0.0, 1.0, 0.0, -1.0, 0.0])
+    keep = douglas_peucker(lats, lons, 0.5)
+    assert keep[0] and keep[2] and keep[-1]
+
+
+def test_dropped_points_stay_within_the_tolerance():
+    rng = np.random.default_rng(7)
+    lons = np.cumsum(rng.normal(0.1, 0.05, 500))
+    lats = np.cumsum(rng.normal(0.0, 0.05, 500))
+    tolerance = 0.05
+    keep = douglas_peucker(lats, lons, tolerance)
+    kept = np.flatnonzero(keep)
+    assert kept[0] == 0 and kept[-1] == len(lats) - 1
+    assert 2 < len(kept) < len(lats)
+    for first, last in zip(kept[:-1], kept[1:]):
+        dx, dy = lons[last] - lons[first], lats[last] - lats[first]
+        xs, ys = lons[first + 1:last] - lons[first], lats[first + 1:last] - lats[first]
+        distances = np.abs(xs * dy - ys * dx) / np.hypot(dx, dy)
+        assert (distances <= tolerance + 1e-12).all()
+
+
+def test_zoom_tolerance_halves_per_level():
+    assert zoom_tolerance(5) == pytest.approx(zoom_tolerance(4) / 2)
+    assert zoom_tolerance(0) > zoom_tolerance(10)
+
+
+def test_decimate_by_time_keeps_first_per_bin_and_the_last_point():
+    times = np.array(['2020-01-01', '2020-01-03', '2020-01-11', '2020-01-12', '2020-01-25'], dtype='datetime64[D]')
+    assert decimate_by_time(times, 10).tolist() == [True, False, True, False, True]
+    assert decimate_by_time(times[:0], 10).tolist() == []
+
+
+def test_simplify_points_applies_both_steps():
+    points = [
+        {'time': f"2020-01-{day:02d}", 'latitude': 0.0, 'longitude': float(day), 'grid_id': str(day)}
+        for day in range(1, 21)
+    ]
+    assert simplify_points(points[:2], zoom=3, time_step_days=5) == points[:2]
+    decimated = simplify_points(points, zoom=None, time_step_days=5)
+    assert [p['grid_id'] for p in decimated] == ['1', '6', '11', '16', '20']
+    # Collinear points collapse to the two ends.
+    assert simplify_points(points, zoom=3, time_step_days=None) == [points[0], points[-1]]
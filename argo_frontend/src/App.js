@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useState, useRef } from 'react';
 import MapComponent from './components/MapComponent';
 import Dashboard from './components/Dashboard2';
 import Sidebar from './components/Sidebar';
@@ -28,6 +28,11 @@ function App() {
   const [trajectories, setTrajectories] = useState([]);
   const [isLoadingTraj, setIsLoadingTraj] = useState(false);
   const [isSidebarOpen, setIsSidebarOpen] = useState(false); // New state for sidebar
+  const [mapZoom, setMapZoom] = useState(4);
+  const [trajectoryIds, setTrajectoryIds] = useState([]);
+  // Only the latest trajectory request may update the map
+  const trajectoryRequestRef = useRef(null);
+  const zoomTimerRef = useRef(null);
 
   const toggleSidebar = () => {
     setIsSidebarOpen(!isSidebarOpen);
@@ -54,26 +59,48 @@ function App() {
     return cleaned;
   };
 
-  const fetchTrajectories = async (inputIds) => {
+  const fetchTrajectories = async (inputIds, zoom = mapZoom) => {
     const ids = inputIds.map(normalizeId).filter(Boolean);
     if (ids.length === 0) return;
+    clearTimeout(zoomTimerRef.current);
+    setTrajectoryIds(ids);
     setIsLoadingTraj(true);
+    if (trajectoryRequestRef.current) trajectoryRequestRef.current.abort();
+    const controller = new AbortController();
+    trajectoryRequestRef.current = controller;
     try {
       const params = new URLSearchParams();
       ids.forEach(id => params.append('argo_ids', id));
+      // The server simplifies tracks to what is visible at this zoom level
+      params.append('zoom', zoom);
       const url = `http://127.0.0.1:8080/api/trajectories?${params.toString()}`;
-      const res = await fetch(url);
+      const res = await fetch(url, { signal: controller.signal });
       if (!res.ok) {
         const data = await res.json();
         throw new Error(data.detail || 'Failed to fetch trajectories');
       }
       const data = await res.json();
+      if (controller.signal.aborted) return;
       setTrajectories(data.trajectories || []);
     } catch (e) {
+      // A newer request replaced this one; leave the map to it
+      if (controller.signal.aborted) return;
       console.error(e);
       setTrajectories([]);
     } finally {
-      setIsLoadingTraj(false);
+      if (trajectoryRequestRef.current === controller) {
+        trajectoryRequestRef.current = null;
+        setIsLoadingTraj(false);
+      }
+    }
+  };
+
+  const handleZoomChange = (zoom) => {
+    setMapZoom(zoom);
+    // Refetch once the zooming has settled, not on every step
+    clearTimeout(zoomTimerRef.current);
+    if (trajectoryIds.length > 0) {
+      zoomTimerRef.current = setTimeout(() => fetchTrajectories(trajectoryIds, zoom), 300);
     }
   };
 
@@ -90,6 +117,8 @@ function App() {
       <div className="main-content map-view">
         <MapComponent 
           onMapClick={handleMapClick}
+          onZoomChange={handleZoomChange}
+          zoom={mapZoom}
           clickedLat={clickedLat}
           clickedLng={clickedLng}
           trajectories={trajectories}
@@ -11,19 +11,23 @@ L.Icon.Default.mergeOptions({
   shadowUrl: require('leaflet/dist/images/marker-shadow.png'),
 });
 
-const MapClickHandler = ({ onMapClick }) => {
+const MapClickHandler = ({ onMapClick, onZoomChange }) => {
   useMapEvents({
     click: (e) => {
       onMapClick(e.latlng.lat, e.latlng.lng);
     },
+    zoomend: (e) => {
+      if (onZoomChange) onZoomChange(e.target.getZoom());
+    },
   });
   return null;
 };
 
 // Add trajectories to props destructuring
-const MapComponent = ({ onMapClick, clickedLat, clickedLng, trajectories }) => { 
+const MapComponent = ({ onMapClick, onZoomChange, zoom, clickedLat, clickedLng, trajectories }) => { 
   const mapCenter = [0, 0];
-  const mapZoom = 4;
+  // MapContainer only reads its zoom prop on mount; later changes come from the map itself.
+  const mapZoom = zoom ?? 4;
 
   return (
     <MapContainer
@@ -36,7 +40,7 @@ const MapComponent = ({ onMapClick, clickedLat, clickedLng, trajectories }) => {
         attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
         url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
       />
-      <MapClickHandler onMapClick={onMapClick} />
+      <MapClickHandler onMapClick={onMapClick} onZoomChange={onZoomChange} />
       
       {/* Conditionally render the blue dot */}
       {clickedLat && clickedLng && (
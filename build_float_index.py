@@ -0,0 +1,110 @@
+import os
+import time
+import argparse
+import psycopg2
+
+# --- Configuration ---
+SOURCE_TABLE = 'average_ocean_profiles'
+MEMBERSHIP_TABLE = 'argo_float_membership'
+
+# Fingerprint of the source table, stored as the membership table's comment.
+# The API compares it with the live value (argo_service) to detect a reload
+# of the source table after the last build; keep the two expressions equal.
+SOURCE_STATE_SQL = f"""
+    SELECT COUNT(*)::text || '|' || COALESCE(MAX("TIME")::text, '') FROM "{SOURCE_TABLE}"
+"""
+BUILT_STATE_SQL = f"SELECT obj_description(to_regclass('{MEMBERSHIP_TABLE}'), 'pg_class')"
+
+# `argo_float_ids` is stored as text such as "[np.int64(2901861), np.int64(2902215)]".
+# Stripping the "np.int64" wrapper first keeps its "64" from being read as an id;
+# every remaining run of digits is a float id.
+BUILD_SQL = f"""
+    DROP TABLE IF EXISTS {MEMBERSHIP_TABLE}_new;
+    CREATE TABLE {MEMBERSHIP_TABLE}_new (
+        float_id  bigint           NOT NULL,
+        time      date             NOT NULL,
+        grid_id   text             NOT NULL,
+        latitude  double precision,
+        longitude double precision
+    );
+    INSERT INTO {MEMBERSHIP_TABLE}_new (float_id, time, grid_id, latitude, longitude)
+    SELECT DISTINCT
+        m[1]::bigint,
+        p."TIME",
+        p.grid_id,
+        p.latitude,
+        p.longitude
+    FROM "{SOURCE_TABLE}" p
+    CROSS JOIN LATERAL regexp_matches(replace(p.argo_float_ids::text, 'np.int64', ''), '(\\d+)', 'g') AS m
+    WHERE p.argo_float_ids IS NOT NULL
+      AND p."TIME" IS NOT NULL
+      AND p.grid_id IS NOT NULL;
+    ALTER TABLE {MEMBERSHIP_TABLE}_new
+        ADD CONSTRAINT {MEMBERSHIP_TABLE}_new_pkey PRIMARY KEY (float_id, time, grid_id);
+    CREATE INDEX {MEMBERSHIP_TABLE}_new_time_idx ON {MEMBERSHIP_TABLE}_new (time);
+    CREATE INDEX {MEMBERSHIP_TABLE}_new_grid_idx ON {MEMBERSHIP_TABLE}_new (grid_id, time);
+
+    DROP TABLE IF EXISTS {MEMBERSHIP_TABLE};
+    ALTER TABLE {MEMBERSHIP_TABLE}_new RENAME TO {MEMBERSHIP_TABLE};
+    ALTER INDEX {MEMBERSHIP_TABLE}_new_pkey RENAME TO {MEMBERSHIP_TABLE}_pkey;
+    ALTER INDEX {MEMBERSHIP_TABLE}_new_time_idx RENAME TO {MEMBERSHIP_TABLE}_time_idx;
+    ALTER INDEX {MEMBERSHIP_TABLE}_new_grid_idx RENAME TO {MEMBERSHIP_TABLE}_grid_idx;
+"""
+
+
+def build_float_index(database_url: str, force: bool = False) -> bool:
+    """
+    (Re)builds the float -> (time, grid_id) membership table from the gridded
+    surface table. The new table is filled and indexed under a temporary name
+    and swapped in within one transaction, so the API never sees it half built.
+
+    Skips the build when the table already matches the source table, unless
+    `force` is set. Returns True if the table was rebuilt.
+    """
+    start = time.time()
+    conn = psycopg2.connect(database_url)
+    try:
+        # One snapshot for the fingerprint and the copy.
+        conn.set_session(isolation_level='REPEATABLE READ')
+        with conn.cursor() as cursor:
+            cursor.execute(SOURCE_STATE_SQL)
+            source_state = cursor.fetchone()[0]
+            cursor.execute(BUILT_STATE_SQL)
+            if not force and cursor.fetchone()[0] == source_state:
+                conn.rollback()
+                print(f"{MEMBERSHIP_TABLE} is up to date with {SOURCE_TABLE}; skipping the build.")
+                return False
+            cursor.execute(BUILD_SQL)
+            cursor.execute(f"COMMENT ON TABLE {MEMBERSHIP_TABLE} IS %s", (source_state,))
+        conn.commit()
+
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"ANALYZE {MEMBERSHIP_TABLE}")
+            cursor.execute(f"SELECT COUNT(*), COUNT(DISTINCT float_id) FROM {MEMBERSHIP_TABLE}")
+            rows, floats = cursor.fetchone()
+    finally:
+        conn.close()
+    print(f"✅ Built {MEMBERSHIP_TABLE}: {rows} rows for {floats} floats in {time.time() - start:.2f}s.")
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Normalize Argo float ids into an indexed membership table for trajectory lookups."
+    )
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'),
+                        help="PostgreSQL connection URL (default: $DATABASE_URL).")
+    parser.add_argument('--force', action='store_true',
+                        help="Rebuild even if the table matches the source table.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.database_url:
+        raise SystemExit("DATABASE_URL environment variable is not set (or pass --database-url).")
+    if build_float_index(args.database_url, force=args.force):
+        # Cached trajectories were computed from the old table.
+        from ingest_data import client, COLLECTION_NAME, bump_dataset_version
+        bump_dataset_version(client.get_or_create_collection(name=COLLECTION_NAME))
@@ -1,6 +1,14 @@
 import os
 import glob
 import re
+import time
+import random
+import queue
+import threading
+import argparse
+import json
+import uuid
+import hashlib
 import numpy as np
 import pandas as pd
 import chromadb
@@ -12,6 +20,30 @@ CHROMA_HOST = 'localhost'
 CHROMA_PORT = 8000
 COLLECTION_NAME = 'argo_profiles'
 BATCH_SIZE = 5000 
+CHUNK_SIZE = 50000  # Rows read from a CSV at a time in chunked mode
+UPLOAD_WORKERS = 4  # Concurrent upload threads in chunked mode
+UPLOAD_MAX_RETRIES = 3
+UPLOAD_BACKOFF_SECONDS = 1.0
+MANIFEST_PATH = './ingest_manifest.json'  # Local state for incremental mode
+MANIFEST_VERSION = 1  # Bump when the stable ID or row hash scheme changes
+DATASET_VERSION_KEY = 'dataset_version'  # Read by the API to invalidate its caches
+
+# Sample questions for --mode compare-compaction. Each has the depth filter
+# written for per-depth documents and for compacted profile documents (the
+# same rewrite `retrieve_vector_docs` applies).
+COMPARISON_QUERIES = [
+    ("temperature at 100 meters depth near the equator",
+     {"depth": {"$eq": 100}},
+     {"has_level_100m": {"$eq": True}}),
+    ("deep ocean temperature at 1000 m in the Arabian Sea",
+     {"$and": [{"depth": {"$eq": 1000}}, {"latitude": {"$gte": 8}}, {"longitude": {"$lte": 75}}]},
+     {"$and": [{"has_level_1000m": {"$eq": True}}, {"latitude": {"$gte": 8}}, {"longitude": {"$lte": 75}}]}),
+    ("salinity in the upper 200 meters of the Bay of Bengal",
+     {"$and": [{"depth": {"$lte": 200}}, {"longitude": {"$gte": 80}}]},
+     {"$and": [{"depth_min": {"$lte": 200}}, {"longitude": {"$gte": 80}}]}),
+    ("warm surface water temperature profile", None, None),
+    ("cold water below 500 meters", {"depth": {"$gte": 500}}, {"depth_max": {"$gte": 500}}),
+]
 
 # --- ChromaDB Client Setup ---
 try:
@@ -152,8 +184,705 @@ def process_and_ingest_data(data_directory, collection):
     else:
         print("No valid data to ingest.")
 
+def _format_2f(values):
+    """
+    Formats a numeric Series as '%.2f' strings without a Python-level loop.
+    """
+    return pd.Series(np.char.mod('%.2f', values.to_numpy(dtype=float)), index=values.index)
+
+def build_chunk_records(df, source_file, is_3d_data):
+    """
+    Column-wise equivalent of the per-row loop in `process_and_ingest_data`.
+    Produces the same documents, metadata and IDs for a (cleaned) DataFrame chunk.
+
+    Returns:
+        tuple: (documents, metadatas, ids) lists ready for `collection.add`.
+    """
+    time_str = df['TIME'].astype(str)
+    parsed_time = pd.to_datetime(time_str, format='%Y-%m-%d', errors='coerce')
+    has_date = parsed_time.notna()
+    time_formatted = parsed_time.dt.strftime('%Y-%m-%d').where(has_date, time_str)
+
+    if 'argo_float_ids' in df.columns:
+        float_ids_clean = (
+            df['argo_float_ids'].astype(str)
+            .str.findall(r'np\.int64\((\d+)\)')
+            .str.join(', ')
+        )
+    else:
+        float_ids_clean = pd.Series(extract_float_ids('[np.int64(0)]'), index=df.index)
+
+    temp_str = _format_2f(df['avg_temperature'])
+    sal_str = _format_2f(df['avg_salinity'])
+    lat_str = _format_2f(df['latitude'])
+    lon_str = _format_2f(df['longitude'])
+    index_str = pd.Series(df.index.astype(str), index=df.index)
+
+    if is_3d_data:
+        depth = df['depth'].astype(int)
+        depth_str = depth.astype(str)
+        documents = (
+            "An Argo float measured an average temperature of " + temp_str + "°C "
+            + "and an average salinity of " + sal_str + " PSU "
+            + "at a depth of " + depth_str + " meters "
+            + "at a location of " + lat_str + "N, " + lon_str + "E on " + time_formatted + "."
+        )
+        ids = float_ids_clean + "-" + time_formatted + "-" + depth_str + "-" + index_str
+    else:
+        documents = (
+            "Some Argo floats measured an average temperature of " + temp_str + "°C "
+            + "and an average salinity of " + sal_str + " PSU "
+            + "at a location of " + lat_str + "N, " + lon_str + "E "
+            + "on " + time_formatted + "."
+        )
+        ids = float_ids_clean + "-" + time_formatted + "-" + index_str
+
+    meta_df = pd.DataFrame({
+        'source_file': source_file,
+        'float_ids': float_ids_clean,
+        'latitude': df['latitude'].astype(float),
+        'longitude': df['longitude'].astype(float),
+        'temperature': df['avg_temperature'].astype(float),
+        'salinity': df['avg_salinity'].astype(float),
+    })
+    if is_3d_data:
+        meta_df['depth'] = depth
+    metadatas = meta_df.to_dict('records')
+
+    # Rows whose date could not be parsed carry no year/month/day keys, as before.
+    if has_date.any():
+        date_df = pd.DataFrame({
+            'year': parsed_time.dt.year,
+            'month': parsed_time.dt.month,
+            'day': parsed_time.dt.day,
+        })[has_date].astype(int)
+        for pos, date_meta in zip(np.flatnonzero(has_date.to_numpy()), date_df.to_dict('records')):
+            metadatas[pos].update(date_meta)
+
+    return documents.tolist(), metadatas, ids.tolist()
+
+class PipelinedUploader:
+    """
+    Uploads batches to a ChromaDB collection from a pool of worker threads.
+
+    The producer calls `submit` for each finished batch. Batches wait in a
+    bounded queue, so a producer that runs ahead of the Chroma server blocks
+    instead of piling batches up in memory. Failed batches are retried with
+    exponential backoff and jitter.
+    """
+
+    def __init__(self, collection, workers=UPLOAD_WORKERS, queue_size=None,
+                 max_retries=UPLOAD_MAX_RETRIES, backoff=UPLOAD_BACKOFF_SECONDS, method='add'):
+        self.collection = collection
+        self.method = method
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=queue_size or workers * 2)
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._docs_uploaded = 0
+        self._failed_batches = 0
+        self._failed_docs = 0
+        self._retries = 0
+        self._producer_wait = 0.0
+        self._start = time.perf_counter()
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"chroma-upload-{n}", daemon=True)
+            for n in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, documents, metadatas, ids):
+        """Queues one batch, blocking while the queue is full."""
+        wait_start = time.perf_counter()
+        self._queue.put((documents, metadatas, ids))
+        self._producer_wait += time.perf_counter() - wait_start
+
+    def _upload(self, documents, metadatas, ids):
+        wait_time = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                getattr(self.collection, self.method)(documents=documents, metadatas=metadatas, ids=ids)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"Batch of {len(ids)} documents failed after {attempt + 1} attempts: {e}")
+                    return False
+                delay = wait_time * (0.5 + random.random())
+                print(f"Batch upload failed ({e}). Retrying in {delay:.1f}s... ({attempt + 1}/{self.max_retries})")
+                with self._lock:
+                    self._retries += 1
+                time.sleep(delay)
+                wait_time *= 2
+
+    def _worker(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                self._queue.task_done()
+                return
+            start = time.perf_counter()
+            ok = self._upload(*batch)
+            latency = time.perf_counter() - start
+            with self._lock:
+                if ok:
+                    self._latencies.append(latency)
+                    self._docs_uploaded += len(batch[2])
+                else:
+                    self._failed_batches += 1
+                    self._failed_docs += len(batch[2])
+            self._queue.task_done()
+
+    def close(self):
+        """Waits for all queued batches to finish and returns the summary."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        summary = self.summary()
+        self.print_summary(summary)
+        return summary
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            elapsed = time.perf_counter() - self._start
+            def pct(p):
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+            return {
+                'workers': len(self._workers),
+                'batches_uploaded': len(latencies),
+                'documents_uploaded': self._docs_uploaded,
+                'failed_batches': self._failed_batches,
+                'failed_documents': self._failed_docs,
+                'retries': self._retries,
+                'elapsed_seconds': elapsed,
+                'documents_per_second': self._docs_uploaded / elapsed if elapsed > 0 else 0.0,
+                'latency_mean': sum(latencies) / len(latencies) if latencies else 0.0,
+                'latency_p50': pct(0.50),
+                'latency_p95': pct(0.95),
+                'latency_max': latencies[-1] if latencies else 0.0,
+                'producer_wait_seconds': self._producer_wait,
+            }
+
+    @staticmethod
+    def print_summary(summary):
+        print("--- Upload summary ---")
+        print(
+            f"{summary['documents_uploaded']} documents in {summary['batches_uploaded']} batches "
+            f"with {summary['workers']} workers, {summary['elapsed_seconds']:.1f}s "
+            f"({summary['documents_per_second']:,.0f} docs/sec)."
+        )
+        print(
+            f"Batch latency: mean {summary['latency_mean']:.2f}s, p50 {summary['latency_p50']:.2f}s, "
+            f"p95 {summary['latency_p95']:.2f}s, max {summary['latency_max']:.2f}s."
+        )
+        print(
+            f"Retries: {summary['retries']}. Failed: {summary['failed_batches']} batches "
+            f"({summary['failed_documents']} documents). Producer blocked on a full queue for "
+            f"{summary['producer_wait_seconds']:.1f}s."
+        )
+
+def iter_clean_chunks(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Yields (chunk, is_3d_data, rows_read) for a CSV, dropping rows that are
+    missing any of the required columns.
+    """
+    for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+        rows_read = len(chunk)
+        is_3d_data = 'depth' in chunk.columns
+
+        required_cols = ['TIME', 'latitude', 'longitude', 'avg_temperature', 'avg_salinity']
+        if is_3d_data:
+            required_cols.append('depth')
+        yield chunk.dropna(subset=required_cols), is_3d_data, rows_read
+
+# --- Profile compaction for 3D data ---
+
+def _profile_keys(df):
+    """Identifies a profile: one grid cell on one date."""
+    if 'grid_id' in df.columns:
+        grid = df['grid_id'].astype(str)
+    else:
+        grid = df['latitude'].astype(float).astype(str) + "_" + df['longitude'].astype(float).astype(str)
+    return grid + "|" + df['TIME'].astype(str)
+
+def regroup_profile_chunks(chunks):
+    """
+    Wraps `iter_clean_chunks` so that every depth level of a profile lands in
+    the same chunk. The rows of the last profile in each 3D chunk are held
+    back and prepended to the next chunk. Assumes, like our gridded exports,
+    that the levels of a profile are stored next to each other.
+    """
+    carry = None
+    for chunk, is_3d_data, rows_read in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+            carry = None
+        if is_3d_data and not chunk.empty:
+            keys = _profile_keys(chunk)
+            tail = (keys == keys.iloc[-1]).to_numpy()
+            carry = chunk[tail]
+            chunk = chunk[~tail]
+        yield chunk, is_3d_data, rows_read
+    if carry is not None:
+        yield carry, True, 0
+
+def build_profile_records(df, source_file):
+    """
+    Folds the depth levels of each (grid cell, date) in a 3D chunk into a
+    single profile document. Per-depth values go into `temperature_<d>m` and
+    `salinity_<d>m` metadata, `has_level_<d>m` marks each depth the profile
+    covers, and `depth_min`/`depth_max` record the covered range, so depth
+    filters can still be applied to the compacted documents.
+
+    Returns:
+        tuple: (documents, metadatas, ids) lists ready for `collection.add`.
+    """
+    time_str = df['TIME'].astype(str)
+    parsed_time = pd.to_datetime(time_str, format='%Y-%m-%d', errors='coerce')
+    time_formatted = parsed_time.dt.strftime('%Y-%m-%d').where(parsed_time.notna(), time_str)
+
+    work = pd.DataFrame({
+        'key': _profile_keys(df),
+        'grid_id': df['grid_id'].astype(str) if 'grid_id' in df.columns else _profile_keys(df).str.split('|').str[0],
+        'time': time_formatted,
+        'parsed_time': parsed_time,
+        'depth': df['depth'].astype(int),
+        'latitude': df['latitude'].astype(float),
+        'longitude': df['longitude'].astype(float),
+        'temperature': df['avg_temperature'].astype(float),
+        'salinity': df['avg_salinity'].astype(float),
+        'float_ids': (
+            df['argo_float_ids'].astype(str).str.findall(r'np\.int64\((\d+)\)').str.join(', ')
+            if 'argo_float_ids' in df.columns else extract_float_ids('[np.int64(0)]')
+        ),
+    }).sort_values(['key', 'depth'], kind='stable')
+
+    work['segment'] = (
+        work['depth'].astype(str) + " m: " + _format_2f(work['temperature']) + "°C, "
+        + _format_2f(work['salinity']) + " PSU"
+    )
+    grouped = work.groupby('key', sort=False)
+    profiles = grouped.first()
+    levels = grouped['segment'].agg('; '.join)
+    n_levels = grouped.size()
+
+    documents = (
+        "An Argo profile at " + _format_2f(profiles['latitude']) + "N, " + _format_2f(profiles['longitude'])
+        + "E on " + profiles['time'] + " measured average temperature and salinity at "
+        + n_levels.astype(str) + " depths: " + levels + "."
+    )
+
+    meta_df = pd.DataFrame({
+        'source_file': source_file,
+        'doc_type': 'profile',
+        'grid_id': profiles['grid_id'],
+        'profile_key': profiles.index.to_series(),
+        'float_ids': profiles['float_ids'],
+        'latitude': profiles['latitude'],
+        'longitude': profiles['longitude'],
+        # The shallowest level stands in for the profile in plain temperature/salinity
+        # filters; a filter that pins the depth is rewritten to the per-depth keys.
+        'temperature': profiles['temperature'],
+        'salinity': profiles['salinity'],
+        'depth_min': grouped['depth'].min(),
+        'depth_max': grouped['depth'].max(),
+        'n_levels': n_levels,
+    })
+    has_date = profiles['parsed_time'].notna()
+    meta_df['year'] = profiles['parsed_time'].dt.year
+    meta_df['month'] = profiles['parsed_time'].dt.month
+    meta_df['day'] = profiles['parsed_time'].dt.day
+
+    per_depth = work.pivot_table(index='key', columns='depth', values=['temperature', 'salinity'], aggfunc='first')
+    for variable, depth in per_depth.columns:
+        meta_df[f"{variable}_{depth}m"] = per_depth[(variable, depth)].reindex(meta_df.index)
+    levels_present = pd.crosstab(work['key'], work['depth']).reindex(meta_df.index, fill_value=0) > 0
+    level_flags = [f"has_level_{depth}m" for depth in levels_present.columns]
+    for depth, flag in zip(levels_present.columns, level_flags):
+        meta_df[flag] = levels_present[depth]
+
+    metadatas = []
+    for record, dated in zip(meta_df.to_dict('records'), has_date.to_numpy()):
+        clean = {k: v for k, v in record.items() if not (isinstance(v, float) and np.isnan(v))}
+        for flag in level_flags:
+            # Only the levels the profile covers get a flag.
+            if clean.pop(flag):
+                clean[flag] = True
+        if dated:
+            for field in ('year', 'month', 'day'):
+                clean[field] = int(clean[field])
+        else:
+            for field in ('year', 'month', 'day'):
+                clean.pop(field, None)
+        metadatas.append(clean)
+
+    ids = ("profile-" + profiles['grid_id'] + "-" + profiles['time']).tolist()
+    return documents.tolist(), metadatas, ids
+
+def stream_and_ingest_data(data_directory, collection, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE,
+                           workers=UPLOAD_WORKERS, queue_size=None, compact_3d=False):
+    """
+    Chunked ingestion mode. Reads each CSV in bounded chunks, builds the
+    documents column-wise and hands every finished batch to a
+    `PipelinedUploader`, so the next chunk is prepared while earlier batches
+    are embedded and uploaded, and memory use does not grow with file size.
+    With `compact_3d`, 3D files produce one document per profile instead of
+    one per depth level.
+    """
+    file_paths = glob.glob(os.path.join(data_directory, '*.csv'))
+    if not file_paths:
+        print(f"No CSV files found in '{data_directory}'. Please check the path.")
+        return
+
+    print(f"Found {len(file_paths)} data files. Starting chunked data ingestion...")
+    uploader = PipelinedUploader(collection, workers=workers, queue_size=queue_size)
+    total_docs = 0
+
+    for file_path in file_paths:
+        print(f"Processing file: {file_path}")
+        source_file = os.path.basename(file_path)
+        file_rows = 0
+        file_docs = 0
+        start = time.perf_counter()
+        try:
+            chunks = iter_clean_chunks(file_path, chunk_size)
+            if compact_3d:
+                chunks = regroup_profile_chunks(chunks)
+            for chunk, is_3d_data, rows_read in chunks:
+                file_rows += rows_read
+                if chunk.empty:
+                    continue
+
+                if compact_3d and is_3d_data:
+                    documents, metadatas, ids = build_profile_records(chunk, source_file)
+                else:
+                    documents, metadatas, ids = build_chunk_records(chunk, source_file, is_3d_data)
+                for i in range(0, len(documents), batch_size):
+                    uploader.submit(documents[i:i + batch_size], metadatas[i:i + batch_size], ids[i:i + batch_size])
+                file_docs += len(documents)
+
+        except Exception as e:
+            print(f"Error processing file {file_path}: {e}. Skipping the rest of this file.")
+
+        elapsed = time.perf_counter() - start
+        rate = file_rows / elapsed if elapsed > 0 else 0.0
+        if file_docs == 0:
+            print(f"Warning: No valid data found in {file_path}.")
+        print(
+            f"Finished {source_file}: {file_rows} rows read, {file_docs} documents queued "
+            f"in {elapsed:.1f}s ({rate:,.0f} rows/sec)."
+        )
+        total_docs += file_docs
+
+    uploader.close()
+    print(f"Data ingestion complete. {total_docs} documents processed.")
+
+# --- Incremental (delta) ingestion ---
+
+def load_manifest(path=MANIFEST_PATH):
+    """
+    Returns the incremental-ingestion manifest, or None when there is no
+    usable manifest (first run, or one written with a different ID scheme).
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read manifest {path}: {e}")
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        print(f"Manifest {path} uses an old format and will be rebuilt.")
+        return None
+    return manifest
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Writes the manifest atomically so an interrupted run never corrupts it."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def reset_manifest(path=MANIFEST_PATH):
+    """
+    Deletes the manifest. Called whenever a non-incremental rebuild drops the
+    collection, so the next incremental run does not trust file states that
+    describe documents (and IDs) which no longer exist.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+        print(f"Removed incremental manifest {path}; the next incremental run rebuilds with stable IDs.")
+
+def file_sha256(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def stable_row_ids(df, source_file, is_3d_data, key_counts):
+    """
+    Builds IDs from what a row *is* (file, grid cell, date and depth) rather
+    than where it sits in the file, so they survive appends and reordering.
+    A repeated key gets a '#n' suffix; `key_counts` carries the number of
+    times each key has been seen across the chunks of one file.
+    """
+    if 'grid_id' in df.columns:
+        grid = df['grid_id'].astype(str)
+    else:
+        grid = df['latitude'].astype(float).astype(str) + "_" + df['longitude'].astype(float).astype(str)
+    keys = os.path.splitext(source_file)[0] + ":" + grid + ":" + df['TIME'].astype(str)
+    if is_3d_data:
+        keys = keys + ":" + df['depth'].astype(int).astype(str)
+
+    occurrence = keys.groupby(keys, sort=False).cumcount() + keys.map(key_counts.get).fillna(0).astype(int)
+    for key, count in keys.value_counts().items():
+        key_counts[key] = key_counts.get(key, 0) + count
+    return keys.where(occurrence == 0, keys + "#" + occurrence.astype(str))
+
+def row_content_hashes(df, is_3d_data):
+    """Hashes the columns that end up in a row's document or metadata."""
+    columns = ['TIME', 'latitude', 'longitude', 'avg_temperature', 'avg_salinity']
+    if 'argo_float_ids' in df.columns:
+        columns.append('argo_float_ids')
+    if is_3d_data:
+        columns.append('depth')
+    return pd.util.hash_pandas_object(df[columns], index=False).astype(str)
+
+def incremental_ingest_data(data_directory, collection, manifest, manifest_path=MANIFEST_PATH,
+                            chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, workers=UPLOAD_WORKERS, queue_size=None):
+    """
+    Delta ingestion mode. Files whose checksum matches the manifest are
+    skipped outright. For changed files, only rows whose content hash is new
+    or different are upserted, and rows that disappeared are deleted. The
+    collection stays queryable the whole time.
+    """
+    file_paths = glob.glob(os.path.join(data_directory, '*.csv'))
+    files_state = manifest.setdefault('files', {})
+    print(f"Found {len(file_paths)} data files. Starting incremental ingestion...")
+
+    start = time.perf_counter()
+    uploader = PipelinedUploader(collection, workers=workers, queue_size=queue_size, method='upsert')
+    stale_ids = []
+    totals = {'skipped_files': 0, 'changed_files': 0, 'upserted': 0, 'unchanged_rows': 0}
+
+    for file_path in file_paths:
+        source_file = os.path.basename(file_path)
+        checksum = file_sha256(file_path)
+        previous = files_state.get(source_file)
+        if previous and previous.get('sha256') == checksum:
+            totals['skipped_files'] += 1
+            continue
+
+        print(f"Processing changed file: {file_path}")
+        old_rows = previous['rows'] if previous else {}
+        old_hashes = pd.Series(old_rows, dtype=object)
+        new_rows = {}
+        key_counts = {}
+        file_upserts = 0
+        try:
+            for chunk, is_3d_data, _ in iter_clean_chunks(file_path, chunk_size):
+                if chunk.empty:
+                    continue
+                ids = stable_row_ids(chunk, source_file, is_3d_data, key_counts)
+                hashes = row_content_hashes(chunk, is_3d_data)
+                new_rows.update(zip(ids.tolist(), hashes.tolist()))
+
+                changed = (ids.map(old_hashes) != hashes).to_numpy()
+                if not changed.any():
+                    continue
+                changed_chunk = chunk[changed]
+                documents, metadatas, _ = build_chunk_records(changed_chunk, source_file, is_3d_data)
+                changed_ids = ids[changed].tolist()
+                for i in range(0, len(documents), batch_size):
+                    uploader.submit(documents[i:i + batch_size], metadatas[i:i + batch_size], changed_ids[i:i + batch_size])
+                file_upserts += len(documents)
+        except Exception as e:
+            # Leave this file's manifest entry untouched so the next run retries it.
+            print(f"Error processing file {file_path}: {e}. Skipping.")
+            continue
+
+        removed = [doc_id for doc_id in old_rows if doc_id not in new_rows]
+        stale_ids.extend(removed)
+        files_state[source_file] = {'sha256': checksum, 'rows': new_rows}
+        totals['changed_files'] += 1
+        totals['upserted'] += file_upserts
+        totals['unchanged_rows'] += len(new_rows) - file_upserts
+        print(f"{source_file}: {file_upserts} new or changed rows, {len(removed)} removed rows.")
+
+    # Files that no longer exist lose all of their documents.
+    present = {os.path.basename(p) for p in file_paths}
+    for source_file in [name for name in files_state if name not in present]:
+        print(f"{source_file} no longer exists; removing its documents.")
+        stale_ids.extend(files_state.pop(source_file)['rows'])
+
+    summary = uploader.close()
+    for i in range(0, len(stale_ids), batch_size):
+        collection.delete(ids=stale_ids[i:i + batch_size])
+
+    if summary['failed_batches']:
+        print("Some batches failed; the manifest was not updated so they are retried next run.")
+    else:
+        save_manifest(manifest, manifest_path)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Incremental ingestion complete in {elapsed:.1f}s: {totals['skipped_files']} unchanged files skipped, "
+        f"{totals['changed_files']} files updated, {totals['upserted']} rows upserted, "
+        f"{totals['unchanged_rows']} rows unchanged, {len(stale_ids)} rows deleted."
+    )
+
+def _result_profile_key(document, metadata):
+    """Maps a query result from either mode onto the profile it belongs to."""
+    if metadata.get('profile_key'):
+        return metadata['profile_key']
+    match = re.search(r" on (\S+)\.$", document)
+    grid = f"{float(metadata['latitude'])}_{float(metadata['longitude'])}"
+    return f"{grid}|{match.group(1) if match else ''}"
+
+def compare_compaction(data_directory, k=10, repeats=5, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE,
+                       workers=UPLOAD_WORKERS, keep=False):
+    """
+    Ingests the data twice, once per depth level and once as compacted
+    profiles, then runs `COMPARISON_QUERIES` against both collections and
+    prints vector counts, ingest time, median query latency and how many of
+    the profiles found in uncompacted mode the compacted mode also returns.
+    """
+    collections = {}
+    for label, compact in (('uncompacted', False), ('compacted', True)):
+        name = f"{COLLECTION_NAME}_cmp_{label}"
+        try:
+            client.delete_collection(name=name)
+        except Exception:
+            pass
+        collection = client.get_or_create_collection(name=name)
+        print(f"\n=== Ingesting {label} collection '{name}' ===")
+        start = time.perf_counter()
+        stream_and_ingest_data(data_directory, collection, chunk_size=chunk_size, batch_size=batch_size,
+                               workers=workers, compact_3d=compact)
+        collections[label] = (collection, time.perf_counter() - start)
+
+    print("\n=== Compaction comparison ===")
+    for label, (collection, ingest_seconds) in collections.items():
+        print(f"{label:>12}: {collection.count()} vectors, ingested in {ingest_seconds:.1f}s")
+
+    for text, full_where, compact_where in COMPARISON_QUERIES:
+        results = {}
+        for label, where in (('uncompacted', full_where), ('compacted', compact_where)):
+            collection = collections[label][0]
+            latencies = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                res = collection.query(query_texts=[text], n_results=k, where=where or None,
+                                       include=['documents', 'metadatas'])
+                latencies.append(time.perf_counter() - start)
+            profiles = {
+                _result_profile_key(doc, meta)
+                for doc, meta in zip(res['documents'][0], res['metadatas'][0])
+            }
+            results[label] = (sorted(latencies)[len(latencies) // 2], profiles)
+
+        full_profiles = results['uncompacted'][1]
+        compact_profiles = results['compacted'][1]
+        overlap = len(full_profiles & compact_profiles) / len(full_profiles) if full_profiles else 0.0
+        print(f"\nQuery: {text!r}")
+        for label, (latency, profiles) in results.items():
+            print(f"{label:>12}: median {latency * 1000:.1f} ms, {len(profiles)} distinct profiles in top {k}")
+        print(f"{'overlap':>12}: {overlap:.0%} of the uncompacted profiles are also returned by compacted mode")
+
+    if not keep:
+        for label in collections:
+            client.delete_collection(name=f"{COLLECTION_NAME}_cmp_{label}")
+
+def bump_dataset_version(collection):
+    """
+    Stores a fresh dataset version token in the collection metadata. The API
+    compares cached answers and results against it, so every ingestion run
+    invalidates them at once.
+    """
+    version = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    metadata = dict(collection.metadata or {})
+    metadata[DATASET_VERSION_KEY] = version
+    # hnsw:* settings can't be passed to modify(); they are fixed at creation.
+    metadata = {k: v for k, v in metadata.items() if not k.startswith('hnsw:')}
+    collection.modify(metadata=metadata)
+    print(f"Dataset version set to {version}.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest gridded Argo CSV exports into ChromaDB.")
+    parser.add_argument('--mode', choices=['chunked', 'incremental', 'legacy', 'compare-compaction'], default='chunked',
+                        help="'chunked' rebuilds the collection from bounded chunks (default); "
+                             "'incremental' applies only the changes since the last incremental run; "
+                             "'legacy' rebuilds row by row; "
+                             "'compare-compaction' benchmarks retrieval with and without --compact-3d.")
+    parser.add_argument('--compact-3d', action='store_true',
+                        help="Store one document per 3D profile instead of one per depth level (chunked mode).")
+    parser.add_argument('--manifest', default=MANIFEST_PATH,
+                        help="Manifest file used by incremental mode.")
+    parser.add_argument('--data-dir', default=ARGO_DATA_DIR)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=UPLOAD_WORKERS,
+                        help="Number of concurrent upload workers (chunked mode).")
+    parser.add_argument('--queue-size', type=int, default=None,
+                        help="Maximum batches waiting for upload; defaults to 2x workers.")
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'),
+                        help="PostgreSQL URL used to refresh the float membership table after "
+                             "ingesting (default: $DATABASE_URL; skipped when unset).")
+    return parser.parse_args()
+
+def refresh_float_index(database_url):
+    """
+    Rebuilds the float membership table (see build_float_index.py) if the
+    surface table changed since it was built. Runs before the dataset
+    version is bumped, so the new version also covers the rebuilt table.
+    """
+    if not database_url:
+        print("DATABASE_URL not set; skipping the float membership table.")
+        return
+    from build_float_index import build_float_index
+    build_float_index(database_url)
+
 if __name__ == "__main__":
-    collection = client.get_or_create_collection(name=COLLECTION_NAME)
-    client.delete_collection(name=COLLECTION_NAME)
-    collection = client.get_or_create_collection(name=COLLECTION_NAME)
-    process_and_ingest_data(ARGO_DATA_DIR, collection)
+    args = parse_args()
+    if args.mode == 'compare-compaction':
+        compare_compaction(args.data_dir, chunk_size=args.chunk_size, batch_size=args.batch_size,
+                           workers=args.workers)
+    elif args.mode == 'incremental':
+        if args.compact_3d:
+            print("--compact-3d is only supported in chunked mode; ingesting per-depth documents.")
+        manifest = load_manifest(args.manifest)
+        collection = client.get_or_create_collection(name=COLLECTION_NAME)
+        if manifest is None:
+            # Without a manifest we cannot tell which documents use the stable
+            # ID scheme, so the first incremental run starts from scratch.
+            print("No incremental manifest found; rebuilding the collection with stable IDs.")
+            client.delete_collection(name=COLLECTION_NAME)
+            collection = client.get_or_create_collection(name=COLLECTION_NAME)
+            manifest = {'version': MANIFEST_VERSION, 'files': {}}
+        incremental_ingest_data(
+            args.data_dir, collection, manifest, manifest_path=args.manifest,
+            chunk_size=args.chunk_size, batch_size=args.batch_size,
+            workers=args.workers, queue_size=args.queue_size
+        )
+        refresh_float_index(args.database_url)
+        bump_dataset_version(collection)
+    else:
+        collection = client.get_or_create_collection(name=COLLECTION_NAME)
+        client.delete_collection(name=COLLECTION_NAME)
+        collection = client.get_or_create_collection(name=COLLECTION_NAME)
+        reset_manifest(args.manifest)
+        if args.mode == 'legacy':
+            process_and_ingest_data(args.data_dir, collection)
+        else:
+            stream_and_ingest_data(
+                args.data_dir, collection,
+                chunk_size=args.chunk_size, batch_size=args.batch_size,
+                workers=args.workers, queue_size=args.queue_size, compact_3d=args.compact_3d
+            )
+        refresh_float_index(args.database_url)
+        bump_dataset_version(collection)